@@ -0,0 +1,141 @@
+"""Lighting backend selection and the simulated (recording) backend."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from lightspeed.colors import RGB, LightingBackend, PatternFrame, PatternHandoff, clamp_channel, run_pattern
+from lightspeed.config import ConfigProfile, DeviceProfile
+from lightspeed.metrics import Timing
+
+logger = logging.getLogger(__name__)
+
+DeviceWrite = Tuple[int, RGB]
+
+
+class SimulatedLightingController:
+    """Backend without hardware: records every device write with a monotonic timestamp.
+
+    Mirrors ``LightingController``'s lifecycle and pattern semantics so it can
+    stand in for the Logitech SDK on other platforms, in tests and in load runs.
+    """
+
+    def __init__(self, name: str = "simulated", *, max_writes: Optional[int] = 100_000) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.pattern_thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self._handoff: Optional[PatternHandoff] = None
+        # Timings optionnels (voir MqttLightingService) : durée d'une écriture, retard des frames
+        self.write_timing: Optional[Timing] = None
+        self.frame_jitter: Optional[Timing] = None
+        self.initialized = False
+        self.released = False
+        self.max_writes = max_writes
+        self.writes: List[DeviceWrite] = []
+        self.write_count = 0
+        # (index, nombre de frames) du pattern en cours
+        self.frame_position: Optional[Tuple[int, int]] = None
+        # Appelé après chaque écriture (trace de rejeu)
+        self.on_write: Optional[Callable[[RGB], None]] = None
+
+    def start(self) -> None:
+        self.initialized = True
+        self.released = False
+
+    def shutdown(self) -> None:
+        self.stop_pattern()
+        self.initialized = False
+        self.released = False
+
+    def release(self) -> None:
+        self.stop_pattern()
+        self.released = True
+        self.initialized = False
+
+    def _set_color_now(self, rgb: RGB) -> None:
+        color = tuple(clamp_channel(channel) for channel in rgb)
+        started = time.perf_counter()
+        with self.lock:
+            self.write_count += 1
+            self.writes.append((time.monotonic_ns(), color))  # type: ignore[arg-type]
+            if self.max_writes is not None and len(self.writes) > self.max_writes:
+                del self.writes[: len(self.writes) - self.max_writes]
+        if self.write_timing is not None:
+            self.write_timing.observe(time.perf_counter() - started)
+        if self.on_write is not None:
+            self.on_write(color)  # type: ignore[arg-type]
+
+    def set_static_color(self, rgb: RGB) -> None:
+        self.start()
+        self.stop_pattern()
+        self._set_color_now(rgb)
+
+    def start_pattern(
+        self,
+        frames: Sequence[PatternFrame],
+        *,
+        on_first_frame: Optional[Callable[[], None]] = None,
+        start_offset: float = 0.0,
+    ) -> None:
+        if not frames:
+            raise ValueError("Aucun frame fourni pour le pattern")
+        self.start()
+        handoff = self._handoff
+        if handoff is not None and self.pattern_thread is not None and self.pattern_thread.is_alive():
+            # Même thread de pattern : le nouvel effet enchaîne sans arrêt ni redémarrage
+            if handoff.offer(frames, on_first_frame=on_first_frame, start_offset=start_offset):
+                return
+        self.stop_pattern()
+        self.stop_event = threading.Event()
+        palette = list(frames)
+        stop_event = self.stop_event
+        handoff = self._handoff = PatternHandoff(stop_event, palette)
+
+        def write_frame(index: int, color: RGB) -> None:
+            self._set_color_now(color)
+            self.frame_position = (index, len(handoff.frames))
+
+        def worker() -> None:
+            run_pattern(
+                palette,
+                write_frame,
+                stop_event,
+                on_first_frame=on_first_frame,
+                start_offset=start_offset,
+                handoff=handoff,
+                on_jitter=None if self.frame_jitter is None else self.frame_jitter.observe,
+            )
+
+        self.pattern_thread = threading.Thread(target=worker, daemon=True, name=f"pattern-{self.name}")
+        self.pattern_thread.start()
+
+    def stop_pattern(self) -> None:
+        if self.pattern_thread and self.pattern_thread.is_alive():
+            if self._handoff is not None:
+                self._handoff.close()
+            self.stop_event.set()
+            self.pattern_thread.join()
+        self.pattern_thread = None
+        self._handoff = None
+        self.frame_position = None
+
+    def colors(self) -> List[RGB]:
+        """Return the recorded colors without timestamps."""
+        with self.lock:
+            return [color for _, color in self.writes]
+
+
+def create_controller(device: DeviceProfile, profile: ConfigProfile) -> LightingBackend:
+    """Instantiate the backend configured for ``device``."""
+    if device.backend == "simulated":
+        return SimulatedLightingController(device.name)
+    from lightspeed.lighting import LightingController  # Local import to defer logipy/DLL load
+
+    return LightingController(
+        profile.logitech.dll_path,
+        lock_file=device.lighting.lock_file,
+        target=device.target,
+    )
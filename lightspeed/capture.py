@@ -0,0 +1,159 @@
+"""Append-only capture of incoming commands, and paced replay.
+
+A capture file starts with :data:`MAGIC` followed by one record per command::
+
+    !QBHI header: monotonic ns, flags, topic length, payload length
+    topic bytes (UTF-8), payload bytes
+
+``flags`` bit 0 marks a payload announced with the binary content type.
+Recording a new session appends to an existing file; monotonic timestamps
+restart with the process, so :func:`replay` re-anchors its timeline whenever
+a timestamp goes backwards.
+"""
+from __future__ import annotations
+
+import logging
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from lightspeed.codec import BINARY_CONTENT_TYPE
+from lightspeed.ipc import LocalMessage
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LSCAP\x01"
+FLAG_BINARY = 0x01
+_RECORD = struct.Struct("!QBHI")
+# Au plus une seconde de commandes perdue si le processus est tué
+FLUSH_INTERVAL_SECONDS = 1.0
+
+
+class CaptureError(ValueError):
+    """Raised when a file is not a command capture."""
+
+
+@dataclass(frozen=True)
+class CapturedCommand:
+    timestamp_ns: int
+    topic: str
+    payload: bytes
+    binary: bool = False
+
+    def to_message(self) -> LocalMessage:
+        """Message ready for ``MqttLightingService.handle_message``."""
+        properties = None
+        if self.binary:
+            properties = Properties(PacketTypes.PUBLISH)
+            properties.ContentType = BINARY_CONTENT_TYPE
+        return LocalMessage(topic=self.topic, payload=self.payload, properties=properties)
+
+
+def encode_record(command: CapturedCommand) -> bytes:
+    topic = command.topic.encode("utf-8")
+    flags = FLAG_BINARY if command.binary else 0
+    return _RECORD.pack(command.timestamp_ns, flags, len(topic), len(command.payload)) + topic + command.payload
+
+
+class CommandRecorder:
+    """Appends every received command to ``path``; safe to share between devices and threads."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file: Optional[BinaryIO] = self.path.open("ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._flushed_at = time.monotonic()
+        self.count = 0
+
+    def record(self, message, *, timestamp_ns: Optional[int] = None) -> None:
+        properties = getattr(message, "properties", None)
+        command = CapturedCommand(
+            timestamp_ns=time.monotonic_ns() if timestamp_ns is None else timestamp_ns,
+            topic=message.topic,
+            payload=bytes(message.payload),
+            binary=getattr(properties, "ContentType", None) == BINARY_CONTENT_TYPE,
+        )
+        data = encode_record(command)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(data)
+            self.count += 1
+            now = time.monotonic()
+            if now - self._flushed_at >= FLUSH_INTERVAL_SECONDS:
+                self._file.flush()
+                self._flushed_at = now
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+        logger.info("Capture des commandes fermée", extra={"path": str(self.path), "commands": self.count})
+
+
+def read_capture(path: Path | str) -> Iterator[CapturedCommand]:
+    """Yield the recorded commands in file order; a record cut short by a crash ends the capture."""
+    with Path(path).expanduser().open("rb") as handle:
+        if handle.read(len(MAGIC)) != MAGIC:
+            raise CaptureError(f"{path} n'est pas une capture de commandes")
+        while True:
+            header = handle.read(_RECORD.size)
+            if not header:
+                return
+            if len(header) < _RECORD.size:
+                logger.warning("Capture tronquée, dernier enregistrement ignoré", extra={"path": str(path)})
+                return
+            timestamp_ns, flags, topic_length, payload_length = _RECORD.unpack(header)
+            body = handle.read(topic_length + payload_length)
+            if len(body) < topic_length + payload_length:
+                logger.warning("Capture tronquée, dernier enregistrement ignoré", extra={"path": str(path)})
+                return
+            yield CapturedCommand(
+                timestamp_ns=timestamp_ns,
+                topic=body[:topic_length].decode("utf-8"),
+                payload=body[topic_length:],
+                binary=bool(flags & FLAG_BINARY),
+            )
+
+
+def replay(
+    commands: Iterable[CapturedCommand],
+    submit: Callable[[CapturedCommand], None],
+    *,
+    speed: Optional[float] = 1.0,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> int:
+    """Feed ``commands`` to ``submit`` keeping their spacing divided by ``speed``.
+
+    ``speed=None`` replays as fast as possible. Deadlines are absolute, so a
+    slow ``submit`` does not accumulate drift. Returns the number of commands fed.
+    """
+    count = 0
+    origin_ns: Optional[int] = None
+    previous_ns = 0
+    started = clock()
+    for command in commands:
+        if speed is not None:
+            if origin_ns is None or command.timestamp_ns < previous_ns:
+                # Nouvelle session dans la capture : l'horloge monotone a été remise à zéro
+                origin_ns = command.timestamp_ns
+                started = clock()
+            delay = started + (command.timestamp_ns - origin_ns) / 1e9 / speed - clock()
+            if delay > 0:
+                sleep(delay)
+            previous_ns = command.timestamp_ns
+        submit(command)
+        count += 1
+    return count
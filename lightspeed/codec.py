@@ -0,0 +1,100 @@
+"""Compact binary light commands for high-rate producers.
+
+Every frame starts with a one-byte opcode followed by a fixed-layout body:
+
+========  ======  ==============================================
+Opcode    Size    Body
+========  ======  ==============================================
+``0x01``  4       ``R G B`` (color only)
+``0x02``  2       ``brightness`` (0-255)
+``0x03``  6       ``flags R G B brightness`` (combined set)
+========  ======  ==============================================
+
+``flags`` for the combined set: bit 0 = state present, bit 1 = state on,
+bit 2 = color present, bit 3 = brightness present. Frames are decoded
+straight from the MQTT payload bytes, without any text decoding.
+"""
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+RGB = Tuple[int, int, int]
+
+BINARY_CONTENT_TYPE = "application/vnd.lightspeed.command"
+
+OP_RGB = 0x01
+OP_BRIGHTNESS = 0x02
+OP_SET = 0x03
+
+FLAG_STATE = 0x01
+FLAG_ON = 0x02
+FLAG_RGB = 0x04
+FLAG_BRIGHTNESS = 0x08
+
+_RGB = struct.Struct("!BBBB")
+_BRIGHTNESS = struct.Struct("!BB")
+_SET = struct.Struct("!BBBBBB")
+
+
+class CodecError(ValueError):
+    """Raised when a binary command frame is malformed."""
+
+
+@dataclass(frozen=True)
+class LightCommand:
+    """Light change applied atomically; ``None`` fields keep the current value.
+
+    ``effect`` (alert/warning/info) is only carried by JSON-schema commands.
+    """
+
+    on: Optional[bool] = None
+    rgb: Optional[RGB] = None
+    brightness: Optional[int] = None
+    effect: Optional[str] = None
+
+
+def decode_command(payload: bytes) -> LightCommand:
+    """Decode one binary frame from raw payload bytes."""
+    if not payload:
+        raise CodecError("Trame binaire vide")
+    opcode = payload[0]
+    try:
+        if opcode == OP_RGB:
+            _, r, g, b = _RGB.unpack(payload)
+            return LightCommand(rgb=(r, g, b))
+        if opcode == OP_BRIGHTNESS:
+            _, brightness = _BRIGHTNESS.unpack(payload)
+            return LightCommand(brightness=brightness)
+        if opcode == OP_SET:
+            _, flags, r, g, b, brightness = _SET.unpack(payload)
+            return LightCommand(
+                on=bool(flags & FLAG_ON) if flags & FLAG_STATE else None,
+                rgb=(r, g, b) if flags & FLAG_RGB else None,
+                brightness=brightness if flags & FLAG_BRIGHTNESS else None,
+            )
+    except struct.error as exc:
+        raise CodecError(f"Trame binaire de taille invalide pour l'opcode 0x{opcode:02X}") from exc
+    raise CodecError(f"Opcode binaire inconnu: 0x{opcode:02X}")
+
+
+def encode_rgb(rgb: RGB) -> bytes:
+    return _RGB.pack(OP_RGB, *rgb)
+
+
+def encode_brightness(brightness: int) -> bytes:
+    return _BRIGHTNESS.pack(OP_BRIGHTNESS, brightness)
+
+
+def encode_command(command: LightCommand) -> bytes:
+    """Encode ``command`` as a combined-set frame."""
+    flags = 0
+    if command.on is not None:
+        flags |= FLAG_STATE | (FLAG_ON if command.on else 0)
+    if command.rgb is not None:
+        flags |= FLAG_RGB
+    if command.brightness is not None:
+        flags |= FLAG_BRIGHTNESS
+    r, g, b = command.rgb or (0, 0, 0)
+    return _SET.pack(OP_SET, flags, r, g, b, command.brightness or 0)
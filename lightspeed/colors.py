@@ -0,0 +1,255 @@
+"""Pure color and palette helpers shared by every lighting backend.
+
+Kept free of the Logitech SDK so the MQTT service, simulated backends and
+tooling can use them without loading ``LogitechLed.dll``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Optional, Protocol, Sequence, Tuple
+
+from lightspeed.config import ConfigProfile, PaletteDefinition
+
+RGB = Tuple[int, int, int]
+PatternFrame = Tuple[RGB, float]
+# Durée minimale d'une frame : protège le SDK d'un pattern mal configuré
+MIN_FRAME_SECONDS = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class LightingBackend(Protocol):
+    """Interface shared by ``LightingController`` and the simulated backends."""
+
+    def start(self) -> None: ...
+
+    def shutdown(self) -> None: ...
+
+    def set_static_color(self, rgb: RGB) -> None: ...
+
+    def start_pattern(
+        self,
+        frames: Sequence[PatternFrame],
+        *,
+        on_first_frame: Optional[Callable[[], None]] = None,
+        start_offset: float = 0.0,
+    ) -> None: ...
+
+    def stop_pattern(self) -> None: ...
+
+    def release(self) -> None: ...
+
+
+def clamp_channel(value: int) -> int:
+    return max(0, min(255, int(value)))
+
+
+def to_pct(value: int) -> int:
+    return int(round((clamp_channel(value) / 255) * 100))
+
+
+def apply_brightness(color: RGB, brightness: int) -> RGB:
+    value = max(0, min(255, int(brightness)))
+    if value >= 255:
+        return color
+    ratio = value / 255 if value else 0
+    return tuple(int(channel * ratio) for channel in color)
+
+
+def parse_color_string(value: str) -> RGB:
+    if not value:
+        raise ValueError("Couleur vide")
+    text = value.strip()
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return clamp_channel(data['r']), clamp_channel(data['g']), clamp_channel(data['b'])
+        if isinstance(data, list) and len(data) == 3:
+            r, g, b = data
+            return clamp_channel(r), clamp_channel(g), clamp_channel(b)
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        pass
+
+    if text.startswith('#'):
+        hex_value = text.lstrip('#')
+        if len(hex_value) != 6:
+            raise ValueError('Format hex attendu: #RRGGBB')
+        return tuple(int(hex_value[i:i + 2], 16) for i in (0, 2, 4))  # type: ignore[return-value]
+
+    separators = ',' if ',' in text else ' '
+    parts = [p for p in text.split(separators) if p]
+    if len(parts) == 3:
+        r, g, b = (int(part) for part in parts)
+        return clamp_channel(r), clamp_channel(g), clamp_channel(b)
+
+    raise ValueError("Impossible de lire la couleur (attendu #RRGGBB ou R,G,B)")
+
+
+def frame_seconds(duration: float) -> float:
+    return max(duration, MIN_FRAME_SECONDS)
+
+
+def timeline_position(frames: Sequence[PatternFrame], elapsed: float) -> Tuple[int, float]:
+    """Frame shown ``elapsed`` seconds into a looping pattern, and the time left on it."""
+    period = sum(frame_seconds(duration) for _, duration in frames)
+    position = elapsed % period
+    for index, (_, duration) in enumerate(frames):
+        length = frame_seconds(duration)
+        if position < length:
+            return index, length - position
+        position -= length
+    return 0, frame_seconds(frames[0][1])  # pragma: no cover - float rounding at the period edge
+
+
+class PatternHandoff:
+    """Mailbox through which a running :func:`run_pattern` loop takes over a new pattern.
+
+    :meth:`offer` stores the next pattern and wakes the loop through its stop
+    event; the loop switches to it in the same thread, so there is no join, no
+    new thread and no dark gap between the two patterns. :meth:`close` is the
+    stop request: once the loop has seen it, :meth:`offer` returns ``False``
+    and the backend starts a fresh loop.
+    """
+
+    def __init__(self, stop_event: threading.Event, frames: Sequence[PatternFrame]) -> None:
+        self._stop_event = stop_event
+        self._lock = threading.Lock()
+        self._pending: Optional[Tuple[list, Optional[Callable[[], None]], float]] = None
+        self._closed = False
+        # Pattern joué par la boucle (diagnostic : nombre de frames)
+        self.frames: Sequence[PatternFrame] = frames
+
+    def offer(
+        self,
+        frames: Sequence[PatternFrame],
+        *,
+        on_first_frame: Optional[Callable[[], None]] = None,
+        start_offset: float = 0.0,
+    ) -> bool:
+        with self._lock:
+            if self._closed:
+                return False
+            self._pending = (list(frames), on_first_frame, start_offset)
+            # Sous le verrou : un réveil sans pattern en attente signifie toujours « arrêt »
+            self._stop_event.set()
+            return True
+
+    def close(self) -> None:
+        with self._lock:
+            self._pending = None
+            self._closed = True
+            self._stop_event.set()
+
+    def take(self) -> Optional[Tuple[list, Optional[Callable[[], None]], float]]:
+        """Next pattern for the woken loop, or ``None`` (the loop must exit, later offers are refused)."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if pending is None:
+                self._closed = True
+                return None
+            self._stop_event.clear()
+            self.frames = pending[0]
+            return pending
+
+
+def run_pattern(
+    frames: Sequence[PatternFrame],
+    write_frame: Callable[[int, RGB], None],
+    stop_event: threading.Event,
+    *,
+    on_first_frame: Optional[Callable[[], None]] = None,
+    start_offset: float = 0.0,
+    handoff: Optional[PatternHandoff] = None,
+    on_jitter: Optional[Callable[[float], None]] = None,
+) -> None:
+    """Loop over ``frames`` until ``stop_event`` is set (body of a backend's pattern thread).
+
+    ``start_offset`` places the pattern on a shared timeline: negative waits
+    before the first frame, positive starts mid-pattern (late joiner). Frame
+    deadlines are absolute, so write time does not accumulate as drift. With a
+    ``handoff``, a wake-up carrying a new pattern switches to it immediately
+    instead of returning. ``on_jitter`` receives how late each frame after the
+    first was written relative to its deadline, in seconds.
+    """
+    pattern: Optional[Tuple[list, Optional[Callable[[], None]], float]] = (list(frames), on_first_frame, start_offset)
+    while pattern is not None:
+        _play_pattern(*pattern, write_frame, stop_event, on_jitter)
+        if handoff is None:
+            return
+        pattern = handoff.take()
+
+
+def _play_pattern(
+    palette: list,
+    on_first_frame: Optional[Callable[[], None]],
+    start_offset: float,
+    write_frame: Callable[[int, RGB], None],
+    stop_event: threading.Event,
+    on_jitter: Optional[Callable[[float], None]],
+) -> None:
+    if not palette:
+        return
+    index, remaining = 0, None
+    if start_offset < 0:
+        if stop_event.wait(-start_offset):
+            return
+    elif start_offset > 0:
+        index, remaining = timeline_position(palette, start_offset)
+    deadline = time.monotonic()
+    first = True
+    while not stop_event.is_set():
+        color, duration = palette[index]
+        if on_jitter is not None and not first:
+            on_jitter(time.monotonic() - deadline)
+        first = False
+        write_frame(index, color)
+        if on_first_frame is not None:
+            on_first_frame()
+            on_first_frame = None
+        deadline += remaining if remaining is not None else frame_seconds(duration)
+        remaining = None
+        if stop_event.wait(max(0.0, deadline - time.monotonic())):
+            return
+        index = (index + 1) % len(palette)
+
+
+def restore_logitech_control(controller: "LightingBackend") -> None:
+    """Return keyboard control to Logitech Options+/G HUB (or the backend's idle state) via the controller."""
+    controller.release()
+
+
+def reapply_cached_color(controller: "LightingBackend", base_color: RGB, brightness: int) -> None:
+    """Reapply the cached automation color/brightness after regaining pilot control."""
+    controller.set_static_color(apply_brightness(base_color, brightness))
+
+
+def palette_frames(palette: PaletteDefinition) -> Tuple[PatternFrame, ...]:
+    frames = tuple((frame.color, frame.duration_ms / 1000.0) for frame in palette.frames)
+    logger.debug(
+        "palette_frames: Palette '%s' utilisée: %s",
+        getattr(palette, 'name', '?'),
+        [
+            {"color": f"#{r:02X}{g:02X}{b:02X}", "duration": d}
+            for (r, g, b), d in frames
+        ]
+    )
+    return frames
+
+
+def alert_frames(profile: ConfigProfile) -> Tuple[PatternFrame, ...]:
+    """Retourne les frames de la palette d'alerte."""
+    return palette_frames(profile.palettes.alert)
+
+
+def warning_frames(profile: ConfigProfile) -> Tuple[PatternFrame, ...]:
+    return palette_frames(profile.palettes.warning)
+
+def info_frames(profile: ConfigProfile) -> Tuple[PatternFrame, ...]:
+    return palette_frames(profile.palettes.info)
+
+
+def default_color(profile: ConfigProfile) -> RGB:
+    return profile.lighting.default_color
@@ -6,7 +6,7 @@ import json
 import logging
 import os
 import re
-from dataclasses import dataclass, fields
+from dataclasses import dataclass, fields, replace
 from pathlib import Path
 from typing import Any, Dict, Mapping, Optional, Tuple
 
@@ -17,6 +17,11 @@ DEFAULT_CONFIG_FILENAME = "config.yaml"
 DEFAULT_TOPIC_BASE = "lightspeed/alerts"
 PALETTE_DURATION_LIMITS = {"alert": 500, "warning": 350}
 ALLOWED_LOG_LEVELS = {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}
+ALLOWED_BACKENDS = {"logitech", "simulated"}
+ALLOWED_TARGETS = {"all", "rgb", "perkey_rgb", "monochrome"}
+ALLOWED_MQTT_PROTOCOLS = {"3.1.1", "5"}
+ALLOWED_LIGHT_SCHEMAS = {"default", "json"}
+ALLOWED_TLS_VERIFY = {"required", "none"}
 ENV_PATTERN = re.compile(r"\$\{([A-Z0-9_]+)\}")
 logger = logging.getLogger(__name__)
 
@@ -25,6 +30,24 @@ class ConfigError(RuntimeError):
     """Raised when the configuration file cannot be parsed."""
 
 
+@dataclass(frozen=True)
+class BrokerEndpoint:
+    host: str
+    port: int
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+@dataclass(frozen=True)
+class TlsSettings:
+    enabled: bool
+    ca_file: Optional[str]
+    cert_file: Optional[str]
+    key_file: Optional[str]
+    verify: str
+
+
 @dataclass(frozen=True)
 class MqttSettings:
     host: str
@@ -33,6 +56,22 @@ class MqttSettings:
     password: Optional[str]
     client_id: str
     keepalive: int
+    clean_session: bool
+    reconnect_min_delay: float
+    reconnect_max_delay: float
+    protocol: str
+    session_expiry_seconds: int
+    state_expiry_seconds: int
+    fallback_brokers: Tuple[BrokerEndpoint, ...]
+    probe_timeout_seconds: float
+    failback_interval_seconds: float
+    primary_margin_ms: float
+    tls: TlsSettings
+
+    @property
+    def brokers(self) -> Tuple[BrokerEndpoint, ...]:
+        """Primary broker (``host``/``port``) first, then the fallbacks in order."""
+        return (BrokerEndpoint(self.host, self.port),) + self.fallback_brokers
 
 
 @dataclass(frozen=True)
@@ -47,6 +86,12 @@ class TopicMap:
     warn_command_topic: str
     info_command_topic: str
     lwt: str
+    sync_topic: str
+    binary_command_topic: str
+    json_command_topic: str
+    diagnostics_topic: str
+    diagnostics_response_topic: str
+    performance_topic: str
 
 
 @dataclass(frozen=True)
@@ -56,6 +101,11 @@ class HomeAssistantSettings:
     manufacturer: str
     model: str
     area: Optional[str]
+    light_schema: str
+    status_topic: str
+    republish_jitter_seconds: float
+    # Publication périodique des capteurs de diagnostic (0 = désactivée)
+    metrics_interval_seconds: float = 60.0
 
 
 @dataclass(frozen=True)
@@ -63,11 +113,18 @@ class LightingSettings:
     default_color: RGB
     auto_restore: bool
     lock_file: str
+    # Snapshot local de l'état, réappliqué au démarrage avant la connexion MQTT (None = désactivé)
+    state_snapshot: Optional[str] = None
 
 
 @dataclass(frozen=True)
 class EffectsSettings:
     override_duration_seconds: int
+    alert_latency_slo_ms: int
+    override_rate_per_second: float
+    override_burst: int
+    # Écart horloge locale − horloge partagée des effets synchronisés (None = estimé, "auto")
+    sync_skew_ms: Optional[float]
 
 
 @dataclass(frozen=True)
@@ -99,6 +156,29 @@ class LogitechSettings:
 @dataclass(frozen=True)
 class ObservabilitySettings:
     log_level: str
+    capture_file: Optional[str] = None
+    # Journal circulaire mappé en mémoire (transitions, commandes, écritures), None = désactivé
+    journal_file: Optional[str] = None
+    journal_records: int = 65536
+    # Endpoint HTTP Prometheus (GET /metrics), None = désactivé
+    metrics_port: Optional[int] = None
+    metrics_address: str = "127.0.0.1"
+
+
+@dataclass(frozen=True)
+class IpcSettings:
+    enabled: bool
+    address: str
+
+
+@dataclass(frozen=True)
+class DeviceProfile:
+    name: str
+    backend: str
+    target: str
+    topics: TopicMap
+    home_assistant: HomeAssistantSettings
+    lighting: LightingSettings
 
 
 @dataclass(frozen=True)
@@ -112,11 +192,23 @@ class ConfigProfile:
     palettes: Palettes
     logitech: LogitechSettings
     observability: ObservabilitySettings
+    ipc: IpcSettings
+    devices: Tuple[DeviceProfile, ...]
 
     def schema_revision(self) -> str:
         """Return a stable hash representing the configuration schema."""
         return _SCHEMA_REVISION
 
+    def for_device(self, device: DeviceProfile) -> ConfigProfile:
+        """Return a single-device view where topics/home_assistant/lighting are the device's."""
+        return replace(
+            self,
+            topics=device.topics,
+            home_assistant=device.home_assistant,
+            lighting=device.lighting,
+            devices=(device,),
+        )
+
 
 def load_config(path: Optional[Path | str] = None, *, env: Optional[Mapping[str, str]] = None) -> ConfigProfile:
     """Load and parse the YAML configuration file into typed dataclasses."""
@@ -147,39 +239,30 @@ def load_config(path: Optional[Path | str] = None, *, env: Optional[Mapping[str,
         password=_optional_str(mqtt_data.get("password")),
         client_id=_require_str(mqtt_data, "client_id", default="lightspeed-led"),
         keepalive=int(mqtt_data.get("keepalive", 60)),
+        clean_session=bool(mqtt_data.get("clean_session", False)),
+        reconnect_min_delay=float(mqtt_data.get("reconnect_min_delay", 0.5)),
+        reconnect_max_delay=float(mqtt_data.get("reconnect_max_delay", 30.0)),
+        protocol=str(mqtt_data.get("protocol", "3.1.1")).strip(),
+        session_expiry_seconds=int(mqtt_data.get("session_expiry_seconds", 3600)),
+        state_expiry_seconds=int(mqtt_data.get("state_expiry_seconds", 0)),
+        fallback_brokers=_parse_brokers(mqtt_data.get("fallback_brokers")),
+        probe_timeout_seconds=float(mqtt_data.get("probe_timeout_seconds", 2.0)),
+        failback_interval_seconds=float(mqtt_data.get("failback_interval_seconds", 30.0)),
+        primary_margin_ms=float(mqtt_data.get("primary_margin_ms", 20.0)),
+        tls=_parse_tls(mqtt_data.get("tls")),
     )
 
     topic_base = _normalize_base(_require_str(topics_data, "base", default=DEFAULT_TOPIC_BASE))
-    
-    topics = TopicMap(
-        base=topic_base,
-        state_topic=f"{topic_base}/status",
-        command_topic=f"{topic_base}/switch",
-        rgb_command_topic=f"{topic_base}/rgb/set",
-        brightness_command_topic=f"{topic_base}/brightness/set",
-        mode_command_topic=f"{topic_base}/mode/set",
-        alert_command_topic=f"{topic_base}/alert",
-        warn_command_topic=f"{topic_base}/warn",
-        info_command_topic=f"{topic_base}/info",
-        lwt=f"{topic_base}/lwt",
-    )
-
-    home_assistant = HomeAssistantSettings(
-        device_id=_require_str(ha_data, "device_id", default="lightspeed-alerts"),
-        device_name=_require_str(ha_data, "device_name", default="Lightspeed Alerts"),
-        manufacturer=_require_str(ha_data, "manufacturer", default="Logitech"),
-        model=_require_str(ha_data, "model", default="LED Middleware"),
-        area=_optional_str(ha_data.get("area")),
-    )
-
-    lighting = LightingSettings(
-        default_color=_parse_color(_require_str(lighting_data, "default_color", default="#00FF80")),
-        auto_restore=bool(lighting_data.get("auto_restore", True)),
-        lock_file=_require_str(lighting_data, "lock_file", default="lightspeed.lock"),
-    )
+    topics = _build_topics(topic_base)
+    home_assistant = _parse_home_assistant(ha_data)
+    lighting = _parse_lighting(lighting_data)
 
     effects = EffectsSettings(
         override_duration_seconds=int(effects_data.get("override_duration_seconds", 10)),
+        alert_latency_slo_ms=int(effects_data.get("alert_latency_slo_ms", 100)),
+        override_rate_per_second=float(effects_data.get("override_rate_per_second", 1.0)),
+        override_burst=int(effects_data.get("override_burst", 3)),
+        sync_skew_ms=_parse_skew(effects_data.get("sync_skew_ms", 0)),
     )
 
     palettes = Palettes(
@@ -195,6 +278,18 @@ def load_config(path: Optional[Path | str] = None, *, env: Optional[Mapping[str,
 
     observability = ObservabilitySettings(
         log_level=_require_str(observability_data, "log_level", default="INFO"),
+        capture_file=_optional_str(observability_data.get("capture_file")),
+        journal_file=_optional_str(observability_data.get("journal_file")),
+        journal_records=int(observability_data.get("journal_records", 65536)),
+        metrics_port=_optional_port(observability_data.get("metrics_port")),
+        metrics_address=_optional_str(observability_data.get("metrics_address")) or "127.0.0.1",
+    )
+
+    devices = _parse_devices(
+        substituted.get("devices"),
+        topics=topics,
+        home_assistant_data=ha_data,
+        lighting_data=lighting_data,
     )
 
     profile = ConfigProfile(
@@ -207,11 +302,188 @@ def load_config(path: Optional[Path | str] = None, *, env: Optional[Mapping[str,
         palettes=palettes,
         logitech=logitech,
         observability=observability,
+        ipc=_parse_ipc(substituted.get("ipc")),
+        devices=devices,
     )
     _validate_profile(profile)
     return profile
 
 
+def _build_topics(topic_base: str, *, lwt: Optional[str] = None) -> TopicMap:
+    return TopicMap(
+        base=topic_base,
+        state_topic=f"{topic_base}/status",
+        command_topic=f"{topic_base}/switch",
+        rgb_command_topic=f"{topic_base}/rgb/set",
+        brightness_command_topic=f"{topic_base}/brightness/set",
+        mode_command_topic=f"{topic_base}/mode/set",
+        alert_command_topic=f"{topic_base}/alert",
+        warn_command_topic=f"{topic_base}/warn",
+        info_command_topic=f"{topic_base}/info",
+        lwt=lwt or f"{topic_base}/lwt",
+        sync_topic=f"{topic_base}/sync",
+        binary_command_topic=f"{topic_base}/bin/set",
+        json_command_topic=f"{topic_base}/light/set",
+        diagnostics_topic=f"{topic_base}/diagnostics/get",
+        diagnostics_response_topic=f"{topic_base}/diagnostics",
+        performance_topic=f"{topic_base}/performance",
+    )
+
+
+def _parse_brokers(entries: Any) -> Tuple[BrokerEndpoint, ...]:
+    if not entries:
+        return ()
+    if not isinstance(entries, list):
+        raise ConfigError("mqtt.fallback_brokers doit être une liste")
+    brokers = []
+    for entry in entries:
+        if not isinstance(entry, Mapping):
+            raise ConfigError("Chaque entrée de mqtt.fallback_brokers doit contenir host et port")
+        brokers.append(BrokerEndpoint(host=_require_str(entry, "host"), port=int(entry.get("port", 1883))))
+    return tuple(brokers)
+
+
+def _parse_tls(data: Any) -> TlsSettings:
+    if data is None:
+        data = {}
+    if not isinstance(data, Mapping):
+        raise ConfigError("mqtt.tls doit être un objet")
+    return TlsSettings(
+        enabled=bool(data.get("enabled", False)),
+        ca_file=_optional_str(data.get("ca_file")),
+        cert_file=_optional_str(data.get("cert_file")),
+        key_file=_optional_str(data.get("key_file")),
+        verify=str(data.get("verify", "required")).strip().lower(),
+    )
+
+
+def _parse_ipc(data: Any) -> IpcSettings:
+    if data is None:
+        data = {}
+    if not isinstance(data, Mapping):
+        raise ConfigError("ipc doit être un objet")
+    return IpcSettings(
+        enabled=bool(data.get("enabled", False)),
+        address=_optional_str(data.get("address")) or default_ipc_address(),
+    )
+
+
+def default_ipc_address() -> str:
+    """Named pipe on Windows, Unix domain socket elsewhere."""
+    if os.name == "nt":
+        return r"\\.\pipe\lightspeed-alerts"
+    return "/tmp/lightspeed-alerts.sock"
+
+
+def _optional_port(value: Any) -> Optional[int]:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError) as exc:
+        raise ConfigError("observability.metrics_port doit être un numéro de port") from exc
+
+
+def _parse_skew(value: Any) -> Optional[float]:
+    if isinstance(value, str) and value.strip().lower() == "auto":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError) as exc:
+        raise ConfigError("effects.sync_skew_ms doit être un nombre de millisecondes ou 'auto'") from exc
+
+
+def _parse_home_assistant(ha_data: Mapping[str, Any]) -> HomeAssistantSettings:
+    return HomeAssistantSettings(
+        device_id=_require_str(ha_data, "device_id", default="lightspeed-alerts"),
+        device_name=_require_str(ha_data, "device_name", default="Lightspeed Alerts"),
+        manufacturer=_require_str(ha_data, "manufacturer", default="Logitech"),
+        model=_require_str(ha_data, "model", default="LED Middleware"),
+        area=_optional_str(ha_data.get("area")),
+        light_schema=_require_str(ha_data, "light_schema", default="default").lower(),
+        status_topic=_require_str(ha_data, "status_topic", default="homeassistant/status"),
+        republish_jitter_seconds=float(ha_data.get("republish_jitter_seconds", 5.0)),
+        metrics_interval_seconds=float(ha_data.get("metrics_interval_seconds", 60.0)),
+    )
+
+
+def _parse_lighting(lighting_data: Mapping[str, Any]) -> LightingSettings:
+    return LightingSettings(
+        default_color=_parse_color(_require_str(lighting_data, "default_color", default="#00FF80")),
+        auto_restore=bool(lighting_data.get("auto_restore", True)),
+        lock_file=_require_str(lighting_data, "lock_file", default="lightspeed.lock"),
+        state_snapshot=_optional_str(lighting_data.get("state_snapshot")),
+    )
+
+
+def _parse_devices(
+    data: Any,
+    *,
+    topics: TopicMap,
+    home_assistant_data: Mapping[str, Any],
+    lighting_data: Mapping[str, Any],
+) -> Tuple[DeviceProfile, ...]:
+    """Parse ``devices``; without it the top-level sections describe the single device.
+
+    Device sections inherit the top-level ``home_assistant``/``lighting`` values.
+    All devices share the process-wide availability topic (``topics.lwt``) since
+    they share one MQTT connection and therefore one Last Will.
+    """
+    root_ha = _parse_home_assistant(home_assistant_data)
+    if not data:
+        return (
+            DeviceProfile(
+                name=root_ha.device_id,
+                backend="logitech",
+                target="all",
+                topics=topics,
+                home_assistant=root_ha,
+                lighting=_parse_lighting(lighting_data),
+            ),
+        )
+    if not isinstance(data, list):
+        raise ConfigError("devices doit être une liste")
+
+    devices = []
+    for entry in data:
+        if not isinstance(entry, Mapping):
+            raise ConfigError("Chaque entrée de devices doit être un objet")
+        name = _require_str(entry, "name")
+        if not name or " " in name or "/" in name:
+            raise ConfigError(f"devices.name invalide: {name!r}")
+        device_topics = entry.get("topics") or {}
+        base = _normalize_base(_require_str(device_topics, "base", default=f"{topics.base}/{name}"))
+        ha_data = {
+            **home_assistant_data,
+            "device_id": f"{root_ha.device_id}_{name}",
+            "device_name": f"{root_ha.device_name} {name}",
+            **(entry.get("home_assistant") or {}),
+        }
+        lock_path = Path(_require_str(lighting_data, "lock_file", default="lightspeed.lock"))
+        device_lighting_data = {
+            **lighting_data,
+            "lock_file": str(lock_path.with_name(f"{lock_path.stem}-{name}{lock_path.suffix}")),
+            **(entry.get("lighting") or {}),
+        }
+        snapshot = _optional_str(lighting_data.get("state_snapshot"))
+        if snapshot and "state_snapshot" not in (entry.get("lighting") or {}):
+            snapshot_path = Path(snapshot)
+            device_lighting_data["state_snapshot"] = str(
+                snapshot_path.with_name(f"{snapshot_path.stem}-{name}{snapshot_path.suffix}")
+            )
+        devices.append(
+            DeviceProfile(
+                name=name,
+                backend=_require_str(entry, "backend", default="logitech").lower(),
+                target=_require_str(entry, "target", default="all").lower(),
+                topics=_build_topics(base, lwt=topics.lwt),
+                home_assistant=_parse_home_assistant(ha_data),
+                lighting=_parse_lighting(device_lighting_data),
+            )
+        )
+    return tuple(devices)
+
+
 def _parse_color(value: str) -> RGB:
     text = value.strip()
     if not text.startswith("#") or len(text) != 7:
@@ -365,10 +637,32 @@ def _apply_env_substitution(data: Any, env: Mapping[str, str], *, source: Path)
 
 
 def _validate_profile(profile: ConfigProfile) -> None:
-    if not 1 <= profile.mqtt.port <= 65535:
-        raise ConfigError("Le port MQTT doit être compris entre 1 et 65535")
+    for broker in profile.mqtt.brokers:
+        if not 1 <= broker.port <= 65535:
+            raise ConfigError("Le port MQTT doit être compris entre 1 et 65535")
+    if len(set(profile.mqtt.brokers)) != len(profile.mqtt.brokers):
+        raise ConfigError("mqtt.fallback_brokers ne doit pas répéter un broker")
+    if profile.mqtt.probe_timeout_seconds <= 0 or profile.mqtt.failback_interval_seconds <= 0:
+        raise ConfigError("mqtt.probe_timeout_seconds et mqtt.failback_interval_seconds doivent être strictement positifs")
     if profile.mqtt.keepalive <= 0:
         raise ConfigError("Le keepalive MQTT doit être strictement positif")
+    if profile.mqtt.reconnect_min_delay <= 0:
+        raise ConfigError("mqtt.reconnect_min_delay doit être strictement positif")
+    if profile.mqtt.reconnect_max_delay < profile.mqtt.reconnect_min_delay:
+        raise ConfigError("mqtt.reconnect_max_delay doit être supérieur ou égal à mqtt.reconnect_min_delay")
+    if profile.mqtt.protocol not in ALLOWED_MQTT_PROTOCOLS:
+        raise ConfigError(
+            f"Protocole MQTT invalide: {profile.mqtt.protocol}. Attendu: {sorted(ALLOWED_MQTT_PROTOCOLS)}"
+        )
+    if profile.mqtt.session_expiry_seconds < 0 or profile.mqtt.state_expiry_seconds < 0:
+        raise ConfigError("mqtt.session_expiry_seconds et mqtt.state_expiry_seconds doivent être positifs ou nuls")
+    tls = profile.mqtt.tls
+    if tls.verify not in ALLOWED_TLS_VERIFY:
+        raise ConfigError(f"mqtt.tls.verify invalide: {tls.verify}. Attendu: {sorted(ALLOWED_TLS_VERIFY)}")
+    if tls.key_file and not tls.cert_file:
+        raise ConfigError("mqtt.tls.key_file nécessite mqtt.tls.cert_file")
+
+    _validate_devices(profile.devices)
 
     for topic in (
         profile.topics.base,
@@ -381,10 +675,23 @@ def _validate_profile(profile: ConfigProfile) -> None:
         profile.topics.warn_command_topic,
         profile.topics.info_command_topic,
         profile.topics.lwt,
+        profile.topics.sync_topic,
+        profile.topics.binary_command_topic,
+        profile.topics.json_command_topic,
+        profile.topics.diagnostics_topic,
+        profile.topics.diagnostics_response_topic,
+        profile.topics.performance_topic,
+        profile.home_assistant.status_topic,
     ):
         if not topic or " " in topic:
             raise ConfigError("Les topics MQTT ne doivent pas être vides ni contenir d'espaces")
 
+    if profile.home_assistant.republish_jitter_seconds < 0:
+        raise ConfigError("home_assistant.republish_jitter_seconds doit être positif ou nul")
+    metrics_interval = profile.home_assistant.metrics_interval_seconds
+    if metrics_interval != 0 and not 5 <= metrics_interval <= 3600:
+        raise ConfigError("home_assistant.metrics_interval_seconds doit valoir 0 (désactivé) ou être compris entre 5 et 3600")
+
     if profile.observability.log_level.upper() not in ALLOWED_LOG_LEVELS:
         raise ConfigError(
             f"Niveau de log invalide: {profile.observability.log_level}. Attendu: {sorted(ALLOWED_LOG_LEVELS)}"
@@ -412,6 +719,53 @@ def _validate_profile(profile: ConfigProfile) -> None:
     duration = profile.effects.override_duration_seconds
     if duration < 1 or duration > 300:
         raise ConfigError("effects.override_duration_seconds doit être compris entre 1 et 300 secondes")
+    if profile.effects.alert_latency_slo_ms <= 0:
+        raise ConfigError("effects.alert_latency_slo_ms doit être strictement positif")
+    if profile.effects.override_rate_per_second <= 0 or profile.effects.override_burst < 1:
+        raise ConfigError("effects.override_rate_per_second doit être > 0 et effects.override_burst >= 1")
+    if profile.observability.journal_records < 16:
+        raise ConfigError("observability.journal_records doit être >= 16")
+    metrics_port = profile.observability.metrics_port
+    if metrics_port is not None and not 0 < metrics_port < 65536:
+        raise ConfigError("observability.metrics_port doit être compris entre 1 et 65535")
+
+
+def _validate_devices(devices: Tuple[DeviceProfile, ...]) -> None:
+    if not devices:
+        raise ConfigError("devices doit contenir au moins un device")
+    seen: Dict[str, set] = {"name": set(), "base": set(), "device_id": set(), "lock_file": set(), "state_snapshot": set()}
+    for device in devices:
+        if device.backend not in ALLOWED_BACKENDS:
+            raise ConfigError(
+                f"Backend invalide pour {device.name}: {device.backend}. Attendu: {sorted(ALLOWED_BACKENDS)}"
+            )
+        if device.home_assistant.light_schema not in ALLOWED_LIGHT_SCHEMAS:
+            raise ConfigError(
+                f"home_assistant.light_schema invalide pour {device.name}: {device.home_assistant.light_schema}. "
+                f"Attendu: {sorted(ALLOWED_LIGHT_SCHEMAS)}"
+            )
+        if device.target not in ALLOWED_TARGETS:
+            raise ConfigError(
+                f"Cible invalide pour {device.name}: {device.target}. Attendu: {sorted(ALLOWED_TARGETS)}"
+            )
+        keys = {
+            "name": device.name,
+            "base": device.topics.base,
+            "device_id": device.home_assistant.device_id,
+        }
+        if device.backend == "logitech":
+            keys["lock_file"] = device.lighting.lock_file
+        if device.lighting.state_snapshot:
+            keys["state_snapshot"] = device.lighting.state_snapshot
+        for key, value in keys.items():
+            if value in seen[key]:
+                raise ConfigError(f"Valeur dupliquée dans devices ({key}): {value}")
+            seen[key].add(value)
+        for topic in (device.topics.base, device.topics.state_topic, device.topics.command_topic):
+            if not topic or " " in topic:
+                raise ConfigError("Les topics MQTT ne doivent pas être vides ni contenir d'espaces")
+        if any(channel < 0 or channel > 255 for channel in device.lighting.default_color):
+            raise ConfigError("Les composantes RGB doivent être comprises entre 0 et 255")
 
 
 def _field_names(cls, exclude: Optional[set[str]] = None) -> Tuple[str, ...]:
@@ -422,7 +776,10 @@ def _field_names(cls, exclude: Optional[set[str]] = None) -> Tuple[str, ...]:
 def _compute_schema_revision() -> str:
     blueprint = {
         "ConfigProfile": _field_names(ConfigProfile, exclude={"source_path"}),
+        "DeviceProfile": _field_names(DeviceProfile),
         "MqttSettings": _field_names(MqttSettings),
+        "BrokerEndpoint": _field_names(BrokerEndpoint),
+        "TlsSettings": _field_names(TlsSettings),
         "TopicMap": _field_names(TopicMap),
         "HomeAssistantSettings": _field_names(HomeAssistantSettings),
         "LightingSettings": _field_names(LightingSettings),
@@ -431,6 +788,7 @@ def _compute_schema_revision() -> str:
         "PaletteFrame": _field_names(PaletteFrame),
         "LogitechSettings": _field_names(LogitechSettings),
         "ObservabilitySettings": _field_names(ObservabilitySettings),
+        "IpcSettings": _field_names(IpcSettings),
     }
     payload = json.dumps(blueprint, sort_keys=True, separators=(",", ":")).encode("utf-8")
     return hashlib.sha256(payload).hexdigest()[:12]
@@ -0,0 +1,485 @@
+"""Shared MQTT connection: reconnect strategy, per-device subscriptions and topic router."""
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from lightspeed.config import BrokerEndpoint, ConfigProfile, MqttSettings
+from lightspeed.failover import choose_endpoint, probe_all, probe_broker
+from lightspeed.metrics import MetricsRegistry
+from lightspeed.observability import configure_last_will, publish_availability
+from lightspeed.scheduler import ScheduledCall, default_scheduler
+from lightspeed.tls import ResumingSSLContext, build_ssl_context
+
+logger = logging.getLogger(__name__)
+
+# Le marqueur de synchronisation n'a de sens que pendant quelques secondes
+SYNC_MARKER_EXPIRY_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class BackoffPolicy:
+    """Exponential backoff with multiplicative jitter."""
+
+    min_delay: float
+    max_delay: float
+    multiplier: float = 2.0
+    jitter: float = 0.5
+
+    @classmethod
+    def from_settings(cls, settings: MqttSettings) -> BackoffPolicy:
+        return cls(min_delay=settings.reconnect_min_delay, max_delay=settings.reconnect_max_delay)
+
+    def delay(self, attempt: int, *, rng: Callable[[], float] = random.random) -> float:
+        """Delay before reconnect ``attempt`` (0-based); spreads a fleet over [ceiling*(1-jitter), ceiling]."""
+        ceiling = min(self.max_delay, self.min_delay * (self.multiplier ** max(0, attempt)))
+        return ceiling * (1.0 - self.jitter * rng())
+
+
+class ReconnectStrategy:
+    """Drives paho's reconnect waits with a :class:`BackoffPolicy` and records metrics.
+
+    paho's ``loop_forever`` (used by ``loop_start``) waits ``reconnect_delay_set``'s
+    minimum before each reconnect attempt; the strategy resets that delay from the
+    ``on_disconnect``/``on_connect_fail`` callbacks, i.e. right before every wait.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        policy: BackoffPolicy,
+        *,
+        metrics: MetricsRegistry,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.client = client
+        self.policy = policy
+        self.metrics = metrics
+        self._clock = clock
+        self.attempt = 0
+        self.disconnected_at: Optional[float] = None
+
+    def connected(self) -> Optional[float]:
+        """Record a successful CONNACK; returns the outage duration when reconnecting."""
+        self.metrics.counter("mqtt_connects").inc()
+        outage = None
+        if self.disconnected_at is not None:
+            outage = self._clock() - self.disconnected_at
+            self.metrics.counter("mqtt_reconnects").inc()
+            self.metrics.timing("mqtt_reconnect_seconds").observe(outage)
+            logger.info(
+                "Reconnecté au broker",
+                extra={"outage_seconds": round(outage, 3), "attempts": self.attempt},
+            )
+        self.disconnected_at = None
+        self.attempt = 0
+        return outage
+
+    def disconnected(self) -> None:
+        """Record a lost connection and arm the first (short) reconnect delay."""
+        if self.disconnected_at is None:
+            self.disconnected_at = self._clock()
+            self.metrics.counter("mqtt_disconnects").inc()
+        self._schedule_next()
+
+    def connect_failed(self) -> None:
+        """Record a failed attempt and grow the next delay."""
+        self.metrics.counter("mqtt_connect_failures").inc()
+        if self.disconnected_at is None:
+            self.disconnected_at = self._clock()
+        self._schedule_next()
+
+    def _schedule_next(self) -> None:
+        delay = self.policy.delay(self.attempt)
+        self.attempt += 1
+        self.client.reconnect_delay_set(min_delay=delay, max_delay=max(delay, self.policy.max_delay))
+
+
+class RoutedService(Protocol):
+    """What :class:`MqttConnection` expects from a device service."""
+
+    profile: ConfigProfile
+
+    def routed_topics(self) -> Sequence[str]: ...
+
+    def subscribed_topics(self) -> Sequence[str]: ...
+
+    def on_connected(self, *, session_present: bool) -> None: ...
+
+    def on_home_assistant_online(self) -> None: ...
+
+    def handle_message(self, message: Any) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def message_deadline(message: Any, *, now: float) -> Optional[float]:
+    """Monotonic deadline of a received MQTT v5 message, ``None`` without expiry.
+
+    The broker forwards the *remaining* ``MessageExpiryInterval``; a message
+    kept locally (e.g. until the state is restored) must be dropped once it
+    elapses.
+    """
+    properties = getattr(message, "properties", None)
+    interval = getattr(properties, "MessageExpiryInterval", None)
+    if interval is None:
+        return None
+    return now + interval
+
+
+def _reason(rc: Any) -> str:
+    """Readable reason for a CONNACK/DISCONNECT code (v5 ``ReasonCodes`` or v3 int)."""
+    if isinstance(rc, int):
+        return mqtt.connack_string(rc)
+    return str(rc)
+
+
+class MqttConnection:
+    """One paho client shared by every device service of the process.
+
+    Owns the Last Will/availability, the reconnect strategy and the
+    subscriptions to each device's exact command topics (no wildcard, so the
+    service's own state and discovery publishes are not echoed back);
+    incoming messages are routed to the owning service with one dictionary
+    lookup.
+    """
+
+    def __init__(
+        self,
+        profile: ConfigProfile,
+        *,
+        metrics: MetricsRegistry | None = None,
+        client_factory: Callable[..., Any] | None = None,
+    ) -> None:
+        self.profile = profile
+        self.metrics = metrics or MetricsRegistry()
+        self.stop_event = threading.Event()
+        self.connected = False
+        self.services: List[RoutedService] = []
+        self._routes: Dict[str, RoutedService] = {}
+        self._subscribed = False
+        self._started = False
+        self._closed = False
+        self._timer_factory = default_scheduler().timer
+        self._rng: Callable[[], float] = random.random
+        self._birth_timer: Optional[ScheduledCall] = None
+        settings = profile.mqtt
+        # Liste de brokers : primaire puis secours; sondés seulement s'il y en a plusieurs
+        self.brokers = settings.brokers
+        self.endpoint: BrokerEndpoint = self.brokers[0]
+        self.failover_enabled = len(self.brokers) > 1
+        self._connected_endpoint: Optional[BrokerEndpoint] = None
+        self._switching = False
+        self._failback_thread: Optional[threading.Thread] = None
+        # Demande de re-sélection posée par les callbacks paho, traitée par le thread de failback
+        self._reselect = threading.Event()
+        self.v5 = settings.protocol == "5"
+        # Alias de topics (MQTT v5) : valables pour la connexion courante uniquement
+        self._alias_maximum = 0
+        self._aliases: Dict[str, int] = {}
+        self._alias_lock = threading.Lock()
+        # client_factory : client compatible paho (ex. lightspeed.harness.FakeBroker.client)
+        factory = client_factory or mqtt.Client
+        if self.v5:
+            # v5 : la persistance de session passe par clean_start/SessionExpiryInterval au CONNECT
+            self.client = factory(client_id=settings.client_id, protocol=mqtt.MQTTv5)
+        else:
+            # Session persistante : le broker conserve abonnements et commandes QoS 1 pendant une coupure
+            self.client = factory(client_id=settings.client_id, clean_session=settings.clean_session)
+        if settings.username:
+            self.client.username_pw_set(settings.username, settings.password or None)
+        # TLS : le contexte garde la session de chaque broker pour reprendre le handshake à la reconnexion
+        self.ssl_context: Optional[ResumingSSLContext] = None
+        if settings.tls.enabled:
+            self.ssl_context = build_ssl_context(settings.tls, metrics=self.metrics)
+            self.client.tls_set_context(self.ssl_context)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_connect_fail = self.on_connect_fail
+        self.client.on_message = self.on_message
+        self.reconnect = ReconnectStrategy(
+            self.client,
+            BackoffPolicy.from_settings(settings),
+            metrics=self.metrics,
+        )
+        configure_last_will(self.client, profile)
+
+    def register(self, service: RoutedService) -> None:
+        for topic in service.routed_topics():
+            owner = self._routes.get(topic)
+            if owner is not None and owner is not service:
+                raise ValueError(f"Topic déjà routé vers un autre device: {topic}")
+            self._routes[topic] = service
+        self.services.append(service)
+
+    def subscriptions(self) -> List[str]:
+        topics = sorted({topic for service in self.services for topic in service.subscribed_topics()})
+        return topics + [self.profile.home_assistant.status_topic]
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        endpoint = self.endpoint
+        if self.failover_enabled:
+            endpoint = self._select_endpoint() or self.endpoint
+        # connect_async + loop_start : la boucle paho réessaie aussi la première connexion,
+        # avec les délais fournis par ReconnectStrategy
+        self._connect_async(endpoint)
+        self.client.loop_start()
+        if self.failover_enabled:
+            self._start_failback_thread()
+
+    def _start_failback_thread(self) -> None:
+        self._failback_thread = threading.Thread(target=self._failback_loop, daemon=True, name="mqtt-failback")
+        self._failback_thread.start()
+
+    def _connect_async(self, endpoint: BrokerEndpoint) -> None:
+        """Programme la (re)connexion de la boucle paho vers ``endpoint``."""
+        settings = self.profile.mqtt
+        self.endpoint = endpoint
+        logger.info("Connexion MQTT", extra={"host": endpoint.host, "port": endpoint.port})
+        if self.v5:
+            properties = None
+            if not settings.clean_session:
+                properties = Properties(PacketTypes.CONNECT)
+                properties.SessionExpiryInterval = settings.session_expiry_seconds
+            self.client.connect_async(
+                endpoint.host,
+                endpoint.port,
+                keepalive=settings.keepalive,
+                clean_start=settings.clean_session,
+                properties=properties,
+            )
+        else:
+            self.client.connect_async(endpoint.host, endpoint.port, keepalive=settings.keepalive)
+
+    def _select_endpoint(self) -> Optional[BrokerEndpoint]:
+        """Sonde tous les brokers en parallèle et retourne le plus rapide (primaire favorisé)."""
+        settings = self.profile.mqtt
+        results = probe_all(
+            self.brokers,
+            settings,
+            timeout=settings.probe_timeout_seconds,
+            ssl_context=self.ssl_context,
+        )
+        for result in results:
+            broker = str(result.endpoint)
+            self.metrics.gauge("mqtt_broker_healthy", broker=broker).set(1.0 if result.healthy else 0.0)
+            if result.healthy:
+                self.metrics.gauge("mqtt_broker_latency_seconds", broker=broker).set(round(result.latency, 6))
+            else:
+                logger.warning("Broker injoignable", extra={"broker": broker, "error": result.error})
+        return choose_endpoint(results, primary=self.brokers[0], margin_seconds=settings.primary_margin_ms / 1000)
+
+    def _request_failover(self) -> None:
+        """Callback paho (thread réseau) : les sondes bloquantes partent sur le thread de failback."""
+        self._reselect.set()
+
+    def _fail_over(self) -> None:
+        """Après une coupure : bascule la prochaine tentative vers le meilleur broker sain.
+
+        Sonde tous les brokers (jusqu'à ``probe_timeout_seconds``) : thread de failback uniquement.
+        """
+        chosen = self._select_endpoint()
+        if chosen is None or chosen == self.endpoint:
+            return
+        logger.warning("Bascule vers un autre broker", extra={"from": str(self.endpoint), "to": str(chosen)})
+        self.metrics.counter("mqtt_failovers").inc()
+        self._connect_async(chosen)
+
+    def _failback_loop(self) -> None:
+        """Thread de failback : re-sélection après une coupure, retour au primaire dès qu'il répond."""
+        settings = self.profile.mqtt
+        primary = self.brokers[0]
+        while not self.stop_event.is_set():
+            reselect = self._reselect.wait(settings.failback_interval_seconds)
+            if self.stop_event.is_set():
+                return
+            if reselect:
+                self._reselect.clear()
+                if not self.connected:
+                    # La boucle paho a pu se reconnecter entre-temps : rien à basculer
+                    self._fail_over()
+                continue
+            if not self.connected or self.endpoint == primary:
+                continue
+            probe = probe_broker(primary, settings, timeout=settings.probe_timeout_seconds, ssl_context=self.ssl_context)
+            if probe.healthy:
+                self._switch_to(primary)
+
+    def _switch_to(self, endpoint: BrokerEndpoint) -> None:
+        """Bascule planifiée : quitte proprement le broker courant puis se connecte à ``endpoint``."""
+        logger.info("Retour au broker primaire", extra={"from": str(self.endpoint), "to": str(endpoint)})
+        self.metrics.counter("mqtt_failbacks").inc()
+        self._switching = True
+        try:
+            if self.connected:
+                publish_availability(self.client, self.profile, "offline")
+            self.client.disconnect()
+            self.client.loop_stop()
+        finally:
+            self._switching = False
+        if self.stop_event.is_set():
+            return
+        self._connect_async(endpoint)
+        self.client.loop_start()
+
+    def publish(
+        self,
+        topic: str,
+        payload: str,
+        *,
+        qos: int = 1,
+        retain: bool = False,
+        expiry: Optional[int] = None,
+        alias: bool = False,
+        correlation: Optional[bytes] = None,
+    ) -> None:
+        """Publie un message; en v5, ajoute l'expiration, l'alias de topic et la corrélation demandés.
+
+        ``alias`` réserve un alias au premier envoi (topic complet + alias) puis
+        envoie un topic vide pour les suivants, dans la limite annoncée par le broker.
+        Il ne s'applique qu'aux publications QoS 0 non retained : une publication
+        QoS ≥ 1 peut être renvoyée après reconnexion, où l'alias n'est plus valide.
+        """
+        if not self.v5:
+            self.client.publish(topic, payload=payload, qos=qos, retain=retain)
+            return
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = expiry
+        if correlation:
+            properties.CorrelationData = correlation
+        publish_topic = topic
+        if alias and qos == 0 and not retain:
+            with self._alias_lock:
+                number = self._aliases.get(topic)
+                if number is not None:
+                    publish_topic = ""
+                elif len(self._aliases) < self._alias_maximum:
+                    number = len(self._aliases) + 1
+                    self._aliases[topic] = number
+                if number is not None:
+                    properties.TopicAlias = number
+        self.client.publish(
+            publish_topic,
+            payload=payload,
+            qos=qos,
+            retain=retain,
+            properties=None if properties.isEmpty() else properties,
+        )
+
+    def loop_forever(self) -> None:
+        try:
+            while not self.stop_event.is_set():
+                time.sleep(0.5)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.stop_event.set()
+        # Réveille le thread de failback
+        self._reselect.set()
+        if self._birth_timer is not None:
+            self._birth_timer.cancel()
+        if self.connected:
+            publish_availability(self.client, self.profile, "offline")
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.connected = False
+        for service in self.services:
+            service.close()
+
+    def on_connect(self, client: Any, _userdata, flags, rc: Any, properties: Any = None) -> None:
+        if rc != 0:
+            reason = _reason(rc)
+            logger.error("Connexion MQTT refusée", extra={"code": int(getattr(rc, "value", rc)), "reason": reason})
+            self.metrics.counter("mqtt_connect_refused", reason=reason).inc()
+            return
+        self.connected = True
+        if self.ssl_context is not None:
+            # TLS 1.3 : le ticket de session n'arrive qu'après le handshake, avant le CONNACK
+            self.ssl_context.remember(client.socket())
+        with self._alias_lock:
+            self._alias_maximum = int(getattr(properties, "TopicAliasMaximum", 0) or 0)
+            self._aliases.clear()
+        self.reconnect.connected()
+        # Changement de broker : les retained et la discovery de l'autre broker ne comptent pas
+        same_broker = self._connected_endpoint in (None, self.endpoint)
+        self._connected_endpoint = self.endpoint
+        session_present = bool((flags or {}).get("session present")) and self._subscribed and same_broker
+        logger.info("Connecté au broker", extra={"session_present": session_present, "broker": str(self.endpoint)})
+        publish_availability(client, self.profile, "online")
+        if not session_present:
+            client.subscribe([(topic_filter, 1) for topic_filter in self.subscriptions()])
+            self._subscribed = True
+        for service in self.services:
+            service.on_connected(session_present=session_present)
+
+    def on_disconnect(self, _client: Any, _userdata, rc: Any, _properties: Any = None) -> None:
+        self.connected = False
+        with self._alias_lock:
+            # Alias propres à la connexion : plus aucun n'est utilisé jusqu'au prochain CONNACK
+            self._alias_maximum = 0
+            self._aliases.clear()
+        if self.stop_event.is_set() or self._switching:
+            return
+        logger.warning("Connexion MQTT perdue", extra={"code": int(getattr(rc, "value", rc)), "reason": str(rc)})
+        self.reconnect.disconnected()
+        if self.failover_enabled:
+            self._request_failover()
+
+    def on_connect_fail(self, _client: Any, _userdata) -> None:
+        logger.warning("Connexion MQTT impossible, nouvelle tentative", extra={"attempt": self.reconnect.attempt})
+        self.reconnect.connect_failed()
+        if self.failover_enabled:
+            self._request_failover()
+
+    def on_message(self, _client: Any, _userdata, message) -> None:
+        if message.topic == self.profile.home_assistant.status_topic:
+            self._on_home_assistant_status(message)
+            return
+        service = self._routes.get(message.topic)
+        if service is None:
+            logger.debug("Topic ignoré", extra={"topic": message.topic})
+            return
+        service.handle_message(message)
+
+    def _on_home_assistant_status(self, message) -> None:
+        """Message de naissance HA : republie discovery et état après un délai aléatoire.
+
+        Le délai (0 à ``republish_jitter_seconds``) étale la charge d'une flotte
+        d'instances qui reçoivent toutes le même ``online``.
+        """
+        if getattr(message, "retain", False):
+            # Copie retained livrée à l'abonnement : HA n'a pas redémarré à l'instant
+            return
+        if message.payload.decode("utf-8", errors="ignore").strip().lower() != "online":
+            return
+        if self._birth_timer is not None:
+            self._birth_timer.cancel()
+        delay = self._rng() * self.profile.home_assistant.republish_jitter_seconds
+        logger.info("Home Assistant en ligne, republication planifiée", extra={"delay_seconds": round(delay, 3)})
+        self.metrics.counter("home_assistant_births").inc()
+        self._birth_timer = self._timer_factory(delay, self._republish_for_home_assistant)
+        self._birth_timer.daemon = True
+        self._birth_timer.start()
+
+    def _republish_for_home_assistant(self) -> None:
+        self._birth_timer = None
+        if not self.connected:
+            return
+        for service in self.services:
+            service.on_home_assistant_online()
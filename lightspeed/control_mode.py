@@ -1,16 +1,35 @@
 """Control mode and override helpers for MQTT lighting orchestration."""
 from __future__ import annotations
 
-from dataclasses import dataclass
+import math
+import time
+from dataclasses import FrozenInstanceError
 from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import Any, Dict, Optional, Tuple
 
 RGB = Tuple[int, int, int]
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+# Horloge murale − horloge monotone, figé à l'import : les états restent ordonnés même si l'heure système saute
+_WALL_OFFSET_NS = time.time_ns() - time.monotonic_ns()
 
-def _now() -> datetime:
-    return datetime.now(timezone.utc)
+
+def to_monotonic_ns(moment: datetime) -> int:
+    """Monotonic-clock nanoseconds of a wall-clock instant (naive datetimes are taken as UTC)."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - _EPOCH) // _MICROSECOND * 1000 - _WALL_OFFSET_NS
+
+
+def to_datetime(monotonic_ns: int) -> datetime:
+    """UTC wall-clock instant of a monotonic-clock timestamp, to the microsecond."""
+    return _EPOCH + timedelta(microseconds=(monotonic_ns + _WALL_OFFSET_NS) // 1000)
+
+
+# Gravité des effets : un effet plus grave préempte, un moins grave attend son tour
+OVERRIDE_PRIORITY: Dict[str, int] = {"info": 1, "warning": 2, "alert": 3}
 
 
 class Mode(str, Enum):
@@ -36,20 +55,61 @@ def mode_payload_from_switch(enabled: bool) -> str:
     return Mode.PILOT.value if enabled else Mode.LOGI.value
 
 
-@dataclass(frozen=True)
-class OverrideAction:
-    kind: str
-    duration_seconds: int
-    started_at: datetime
-    timer_handle: Any | None = None
+class _Frozen:
+    """Slotted immutable record: equality, hash and repr over ``_fields``."""
+
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def _values(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._values() == other._values()  # type: ignore[attr-defined]
 
+    def __hash__(self) -> int:
+        return hash(self._values())
 
-    def __post_init__(self) -> None:
-        if self.kind not in {"alert", "warning", "info"}:
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{self.__class__.__name__}({fields})"
+
+
+class OverrideAction(_Frozen):
+    """Running effect; ``started_ns`` is on the monotonic clock."""
+
+    __slots__ = ("kind", "duration_seconds", "started_ns", "timer_handle", "_iso")
+    _fields = ("kind", "duration_seconds", "started_ns", "timer_handle")
+
+    def __init__(
+        self,
+        kind: str,
+        duration_seconds: int,
+        started_at: Optional[datetime] = None,
+        timer_handle: Any | None = None,
+        *,
+        started_ns: Optional[int] = None,
+    ) -> None:
+        if kind not in {"alert", "warning", "info"}:
             raise ValueError("kind must be 'alert', 'warning' ou 'info'")
-        if self.duration_seconds <= 0:
+        if duration_seconds <= 0:
             raise ValueError("duration_seconds must be positive")
-
+        if started_ns is None:
+            started_ns = time.monotonic_ns() if started_at is None else to_monotonic_ns(started_at)
+        _set = object.__setattr__
+        _set(self, "kind", kind)
+        _set(self, "duration_seconds", duration_seconds)
+        _set(self, "started_ns", started_ns)
+        _set(self, "timer_handle", timer_handle)
+        _set(self, "_iso", None)
 
     @property
     def mode(self) -> Mode:
@@ -61,39 +121,120 @@ class OverrideAction:
             return Mode.OVERRIDE_INFO
         raise ValueError(f"kind inconnu: {self.kind}")
 
+    @property
+    def started_at(self) -> datetime:
+        return to_datetime(self.started_ns)
+
+    @property
+    def expires_ns(self) -> int:
+        return self.started_ns + self.duration_seconds * 1_000_000_000
+
     @property
     def expires_at(self) -> datetime:
-        return self.started_at + timedelta(seconds=self.duration_seconds)
+        return to_datetime(self.expires_ns)
+
+    def remaining_seconds(self, now_ns: Optional[int] = None) -> float:
+        """Seconds until expiry on the monotonic clock (negative once expired)."""
+        return (self.expires_ns - (time.monotonic_ns() if now_ns is None else now_ns)) / 1e9
 
     def with_timer(self, handle: Any | None) -> OverrideAction:
-        return OverrideAction(
-            kind=self.kind,
-            duration_seconds=self.duration_seconds,
-            started_at=self.started_at,
-            timer_handle=handle,
-        )
+        return OverrideAction(self.kind, self.duration_seconds, timer_handle=handle, started_ns=self.started_ns)
+
+    def with_duration(self, duration_seconds: int) -> OverrideAction:
+        return OverrideAction(self.kind, duration_seconds, timer_handle=self.timer_handle, started_ns=self.started_ns)
+
+    def suspend(self, now_ns: int) -> Optional[OverrideAction]:
+        """Paused copy whose duration is the time left at ``now_ns`` (``None`` once expired)."""
+        remaining = min(self.duration_seconds, self.remaining_seconds(now_ns))
+        if remaining <= 0:
+            return None
+        return OverrideAction(self.kind, math.ceil(remaining), started_ns=now_ns)
 
     def to_payload(self) -> Dict[str, Any]:
+        iso = self._iso
+        if iso is None:
+            iso = (self.started_at.isoformat(), self.expires_at.isoformat())
+            object.__setattr__(self, "_iso", iso)
         return {
             "kind": self.kind,
             "duration_seconds": self.duration_seconds,
-            "started_at": self.started_at.isoformat(),
-            "expires_at": self.expires_at.isoformat(),
+            "started_at": iso[0],
+            "expires_at": iso[1],
         }
 
 
 _UNSET = object()
 
 
-@dataclass(frozen=True)
-class ControlMode:
-    state: Mode
-    pilot_switch: bool
-    light_on: bool
-    last_command_color: RGB
-    last_brightness: int
-    updated_at: datetime
-    override: Optional[OverrideAction] = None
+class ControlMode(_Frozen):
+    """Immutable lighting state; every transition returns a new version, or ``self`` when nothing changes.
+
+    ``updated_ns`` is on the monotonic clock; ``updated_at`` and the ISO strings
+    of :meth:`snapshot` are derived from it on demand, once per version.
+    ``suspended`` holds the overrides waiting behind the running one, most
+    severe first, each paused with the time it has left (its ``duration_seconds``).
+    """
+
+    __slots__ = (
+        "state",
+        "pilot_switch",
+        "light_on",
+        "last_command_color",
+        "last_brightness",
+        "updated_ns",
+        "override",
+        "suspended",
+        "_updated_iso",
+    )
+    _fields = (
+        "state",
+        "pilot_switch",
+        "light_on",
+        "last_command_color",
+        "last_brightness",
+        "updated_ns",
+        "override",
+        "suspended",
+    )
+
+    def __init__(
+        self,
+        state: Mode,
+        pilot_switch: bool,
+        light_on: bool,
+        last_command_color: RGB,
+        last_brightness: int,
+        updated_at: Optional[datetime] = None,
+        override: Optional[OverrideAction] = None,
+        *,
+        updated_ns: Optional[int] = None,
+        suspended: Tuple[OverrideAction, ...] = (),
+    ) -> None:
+        if updated_ns is None:
+            updated_ns = time.monotonic_ns() if updated_at is None else to_monotonic_ns(updated_at)
+        self._assign(state, pilot_switch, light_on, last_command_color, last_brightness, updated_ns, override, suspended)
+
+    def _assign(
+        self,
+        state: Mode,
+        pilot_switch: bool,
+        light_on: bool,
+        last_command_color: RGB,
+        last_brightness: int,
+        updated_ns: int,
+        override: Optional[OverrideAction],
+        suspended: Tuple[OverrideAction, ...],
+    ) -> None:
+        _set = object.__setattr__
+        _set(self, "state", state)
+        _set(self, "pilot_switch", pilot_switch)
+        _set(self, "light_on", light_on)
+        _set(self, "last_command_color", last_command_color)
+        _set(self, "last_brightness", last_brightness)
+        _set(self, "updated_ns", updated_ns)
+        _set(self, "override", override)
+        _set(self, "suspended", suspended)
+        _set(self, "_updated_iso", None)
 
     @classmethod
     def bootstrap(
@@ -103,17 +244,28 @@ class ControlMode:
         pilot_switch: bool = True,
         light_on: bool = True,
     ) -> ControlMode:
-        timestamp = _now()
         return cls(
             state=_derive_state(pilot_switch, light_on, None),
             pilot_switch=pilot_switch,
             light_on=light_on,
             last_command_color=default_color,
             last_brightness=255,
-            updated_at=timestamp,
             override=None,
         )
 
+    @property
+    def updated_at(self) -> datetime:
+        return to_datetime(self.updated_ns)
+
+    @property
+    def updated_at_iso(self) -> str:
+        """``updated_at`` as UTC ISO 8601, computed once per version."""
+        iso = self._updated_iso
+        if iso is None:
+            iso = self.updated_at.isoformat()
+            object.__setattr__(self, "_updated_iso", iso)
+        return iso
+
     def record_color_command(
         self,
         *,
@@ -147,29 +299,60 @@ class ControlMode:
         timer_handle: Any | None = None,
         timestamp: Optional[datetime] = None,
     ) -> ControlMode:
-        started_at = timestamp or _now()
-        action = OverrideAction(
-            kind=kind,
-            duration_seconds=duration_seconds,
-            started_at=started_at,
-            timer_handle=timer_handle,
-        )
-        return self._evolve(override=action, timestamp=started_at)
+        """Start ``kind`` now, or queue it behind a more severe running override.
+
+        A more severe override (or the same kind) takes over at once and the one
+        it preempts is suspended with its remaining time; a less severe one waits
+        in ``suspended`` until :meth:`finish_override` reaches it.
+        """
+        action = OverrideAction(kind, duration_seconds, timestamp, timer_handle)
+        current = self.override
+        if current is None or current.kind == kind:
+            return self._evolve(override=action, updated_ns=action.started_ns)
+        if OVERRIDE_PRIORITY[kind] > OVERRIDE_PRIORITY[current.kind]:
+            suspended = _enqueue(self.suspended, current.suspend(action.started_ns))
+            return self._evolve(override=action, suspended=suspended, updated_ns=action.started_ns)
+        return self._evolve(suspended=_enqueue(self.suspended, action.suspend(action.started_ns)), updated_ns=action.started_ns)
+
+    def extend_override(self, *, duration_seconds: int, timestamp: Optional[datetime] = None) -> ControlMode:
+        """Push the running override's expiry to ``timestamp + duration_seconds`` without restarting it."""
+        if self.override is None:
+            raise ValueError("Aucun override actif à prolonger")
+        now_ns = time.monotonic_ns() if timestamp is None else to_monotonic_ns(timestamp)
+        elapsed = (now_ns - self.override.started_ns) / 1e9
+        total = max(self.override.duration_seconds, math.ceil(elapsed + duration_seconds))
+        if total == self.override.duration_seconds:
+            return self
+        return self._evolve(override=self.override.with_duration(total), updated_ns=now_ns)
+
+    def finish_override(self, *, timestamp: Optional[datetime] = None) -> ControlMode:
+        """End the running override and resume the most severe suspended one for the time it had left."""
+        if not self.suspended:
+            return self._evolve(override=None, timestamp=timestamp)
+        now_ns = time.monotonic_ns() if timestamp is None else to_monotonic_ns(timestamp)
+        paused, rest = self.suspended[0], self.suspended[1:]
+        resumed = OverrideAction(paused.kind, paused.duration_seconds, started_ns=now_ns)
+        return self._evolve(override=resumed, suspended=rest, updated_ns=now_ns)
 
     def clear_override(self, *, timestamp: Optional[datetime] = None) -> ControlMode:
-        return self._evolve(override=None, timestamp=timestamp)
+        """Stop the running override and drop the suspended ones (light off, auto mode)."""
+        return self._evolve(override=None, suspended=(), timestamp=timestamp)
 
     def snapshot(self) -> Dict[str, Any]:
         data: Dict[str, Any] = {
             "mode": self.state.value,
             "pilot_switch": "ON" if self.pilot_switch else "OFF",
             "light_state": "ON" if self.light_on else "OFF",
-            "updated_at": self.updated_at.isoformat(),
+            "updated_at": self.updated_at_iso,
             "last_color": self.last_command_color,
             "last_brightness": self.last_brightness,
         }
         if self.override:
             data["override"] = self.override.to_payload()
+        if self.suspended:
+            data["suspended"] = [
+                {"kind": paused.kind, "remaining_seconds": paused.duration_seconds} for paused in self.suspended
+            ]
         return data
 
     def _evolve(
@@ -178,31 +361,44 @@ class ControlMode:
         pilot_switch: Any = _UNSET,
         light_on: Any = _UNSET,
         override: Any = _UNSET,
+        suspended: Any = _UNSET,
         last_command_color: Any = _UNSET,
         last_brightness: Any = _UNSET,
         timestamp: Optional[datetime] = None,
+        updated_ns: Optional[int] = None,
     ) -> ControlMode:
         pilot_value: bool = self.pilot_switch if pilot_switch is _UNSET else bool(pilot_switch)
         light_value: bool = self.light_on if light_on is _UNSET else bool(light_on)
-        override_value: OverrideAction | None
-        if override is _UNSET:
-            override_value = self.override
-        else:
-            override_value = override
+        override_value: OverrideAction | None = self.override if override is _UNSET else override
+        suspended_value: Tuple[OverrideAction, ...] = self.suspended if suspended is _UNSET else suspended
         color_value: RGB = self.last_command_color if last_command_color is _UNSET else last_command_color
         brightness_value: int = (
             self.last_brightness if last_brightness is _UNSET else _clamp_brightness(last_brightness, fallback=self.last_brightness)
         )
-        new_state = _derive_state(pilot_value, light_value, override_value)
-        return ControlMode(
-            state=new_state,
-            pilot_switch=pilot_value,
-            light_on=light_value,
-            last_command_color=color_value,
-            last_brightness=brightness_value,
-            updated_at=timestamp or _now(),
-            override=override_value,
+        if (
+            pilot_value is self.pilot_switch
+            and light_value is self.light_on
+            and override_value is self.override
+            and (suspended_value is self.suspended or suspended_value == self.suspended)
+            and brightness_value == self.last_brightness
+            and color_value == self.last_command_color
+        ):
+            # Transition sans effet : même version, aucune allocation
+            return self
+        if updated_ns is None:
+            updated_ns = time.monotonic_ns() if timestamp is None else to_monotonic_ns(timestamp)
+        version = ControlMode.__new__(ControlMode)
+        version._assign(
+            _derive_state(pilot_value, light_value, override_value),
+            pilot_value,
+            light_value,
+            color_value,
+            brightness_value,
+            updated_ns,
+            override_value,
+            suspended_value,
         )
+        return version
 
 
 def _derive_state(pilot_switch: bool, light_on: bool, override: Optional[OverrideAction]) -> Mode:
@@ -211,6 +407,18 @@ def _derive_state(pilot_switch: bool, light_on: bool, override: Optional[Overrid
     return Mode.PILOT if pilot_switch else Mode.LOGI
 
 
+def _enqueue(queue: Tuple[OverrideAction, ...], paused: Optional[OverrideAction]) -> Tuple[OverrideAction, ...]:
+    """Add ``paused`` to the queue, one entry per kind (the longer one wins), most severe first."""
+    if paused is None:
+        return queue
+    entries = [entry for entry in queue if entry.kind != paused.kind]
+    for entry in queue:
+        if entry.kind == paused.kind and entry.duration_seconds > paused.duration_seconds:
+            paused = entry
+    entries.append(paused)
+    return tuple(sorted(entries, key=lambda entry: -OVERRIDE_PRIORITY[entry.kind]))
+
+
 def _clamp_brightness(value: Optional[int], *, fallback: int) -> int:
     if value is None:
         return fallback
@@ -0,0 +1,163 @@
+"""Prioritised command dispatch: overrides jump ahead of queued light traffic."""
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from lightspeed.metrics import MetricsRegistry, Timing
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any, float], None]
+Entry = Tuple[Any, float]
+
+
+class Lane(IntEnum):
+    """Priority classes, lowest value served first."""
+
+    OVERRIDE = 0
+    LIGHT = 1
+
+
+class TokenBucket:
+    """Admission control: ``rate`` tokens per second, at most ``burst`` banked.
+
+    Safe to share between threads (network loop and local command channel).
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at", "_clock", "_lock")
+
+    def __init__(self, rate: float, burst: int, *, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self.tokens = float(burst)
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+class CommandDispatcher:
+    """Serves commands from one worker thread, override lane first.
+
+    Override commands (alert/warning/info) are kept in FIFO order and never
+    dropped. Light commands sharing a ``coalesce_key`` replace the pending
+    one, which moves to the back of the lane so cross-topic ordering holds.
+    Until :meth:`start` is called, commands run inline in the caller's thread.
+    """
+
+    def __init__(self, handler: Handler, *, metrics: MetricsRegistry, name: str = "dispatch") -> None:
+        self._handler = handler
+        self.metrics = metrics
+        self.name = name
+        self._condition = threading.Condition()
+        self._overrides: Deque[Entry] = deque()
+        self._light: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self._sequence = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Métriques résolues une fois par voie : pas de recherche dans le registre par commande
+        self._timings: Dict[Lane, Tuple[Timing, Timing]] = {}
+        self._latency: Optional[Timing] = None
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._overrides) + len(self._light)
+
+    def depths(self) -> Dict[str, int]:
+        """Queued commands per lane."""
+        with self._condition:
+            return {Lane.OVERRIDE.name.lower(): len(self._overrides), Lane.LIGHT.name.lower(): len(self._light)}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"commands-{self.name}")
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        thread.join(timeout)
+        self._thread = None
+
+    def submit(
+        self,
+        message: Any,
+        lane: Lane,
+        *,
+        received_at: float,
+        coalesce_key: Optional[Hashable] = None,
+    ) -> None:
+        if self._thread is None:
+            self._handler(message, received_at)
+            return
+        with self._condition:
+            if lane is Lane.OVERRIDE:
+                self._overrides.append((message, received_at))
+            else:
+                key = coalesce_key if coalesce_key is not None else ("seq", next(self._sequence))
+                if self._light.pop(key, None) is not None:
+                    self.metrics.counter("commands_coalesced").inc()
+                self._light[key] = (message, received_at)
+            self._condition.notify()
+
+    def _next(self) -> Optional[Tuple[Lane, Entry]]:
+        with self._condition:
+            while not (self._overrides or self._light or self._stopping):
+                self._condition.wait()
+            if self._overrides:
+                return Lane.OVERRIDE, self._overrides.popleft()
+            if self._light:
+                return Lane.LIGHT, self._light.popitem(last=False)[1]
+            return None
+
+    def _run(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            lane, (message, received_at) = item
+            timings = self._timings.get(lane)
+            if timings is None:
+                lane_name = lane.name.lower()
+                timings = self._timings[lane] = (
+                    self.metrics.timing("command_queue_seconds", lane=lane_name),
+                    self.metrics.timing("command_handler_seconds", lane=lane_name),
+                )
+            queue_timing, handler_timing = timings
+            started = time.monotonic()
+            queue_timing.observe(started - received_at)
+            try:
+                self._handler(message, received_at)
+            except Exception:  # pragma: no cover - defensive logging
+                logger.exception("Erreur de traitement de commande", extra={"topic": getattr(message, "topic", None)})
+            finished = time.monotonic()
+            handler_timing.observe(finished - started)
+            # Réception → fin de traitement, par device (capteur de diagnostic HA)
+            if self._latency is None:
+                self._latency = self.metrics.timing("command_latency_seconds", device=self.name)
+            self._latency.observe(finished - received_at)
@@ -0,0 +1,155 @@
+"""Broker health probing and selection for the failover list."""
+from __future__ import annotations
+
+import logging
+import socket
+import struct
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from lightspeed.config import BrokerEndpoint, MqttSettings
+from lightspeed.tls import ResumingSSLContext
+
+logger = logging.getLogger(__name__)
+
+_CONNACK = 0x20
+_DISCONNECT = b"\xe0\x00"
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    endpoint: BrokerEndpoint
+    healthy: bool
+    connect_seconds: Optional[float] = None
+    rtt_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def latency(self) -> float:
+        """TCP connect + MQTT CONNECT/CONNACK round trip (``inf`` when unhealthy)."""
+        if not self.healthy:
+            return float("inf")
+        return (self.connect_seconds or 0.0) + (self.rtt_seconds or 0.0)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def build_connect_packet(client_id: str, *, username: Optional[str], password: Optional[str], keepalive: int) -> bytes:
+    """MQTT 3.1.1 CONNECT with a clean session (the probe never keeps state on the broker)."""
+    flags = 0x02
+    payload = _encode_string(client_id)
+    if username:
+        flags |= 0x80
+        payload += _encode_string(username)
+        if password:
+            flags |= 0x40
+            payload += _encode_string(password)
+    variable = _encode_string("MQTT") + struct.pack("!BBH", 4, flags, keepalive)
+    body = variable + payload
+    return bytes([0x10]) + _encode_length(len(body)) + body
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connexion fermée par le broker")
+        data += chunk
+    return data
+
+
+def probe_broker(
+    endpoint: BrokerEndpoint,
+    settings: MqttSettings,
+    *,
+    timeout: float,
+    clock: Callable[[], float] = time.perf_counter,
+    ssl_context: Optional[ResumingSSLContext] = None,
+) -> ProbeResult:
+    """Measure TCP connect time and the CONNECT→CONNACK round trip of ``endpoint``.
+
+    With ``ssl_context`` the connect time includes the TLS handshake, and the
+    session obtained is kept for the real connection to resume.
+    """
+    client_id = f"{settings.client_id}-probe-{uuid.uuid4().hex[:8]}"
+    packet = build_connect_packet(
+        client_id,
+        username=settings.username,
+        password=settings.password,
+        keepalive=max(1, int(timeout) + 1),
+    )
+    started = clock()
+    try:
+        with socket.create_connection((endpoint.host, endpoint.port), timeout=timeout) as raw:
+            sock = raw
+            if ssl_context is not None:
+                sock = ssl_context.wrap_socket(raw, server_hostname=endpoint.host)
+            connected = clock()
+            sock.sendall(packet)
+            header, remaining, _flags, code = _recv_exact(sock, 4)
+            answered = clock()
+            if ssl_context is not None:
+                ssl_context.remember(sock)
+            try:
+                sock.sendall(_DISCONNECT)
+            except OSError:
+                pass
+    except (OSError, ConnectionError, ValueError) as exc:
+        return ProbeResult(endpoint=endpoint, healthy=False, error=str(exc) or type(exc).__name__)
+    if header != _CONNACK or remaining != 2:
+        return ProbeResult(endpoint=endpoint, healthy=False, error="réponse CONNACK invalide")
+    if code != 0:
+        return ProbeResult(endpoint=endpoint, healthy=False, error=f"CONNACK refusé ({code})")
+    return ProbeResult(
+        endpoint=endpoint,
+        healthy=True,
+        connect_seconds=connected - started,
+        rtt_seconds=answered - connected,
+    )
+
+
+def probe_all(
+    endpoints: Sequence[BrokerEndpoint],
+    settings: MqttSettings,
+    *,
+    timeout: float,
+    ssl_context: Optional[ResumingSSLContext] = None,
+) -> List[ProbeResult]:
+    """Probe every endpoint in parallel; results keep the configured order."""
+    if not endpoints:
+        return []
+    with ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="mqtt-probe") as pool:
+        return list(
+            pool.map(
+                lambda endpoint: probe_broker(endpoint, settings, timeout=timeout, ssl_context=ssl_context),
+                endpoints,
+            )
+        )
+
+
+def choose_endpoint(results: Sequence[ProbeResult], *, primary: BrokerEndpoint, margin_seconds: float) -> Optional[BrokerEndpoint]:
+    """Fastest healthy broker; the primary wins while within ``margin_seconds`` of it."""
+    healthy = [result for result in results if result.healthy]
+    if not healthy:
+        return None
+    fastest = min(healthy, key=lambda result: result.latency)
+    for result in healthy:
+        if result.endpoint == primary and result.latency <= fastest.latency + margin_seconds:
+            return primary
+    return fastest.endpoint
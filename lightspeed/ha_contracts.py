@@ -1,13 +1,20 @@
 """Home Assistant discovery payload generators."""
 from __future__ import annotations
 
+import hashlib
 import json
-from dataclasses import dataclass
-from typing import Iterable
+import math
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
 
-from lightspeed.config import ConfigProfile
+from lightspeed.config import ConfigProfile, HomeAssistantSettings, TopicMap
+from lightspeed.performance import SDK_STATUSES
 
 DISCOVERY_PREFIX = "homeassistant"
+LIGHT_EFFECTS = ("alert", "warning", "info")
+# device_id -> (empreinte, payloads) : dernière version de chaque device seulement
+_DISCOVERY_CACHE: Dict[str, Tuple[str, Tuple["DiscoveryMessage", ...]]] = {}
 
 
 @dataclass(frozen=True)
@@ -16,6 +23,10 @@ class DiscoveryMessage:
     payload: str
     retain: bool = True
 
+    def matches(self, retained: bytes | None) -> bool:
+        """Return True when the broker's retained copy equals this payload."""
+        return retained is not None and retained == self.payload.encode("utf-8")
+
 
 def _device_descriptor(profile: ConfigProfile) -> dict:
     device = profile.home_assistant
@@ -28,11 +39,93 @@ def _device_descriptor(profile: ConfigProfile) -> dict:
     }
 
 
+def _light_component(profile: ConfigProfile, device_name: str) -> dict:
+    ha = profile.home_assistant
+    topics = profile.topics
+    light = {
+        "platform": "light",
+        "unique_id": f"{ha.device_id}_light",
+        "object_id": f"{ha.device_id}_light",
+        "name": f"{device_name} Éclairage",
+        "optimistic": False,
+        "state_topic": topics.state_topic,
+    }
+    if ha.light_schema == "json":
+        # Schéma JSON : un seul message porte état, couleur, luminosité, transition et effet
+        light.update({
+            "schema": "json",
+            "command_topic": topics.json_command_topic,
+            "supported_color_modes": ["rgb"],
+            "brightness": True,
+            "effect": True,
+            "effect_list": list(LIGHT_EFFECTS),
+        })
+        return light
+    light.update({
+        "state_value_template": "{{ value_json.state }}",
+        "command_topic": topics.command_topic,
+        "payload_on": "on",
+        "payload_off": "off",
+        "rgb_command_topic": topics.rgb_command_topic,
+        "rgb_value_template": "{{ value_json.rgb | join(',') }}",
+        "brightness_command_topic": topics.brightness_command_topic,
+        "brightness_value_template": "{{ value_json.brightness }}",
+    })
+    return light
+
+
+def _performance_components(profile: ConfigProfile, device_name: str) -> dict:
+    """Diagnostic sensors, all reading the one document published on ``performance_topic``."""
+    ha = profile.home_assistant
+    topic = profile.topics.performance_topic
+    # Sans publication pendant trois intervalles, HA affiche les capteurs comme indisponibles
+    expire_after = math.ceil(ha.metrics_interval_seconds * 3)
+
+    def sensor(key: str, name: str, field: str, **extra) -> dict:
+        return {
+            "platform": "sensor",
+            "unique_id": f"{ha.device_id}_{key}",
+            "object_id": f"{ha.device_id}_{key}",
+            "name": f"{device_name} {name}",
+            "state_topic": topic,
+            "value_template": f"{{{{ value_json.{field} }}}}",
+            "entity_category": "diagnostic",
+            "expire_after": expire_after,
+            **extra,
+        }
+
+    return {
+        "command_latency_sensor": sensor(
+            "command_latency", "Latence commandes p95", "command_latency_p95_ms",
+            device_class="duration", unit_of_measurement="ms", state_class="measurement",
+        ),
+        "device_writes_sensor": sensor(
+            "device_writes", "Écritures clavier", "device_writes_per_second",
+            unit_of_measurement="writes/s", state_class="measurement", icon="mdi:keyboard",
+        ),
+        "effect_fps_sensor": sensor(
+            "effect_fps", "Effet FPS", "effect_fps",
+            unit_of_measurement="fps", state_class="measurement", icon="mdi:animation-play",
+        ),
+        "sdk_sensor": sensor(
+            "sdk", "SDK", "sdk_status",
+            device_class="enum", options=list(SDK_STATUSES), icon="mdi:chip",
+            json_attributes_topic=topic,
+        ),
+        "queue_depth_sensor": sensor(
+            "queue_depth", "File de commandes", "queue_depth",
+            state_class="measurement", icon="mdi:tray-full",
+        ),
+    }
+
+
 def iter_discovery_messages(profile: ConfigProfile) -> Iterable[DiscoveryMessage]:
     device = _device_descriptor(profile)
     ha = profile.home_assistant
     topics = profile.topics
     
+    state_on, state_off = ("ON", "OFF") if ha.light_schema == "json" else ("on", "off")
+
     availability = [
         {
             "topic": topics.lwt,
@@ -42,30 +135,15 @@ def iter_discovery_messages(profile: ConfigProfile) -> Iterable[DiscoveryMessage
     ]
     
     components = {
-        "light": {
-            "platform": "light",
-            "unique_id": f"{ha.device_id}_light",
-            "object_id": f"{ha.device_id}_light",
-            "name": f"{device['name']} Éclairage",
-            "optimistic": False,
-            "state_topic": topics.state_topic,
-            "state_value_template": "{{ value_json.state }}",
-            "command_topic": topics.command_topic,
-            "payload_on": "on",
-            "payload_off": "off",
-            "rgb_command_topic": topics.rgb_command_topic,
-            "rgb_value_template": "{{ value_json.rgb | join(',') }}",
-            "brightness_command_topic": topics.brightness_command_topic,
-            "brightness_value_template": "{{ value_json.brightness }}",
-        },
+        "light": _light_component(profile, device["name"]),
         "status_sensor": {
             "platform": "binary_sensor",
             "unique_id": f"{ha.device_id}_status",
             "object_id": f"{ha.device_id}_status",
             "name": f"{device['name']} Statut",
             "state_topic": topics.state_topic,
-            "payload_on": "on",
-            "payload_off": "off",
+            "payload_on": state_on,
+            "payload_off": state_off,
             "value_template": "{{ value_json.state }}",
             "json_attributes_topic": topics.state_topic,
         },
@@ -109,6 +187,9 @@ def iter_discovery_messages(profile: ConfigProfile) -> Iterable[DiscoveryMessage
         },
     }
     
+    if ha.metrics_interval_seconds > 0:
+        components.update(_performance_components(profile, device["name"]))
+
     payload = {
         "device": device,
         "origin": {"name": device["name"]},
@@ -119,3 +200,38 @@ def iter_discovery_messages(profile: ConfigProfile) -> Iterable[DiscoveryMessage
     topic = f"{DISCOVERY_PREFIX}/device/{ha.device_id}/config"
     
     return [DiscoveryMessage(topic=topic, payload=json.dumps(payload, separators=(",", ":")))]
+
+
+def discovery_fingerprint(profile: ConfigProfile) -> str:
+    """Return a content hash of the profile fields that shape discovery payloads.
+
+    Memoized on the (frozen, hashable) ``home_assistant`` and ``topics``
+    sections: later (re)connections skip the ``asdict`` deep copy and hash.
+    """
+    return _fingerprint(profile.home_assistant, profile.topics, profile.schema_revision())
+
+
+@lru_cache(maxsize=64)
+def _fingerprint(home_assistant: HomeAssistantSettings, topics: TopicMap, schema_revision: str) -> str:
+    blueprint = {
+        "home_assistant": asdict(home_assistant),
+        "topics": asdict(topics),
+        "schema_revision": schema_revision,
+    }
+    payload = json.dumps(blueprint, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def cached_discovery_messages(profile: ConfigProfile) -> Tuple[DiscoveryMessage, ...]:
+    """Serialize discovery payloads once per profile fingerprint.
+
+    Only the latest fingerprint of each device is kept, so the cache stays
+    bounded by the number of devices.
+    """
+    key = discovery_fingerprint(profile)
+    cached = _DISCOVERY_CACHE.get(profile.home_assistant.device_id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    messages = tuple(iter_discovery_messages(profile))
+    _DISCOVERY_CACHE[profile.home_assistant.device_id] = (key, messages)
+    return messages
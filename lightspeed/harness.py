@@ -0,0 +1,556 @@
+"""In-process MQTT broker and load generator for :class:`MqttLightingService`.
+
+:class:`FakeBroker` hands out paho-compatible clients (``client_factory``)
+that exchange messages in memory: topic filters, retained copies delivered
+on subscribe ahead of later publications, loopback to the publisher and one
+delivery thread per client, like paho's network loop. With the recording
+:class:`~lightspeed.backends.SimulatedLightingController`, the whole service
+runs without a broker or the Logitech SDK.
+
+:func:`run_load` drives such a service with a paced mix of commands, each
+carrying a unique color, and matches device writes back to the commands to
+report throughput, receipt-to-write latency and the commands that never
+reached the device (coalesced, rejected, expired or superseded).
+:func:`run_replay` feeds a :mod:`lightspeed.capture` file to every device
+instead, on any backend, and returns the device-write trace.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import paho.mqtt.client as mqtt
+
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.capture import CapturedCommand, read_capture, replay
+from lightspeed.codec import encode_rgb
+from lightspeed.config import ConfigProfile
+from lightspeed.connection import MqttConnection
+from lightspeed.metrics import MetricsRegistry, Timing
+from lightspeed.mqtt import MqttLightingService, build_device_services
+
+logger = logging.getLogger(__name__)
+
+RGB = Tuple[int, int, int]
+Tap = Callable[[str, mqtt.MQTTMessage], None]
+
+LOAD_KINDS = ("rgb", "binary", "json", "brightness", "alert")
+DEFAULT_MIX: Mapping[str, float] = {"rgb": 0.6, "binary": 0.2, "json": 0.1, "brightness": 0.1}
+_STOP = object()
+
+
+def _payload_bytes(payload: Any) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, bytearray):
+        return bytes(payload)
+    return str(payload).encode("utf-8")
+
+
+class FakeBroker:
+    """Routes publications between the clients it created; nothing leaves the process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._clients: List[FakeMqttClient] = []
+        self._retained: Dict[str, Tuple[bytes, int, Any]] = {}
+        self._mids = itertools.count(1)
+        # Observes every delivery: (receiving client id, message), from the delivering thread
+        self.tap: Optional[Tap] = None
+
+    def client(self, client_id: str = "", clean_session: Optional[bool] = None, protocol: int = mqtt.MQTTv311, **_kwargs: Any) -> FakeMqttClient:
+        """``client_factory`` for :class:`~lightspeed.connection.MqttConnection`."""
+        return FakeMqttClient(self, client_id=client_id, protocol=protocol)
+
+    def retained(self, topic: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._retained.get(topic)
+        return None if entry is None else entry[0]
+
+    def next_mid(self) -> int:
+        return next(self._mids)
+
+    def attach(self, client: FakeMqttClient) -> None:
+        with self._lock:
+            if client not in self._clients:
+                self._clients.append(client)
+
+    def detach(self, client: FakeMqttClient) -> None:
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def subscribe(self, client: FakeMqttClient, filters: Sequence[str]) -> None:
+        """Register ``filters`` and queue the matching retained copies, before any later publication."""
+        with self._lock:
+            client.filters.update(filters)
+            for topic, (payload, qos, properties) in self._retained.items():
+                if any(mqtt.topic_matches_sub(topic_filter, topic) for topic_filter in filters):
+                    client.deliver(self._message(topic, payload, qos, retain=True, properties=properties))
+
+    def publish(self, topic: str, payload: bytes, qos: int, retain: bool, properties: Any) -> None:
+        with self._lock:
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, qos, properties)
+                else:
+                    self._retained.pop(topic, None)
+            for client in self._clients:
+                if any(mqtt.topic_matches_sub(topic_filter, topic) for topic_filter in client.filters):
+                    client.deliver(self._message(topic, payload, qos, retain=False, properties=properties))
+
+    def _message(self, topic: str, payload: bytes, qos: int, *, retain: bool, properties: Any) -> mqtt.MQTTMessage:
+        message = mqtt.MQTTMessage(mid=self.next_mid(), topic=topic.encode("utf-8"))
+        message.payload = payload
+        message.qos = qos
+        message.retain = retain
+        message.properties = properties
+        return message
+
+
+class FakeMqttClient:
+    """The subset of ``paho.mqtt.client.Client`` used by this package, backed by a :class:`FakeBroker`.
+
+    Callbacks run on the client's own delivery thread once :meth:`loop_start`
+    has been called, in the order the broker queued them.
+    """
+
+    def __init__(self, broker: FakeBroker, *, client_id: str = "", protocol: int = mqtt.MQTTv311) -> None:
+        self.broker = broker
+        self.client_id = client_id
+        self.v5 = protocol == mqtt.MQTTv5
+        self.filters: set[str] = set()
+        self.connected = False
+        self.on_connect: Optional[Callable[..., None]] = None
+        self.on_disconnect: Optional[Callable[..., None]] = None
+        self.on_connect_fail: Optional[Callable[..., None]] = None
+        self.on_message: Optional[Callable[..., None]] = None
+        self.on_subscribe: Optional[Callable[..., None]] = None
+        self.will: Optional[Tuple[str, bytes, int, bool]] = None
+        self.endpoint: Optional[Tuple[str, int]] = None
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._connecting = False
+
+    def username_pw_set(self, username: str, password: Optional[str] = None) -> None:
+        pass
+
+    def will_set(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False, properties: Any = None) -> None:
+        self.will = (topic, _payload_bytes(payload), qos, retain)
+
+    def reconnect_delay_set(self, min_delay: float = 1, max_delay: float = 120) -> None:
+        pass
+
+    def tls_set_context(self, context: Any = None) -> None:
+        pass
+
+    def tls_insecure_set(self, value: bool) -> None:
+        pass
+
+    def socket(self) -> None:
+        return None
+
+    def connect_async(self, host: str, port: int = 1883, keepalive: int = 60, **_kwargs: Any) -> None:
+        self.endpoint = (host, port)
+
+    def connect(self, host: str, port: int = 1883, keepalive: int = 60, **kwargs: Any) -> int:
+        self.connect_async(host, port, keepalive, **kwargs)
+        self._request_connect()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self) -> None:
+        if self._thread is not None:
+            return
+        self._request_connect()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"fake-mqtt-{self.client_id}")
+        self._thread.start()
+
+    def loop_stop(self) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        self._queue.put(_STOP)
+        if thread is not threading.current_thread():
+            thread.join(2.0)
+
+    def disconnect(self, *_args: Any, **_kwargs: Any) -> int:
+        if not self.connected:
+            return mqtt.MQTT_ERR_NO_CONN
+        self.connected = False
+        self.broker.detach(self)
+        self.filters.clear()
+        self._callback(self.on_disconnect, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False, properties: Any = None) -> mqtt.MQTTMessageInfo:
+        info = mqtt.MQTTMessageInfo(self.broker.next_mid())
+        if not self.connected:
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+            return info
+        self.broker.publish(topic, _payload_bytes(payload), qos, retain, properties)
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        info._set_as_published()
+        return info
+
+    def subscribe(self, topic: Any, qos: int = 0, **_kwargs: Any) -> Tuple[int, int]:
+        entries = [(topic, qos)] if isinstance(topic, str) else list(topic)
+        filters = [topic_filter for topic_filter, _ in entries]
+        granted = [granted_qos for _, granted_qos in entries]
+        mid = self.broker.next_mid()
+        # SUBACK avant les copies retained, comme un vrai broker
+        self._queue.put(lambda: self._callback(self.on_subscribe, mid, granted))
+        self.broker.subscribe(self, filters)
+        return mqtt.MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic: Any, **_kwargs: Any) -> Tuple[int, int]:
+        for topic_filter in [topic] if isinstance(topic, str) else topic:
+            self.filters.discard(topic_filter)
+        return mqtt.MQTT_ERR_SUCCESS, self.broker.next_mid()
+
+    def deliver(self, message: mqtt.MQTTMessage) -> None:
+        """Called by the broker, under its lock: queue ``message`` for the delivery thread."""
+        self._queue.put(message)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _request_connect(self) -> None:
+        if not self.connected and not self._connecting:
+            self._connecting = True
+            self._queue.put(self._handle_connect)
+
+    def _handle_connect(self) -> None:
+        self._connecting = False
+        self.connected = True
+        self.broker.attach(self)
+        self._callback(self.on_connect, {"session present": 0}, 0)
+
+    def _callback(self, callback: Optional[Callable[..., None]], *args: Any) -> None:
+        if callback is None:
+            return
+        if self.v5:
+            callback(self, None, *args, None)
+        else:
+            callback(self, None, *args)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                if callable(item):
+                    item()
+                    continue
+                item.timestamp = time.monotonic()
+                tap = self.broker.tap
+                if tap is not None:
+                    tap(self.client_id, item)
+                if self.on_message is not None:
+                    self.on_message(self, None, item)
+            except Exception:  # pragma: no cover - defensive logging
+                logger.exception("Erreur dans un callback du client MQTT simulé", extra={"client_id": self.client_id})
+
+
+@dataclass(frozen=True)
+class LoadReport:
+    """Outcome of :func:`run_load`; latencies in seconds, from receipt by the service to the device write."""
+
+    duration_seconds: float
+    offered_rate: float
+    sent: Dict[str, int]
+    handled: int
+    throughput_per_second: float
+    written: int
+    latency_seconds: Dict[str, float]
+    coalesced: int
+    rejected: int
+    expired: int
+    unwritten: int
+    drained: bool = True
+    counters: Dict[str, int] = field(default_factory=dict)
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """``"rgb=0.7,binary=0.3"`` → weights; unknown kinds raise :class:`ValueError`."""
+    mix: Dict[str, float] = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        kind = kind.strip().lower()
+        if kind not in LOAD_KINDS:
+            raise ValueError(f"Type de commande inconnu: {kind} (attendu: {', '.join(LOAD_KINDS)})")
+        mix[kind] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Mélange de commandes vide")
+    return mix
+
+
+def _unique_color(index: int) -> RGB:
+    value = index % 0xFFFFFF + 1
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+
+def _command(profile: ConfigProfile, kind: str, color: RGB) -> Tuple[str, bytes]:
+    topics = profile.topics
+    if kind == "rgb":
+        return topics.rgb_command_topic, "{},{},{}".format(*color).encode("utf-8")
+    if kind == "binary":
+        return topics.binary_command_topic, encode_rgb(color)
+    if kind == "json":
+        r, g, b = color
+        return topics.json_command_topic, json.dumps({"color": {"r": r, "g": g, "b": b}}).encode("utf-8")
+    if kind == "brightness":
+        # Toujours 255 : la couleur écrite reste celle de la dernière commande
+        return topics.brightness_command_topic, b"255"
+    return topics.alert_command_topic, b""
+
+
+def _offline_profile(profile: ConfigProfile) -> ConfigProfile:
+    """One in-memory broker: no failover, TLS, local channel, command capture, journal or metrics endpoint."""
+    return replace(
+        profile,
+        mqtt=replace(profile.mqtt, fallback_brokers=(), tls=replace(profile.mqtt.tls, enabled=False)),
+        ipc=replace(profile.ipc, enabled=False),
+        observability=replace(profile.observability, capture_file=None, journal_file=None, metrics_port=None),
+    )
+
+
+def _load_profile(profile: ConfigProfile) -> ConfigProfile:
+    """First device only, on the simulated backend."""
+    return _offline_profile(profile.for_device(replace(profile.devices[0], backend="simulated")))
+
+
+def _wait_until(predicate: Callable[[], bool], timeout: float, *, interval: float = 0.01) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def run_load(
+    profile: ConfigProfile,
+    *,
+    rate: float,
+    duration: float,
+    mix: Optional[Mapping[str, float]] = None,
+    seed: Optional[int] = None,
+    drain_timeout: float = 30.0,
+) -> LoadReport:
+    """Run the first device of ``profile`` on a :class:`FakeBroker` and load it for ``duration`` seconds.
+
+    Commands are published at ``rate`` per second on absolute deadlines (a late
+    publisher catches up instead of lowering the rate), then the service is
+    given ``drain_timeout`` seconds to empty its queues.
+    """
+    if rate <= 0 or duration <= 0:
+        raise ValueError("rate et duration doivent être positifs")
+    weights = dict(mix or DEFAULT_MIX)
+    kinds = list(weights)
+    rng = random.Random(seed)
+    profile = _load_profile(profile)
+    broker = FakeBroker()
+    metrics = MetricsRegistry()
+    controller = SimulatedLightingController("loadtest", max_writes=None)
+    connection = MqttConnection(profile, metrics=metrics, client_factory=broker.client)
+    service = MqttLightingService(
+        controller,
+        profile,
+        validated_at=datetime.now(timezone.utc),
+        connection=connection,
+    )
+    service_id = profile.mqtt.client_id
+    command_topics = service.command_topics()
+    received: Dict[bytes, int] = {}
+
+    def tap(client_id: str, message: mqtt.MQTTMessage) -> None:
+        if client_id == service_id and message.topic in command_topics:
+            received[message.payload] = time.monotonic_ns()
+
+    broker.tap = tap
+    publisher = broker.client(client_id=f"{service_id}-loadgen")
+    sent = {kind: 0 for kind in kinds}
+    expected: Dict[RGB, bytes] = {}
+    try:
+        controller.start()
+        service.dispatcher.start()
+        connection.start()
+        if not _wait_until(lambda: service.bootstrapped, 5.0):
+            raise TimeoutError("Le service simulé n'a pas terminé sa synchronisation")
+        publisher.loop_start()
+        _wait_until(lambda: publisher.connected, 5.0)
+        first_write = len(controller.writes)
+        total = max(1, int(rate * duration))
+        interval = 1.0 / rate
+        started = time.monotonic()
+        for index in range(total):
+            delay = started + index * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            kind = rng.choices(kinds, weights=[weights[k] for k in kinds])[0]
+            color = _unique_color(index)
+            topic, payload = _command(profile, kind, color)
+            if kind in ("rgb", "binary", "json"):
+                expected[color] = payload
+            publisher.publish(topic, payload, qos=1)
+            sent[kind] += 1
+        sent_seconds = time.monotonic() - started
+        delivery = connection.client
+        drained = _wait_until(
+            lambda: delivery.pending() == 0 and service.dispatcher.pending() == 0,
+            drain_timeout,
+        )
+        finished = time.monotonic()
+    finally:
+        publisher.disconnect()
+        publisher.loop_stop()
+        connection.close()
+
+    latency = Timing(window=max(1, len(expected)))
+    written = 0
+    for written_ns, color in controller.writes[first_write:]:
+        payload = expected.pop(color, None)
+        if payload is None or payload not in received:
+            continue
+        written += 1
+        latency.observe(max(0, written_ns - received[payload]) / 1e9)
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    handled = sum(
+        timing["count"] for name, timing in snapshot["timings"].items() if name.startswith("command_handler_seconds")
+    )
+    return LoadReport(
+        duration_seconds=round(finished - started, 6),
+        offered_rate=round(sum(sent.values()) / sent_seconds, 3) if sent_seconds > 0 else 0.0,
+        sent=sent,
+        handled=handled,
+        throughput_per_second=round(handled / (finished - started), 3),
+        written=written,
+        latency_seconds={
+            "count": latency.count,
+            "p50": round(latency.percentile(0.50), 6),
+            "p95": round(latency.percentile(0.95), 6),
+            "p99": round(latency.percentile(0.99), 6),
+            "max": round(latency.maximum, 6),
+        },
+        coalesced=counters.get("commands_coalesced", 0),
+        rejected=sum(value for name, value in counters.items() if name.startswith("overrides_rejected")),
+        expired=counters.get("commands_expired", 0),
+        unwritten=len(expected),
+        drained=drained,
+        counters=counters,
+    )
+
+
+@dataclass(frozen=True)
+class TraceEntry:
+    """One device write during a replay; ``offset_seconds`` counts from the first replayed command."""
+
+    offset_seconds: float
+    device: str
+    color: RGB
+
+    def to_line(self) -> str:
+        return "{:.6f}\t{}\t#{:02X}{:02X}{:02X}".format(self.offset_seconds, self.device, *self.color)
+
+
+@dataclass(frozen=True)
+class ReplayReport:
+    commands: int
+    skipped: int
+    duration_seconds: float
+    drained: bool
+    trace: List[TraceEntry]
+
+
+def run_replay(
+    profile: ConfigProfile,
+    path: str,
+    *,
+    speed: Optional[float] = 1.0,
+    backend: Optional[str] = None,
+    drain_timeout: float = 60.0,
+) -> ReplayReport:
+    """Replay the capture at ``path`` into every device of ``profile``, on a :class:`FakeBroker`.
+
+    ``speed`` divides the recorded spacing (``None`` = as fast as possible);
+    ``backend`` overrides each device's backend. Commands whose topic belongs
+    to no device are skipped. Once fed, the replay waits for the queues to
+    drain and running effects to end, so traces of two runs cover the same
+    commands.
+    """
+    if backend is not None:
+        profile = replace(profile, devices=tuple(replace(device, backend=backend) for device in profile.devices))
+    profile = _offline_profile(profile)
+    broker = FakeBroker()
+    services = build_device_services(
+        profile,
+        validated_at=datetime.now(timezone.utc),
+        client_factory=broker.client,
+    )
+    connection = services[0].connection
+    routes = {topic: service for service in services for topic in service.command_topics()}
+    writes: List[Tuple[int, str, RGB]] = []
+    started_ns: List[int] = []
+    skipped = 0
+
+    def submit(command: CapturedCommand) -> None:
+        nonlocal skipped
+        service = routes.get(command.topic)
+        if service is None:
+            skipped += 1
+            return
+        if not started_ns:
+            started_ns.append(time.monotonic_ns())
+        service.handle_message(command.to_message())
+
+    def idle() -> bool:
+        return connection.client.pending() == 0 and all(
+            service.dispatcher.pending() == 0 and service.control.override is None for service in services
+        )
+
+    for service in services:
+        if hasattr(service.controller, "on_write"):
+            name = service.profile.devices[0].name
+            service.controller.on_write = lambda color, name=name: writes.append((time.monotonic_ns(), name, color))
+    try:
+        for service in services:
+            service.controller.start()
+            service.dispatcher.start()
+        connection.start()
+        if not _wait_until(lambda: all(service.bootstrapped for service in services), 5.0):
+            raise TimeoutError("Le service simulé n'a pas terminé sa synchronisation")
+        origin = time.monotonic()
+        count = replay(read_capture(path), submit, speed=speed)
+        drained = _wait_until(idle, drain_timeout)
+        finished = time.monotonic()
+    finally:
+        connection.close()
+
+    first_ns = started_ns[0] if started_ns else 0
+    trace = [
+        TraceEntry(offset_seconds=(written_ns - first_ns) / 1e9, device=device, color=tuple(color))
+        for written_ns, device, color in writes
+        if started_ns and written_ns >= first_ns
+    ]
+    return ReplayReport(
+        commands=count - skipped,
+        skipped=skipped,
+        duration_seconds=round(finished - origin, 6),
+        drained=drained,
+        trace=trace,
+    )
@@ -0,0 +1,186 @@
+"""Local command channel that bypasses the broker.
+
+Scripts on the same machine (build or CI notifiers) send commands over a Unix
+domain socket, or a named pipe on Windows, using ``multiprocessing.connection``
+framing. Each request is one frame::
+
+    <topic>\\n<payload bytes>
+
+``topic`` uses the MQTT command vocabulary: either a full command topic or one
+relative to the first device's ``topics.base`` (``alert``, ``rgb/set``,
+``light/set``...). The command goes through the same ``handle_message`` path
+as a broker message, so the device's state changes are still published to MQTT.
+The server replies ``OK`` once the command is queued, or ``ERR <reason>``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from multiprocessing.connection import Client, Listener, address_type
+from typing import Any, Dict, FrozenSet, Optional, Protocol, Sequence
+
+from lightspeed.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+REPLY_OK = b"OK"
+
+
+class IpcError(RuntimeError):
+    """Raised by :func:`send_command` when the server rejects a command."""
+
+
+@dataclass(frozen=True)
+class LocalMessage:
+    """Stand-in for a paho message: what the service's handlers read."""
+
+    topic: str
+    payload: bytes
+    retain: bool = False
+    properties: Any = None
+
+
+class CommandService(Protocol):
+    profile: Any
+
+    def command_topics(self) -> FrozenSet[str]: ...
+
+    def handle_message(self, message: Any) -> None: ...
+
+
+def encode_request(topic: str, payload: bytes | str = b"") -> bytes:
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return topic.encode("utf-8") + b"\n" + payload
+
+
+class LocalCommandServer:
+    """Accepts local clients and feeds their commands to the owning device service."""
+
+    def __init__(
+        self,
+        services: Sequence[CommandService],
+        address: str,
+        *,
+        metrics: Optional[MetricsRegistry] = None,
+    ) -> None:
+        if not services:
+            raise ValueError("Aucun device à exposer")
+        self.address = address
+        self.metrics = metrics or MetricsRegistry()
+        self._base = services[0].profile.topics.base
+        self._routes: Dict[str, CommandService] = {
+            topic: service for service in services for topic in service.command_topics()
+        }
+        self._listener: Optional[Listener] = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        family = address_type(self.address)
+        if family == "AF_UNIX":
+            self._remove_stale_socket()
+            # Créé directement en 0600 : pas de fenêtre où un autre utilisateur pourrait se connecter
+            previous_umask = os.umask(0o177)
+            try:
+                self._listener = Listener(self.address, family=family)
+            finally:
+                os.umask(previous_umask)
+        else:
+            self._listener = Listener(self.address, family=family)
+        self._thread = threading.Thread(target=self._serve, daemon=True, name="ipc-commands")
+        self._thread.start()
+        logger.info("Canal de commandes local ouvert", extra={"address": self.address})
+
+    def _remove_stale_socket(self) -> None:
+        """Supprime le socket d'une instance arrêtée brutalement; refuse si une instance répond."""
+        if not os.path.exists(self.address):
+            return
+        try:
+            Client(self.address).close()
+        except ConnectionRefusedError:
+            # Plus personne n'écoute : socket laissé par une instance arrêtée brutalement
+            os.unlink(self.address)
+            return
+        raise RuntimeError(
+            f"Le canal de commandes local {self.address} est déjà utilisé par une autre instance."
+        )
+
+    def close(self) -> None:
+        listener = self._listener
+        if listener is None or self._closed:
+            return
+        self._closed = True
+        try:
+            # Débloque accept() : fermer le listener depuis un autre thread ne suffit pas partout
+            Client(self.address).close()
+        except OSError:
+            pass
+        if self._thread is not None:
+            self._thread.join(1.0)
+        listener.close()
+
+    def resolve(self, topic: str) -> str:
+        """Full command topic for ``topic`` (relative names use the first device's base)."""
+        topic = topic.strip().strip("/")
+        if topic in self._routes:
+            return topic
+        return f"{self._base}/{topic}"
+
+    def handle_frame(self, frame: bytes) -> bytes:
+        header, _, payload = frame.partition(b"\n")
+        topic = self.resolve(header.decode("utf-8", errors="replace"))
+        service = self._routes.get(topic)
+        if service is None:
+            self.metrics.counter("ipc_rejected").inc()
+            return f"ERR topic de commande inconnu: {topic}".encode("utf-8")
+        self.metrics.counter("ipc_commands").inc()
+        service.handle_message(LocalMessage(topic=topic, payload=payload))
+        return REPLY_OK
+
+    def _serve(self) -> None:
+        assert self._listener is not None
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                logger.exception("Erreur du canal de commandes local")
+                continue
+            if self._closed:
+                conn.close()
+                return
+            threading.Thread(target=self._handle_connection, args=(conn,), daemon=True, name="ipc-client").start()
+
+    def _handle_connection(self, conn: Any) -> None:
+        with conn:
+            while not self._closed:
+                try:
+                    frame = conn.recv_bytes()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = self.handle_frame(frame)
+                except Exception as exc:  # pragma: no cover - defensive logging
+                    logger.exception("Commande locale en erreur")
+                    reply = f"ERR {exc}".encode("utf-8")
+                try:
+                    conn.send_bytes(reply)
+                except OSError:
+                    return
+
+
+def send_command(address: str, topic: str, payload: bytes | str = b"", *, timeout: float = 2.0) -> None:
+    """Send one command to a running :class:`LocalCommandServer`; raises :class:`IpcError` if refused."""
+    with Client(address) as conn:
+        conn.send_bytes(encode_request(topic, payload))
+        if not conn.poll(timeout):
+            raise TimeoutError(f"Pas de réponse du canal local après {timeout} s")
+        reply = conn.recv_bytes()
+    if reply != REPLY_OK:
+        raise IpcError(reply.decode("utf-8", errors="replace").removeprefix("ERR "))
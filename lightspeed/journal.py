@@ -0,0 +1,295 @@
+"""Always-on flight recorder: a fixed-size, memory-mapped ring of binary records.
+
+The journal file is a header followed by ``capacity`` slots of
+:data:`RECORD_SIZE` bytes. Every ``ControlMode`` transition, received command
+and device write is packed into the next slot with ``struct.pack_into`` on a
+shared mapping: no system call and no allocation beyond the packed fields, so
+recording stays in the sub-microsecond range and survives a crash of the
+process (the kernel owns the dirty pages). Slots carry a global sequence
+number; once the ring wraps, the oldest records are overwritten.
+
+Record layout (little endian, 64 bytes)::
+
+    Q sequence (0 = empty slot)   Q monotonic ns
+    B kind   B device index   H code   I value   40s data
+
+``read_journal`` decodes a file, typically with ``simple-logi.py journal``
+after an incident. Reopening an existing journal resumes after its last
+sequence, so a restart does not erase the records of the previous run.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from lightspeed.control_mode import Mode
+
+MAGIC = b"LSJRNL\x01\x00"
+# magic, taille d'enregistrement, taille d'en-tête, capacité, horloge murale − monotone de la session courante
+_HEADER = struct.Struct("<8sHHIq")
+HEADER_SIZE = 512
+_DEVICE_NAME = 30
+# Table des devices : nombre, puis longueur + nom (30 octets max) par device
+MAX_DEVICES = (HEADER_SIZE - _HEADER.size - 1) // (_DEVICE_NAME + 1)
+_RECORD = struct.Struct("<QQBBHI40s")
+RECORD_SIZE = _RECORD.size
+DEFAULT_RECORDS = 65536
+
+# Types d'enregistrement
+SESSION = 0
+TRANSITION = 1
+COMMAND = 2
+WRITE = 3
+KIND_NAMES = {SESSION: "session", TRANSITION: "transition", COMMAND: "command", WRITE: "write"}
+
+# Ordre figé : l'index est écrit dans le journal
+MODES: Tuple[Mode, ...] = tuple(Mode)
+EFFECTS: Tuple[Optional[str], ...] = (None, "alert", "warning", "info")
+COMMAND_KINDS: Tuple[str, ...] = ("switch", "rgb", "brightness", "alert", "warn", "info", "mode", "binary", "json")
+
+_SESSION = struct.Struct("<qI")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_TRANSITION = struct.Struct("<BBBBBBBxi")
+_PAYLOAD_BYTES = 40
+
+
+class JournalError(ValueError):
+    """Raised when a file is not a journal, or its geometry does not match."""
+
+
+def command_codes(topics) -> Dict[str, int]:
+    """Journal code of each command topic of a device's ``TopicSettings``."""
+    return {
+        topics.command_topic: 0,
+        topics.rgb_command_topic: 1,
+        topics.brightness_command_topic: 2,
+        topics.alert_command_topic: 3,
+        topics.warn_command_topic: 4,
+        topics.info_command_topic: 5,
+        topics.mode_command_topic: 6,
+        topics.binary_command_topic: 7,
+        topics.json_command_topic: 8,
+    }
+
+
+class FlightJournal:
+    """Ring buffer mapped from ``path``; shared by every device of the process."""
+
+    def __init__(self, path: Path | str, *, records: int = DEFAULT_RECORDS, devices: Sequence[str] = ()) -> None:
+        if records < 1:
+            raise ValueError("records doit être >= 1")
+        if len(devices) > MAX_DEVICES:
+            raise ValueError(f"Au plus {MAX_DEVICES} devices par journal")
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.capacity = records
+        size = HEADER_SIZE + records * RECORD_SIZE
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            existing = os.fstat(fd).st_size
+            if existing and existing != size:
+                # Géométrie différente (journal_records modifié) : on repart d'un journal vide
+                os.ftruncate(fd, 0)
+                existing = 0
+            if existing == 0:
+                os.ftruncate(fd, size)
+            self._map: Optional[mmap.mmap] = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        last = _last_sequence(self._map, records) if existing and self._map[:len(MAGIC)] == MAGIC else 0
+        wall_offset = time.time_ns() - time.monotonic_ns()
+        self._map[:HEADER_SIZE] = _encode_header(records, devices, wall_offset)
+        self._devices = {name: index for index, name in enumerate(devices)}
+        self._sequence = count(last + 1)
+        DeviceJournal(self, 0)._append(SESSION, 0, os.getpid(), _SESSION.pack(wall_offset, len(devices)))
+
+    def device(self, name: str) -> DeviceJournal:
+        """Recording view for one device (its index is stored with each record)."""
+        return DeviceJournal(self, self._devices[name])
+
+    def flush(self) -> None:
+        if self._map is not None:
+            self._map.flush()
+
+    def close(self) -> None:
+        journal_map, self._map = self._map, None
+        if journal_map is not None:
+            journal_map.flush()
+            journal_map.close()
+
+
+class DeviceJournal:
+    """Records of one device: ``transition``, ``command`` and ``write`` each cost one ``pack_into``."""
+
+    __slots__ = ("_device", "_map", "_next", "_capacity")
+
+    def __init__(self, journal: FlightJournal, device: int) -> None:
+        self._device = device
+        # Références locales : un enregistrement = un next() + un pack_into, sans appel intermédiaire
+        self._map = journal._map
+        self._next = journal._sequence.__next__
+        self._capacity = journal.capacity
+
+    def _append(self, kind: int, code: int, value: int, data: bytes) -> None:
+        sequence = self._next()
+        try:
+            _RECORD.pack_into(
+                self._map,
+                HEADER_SIZE + (sequence - 1) % self._capacity * RECORD_SIZE,
+                sequence,
+                time.monotonic_ns(),
+                kind,
+                self._device,
+                code,
+                value,
+                data,
+            )
+        except (TypeError, ValueError):
+            # Journal fermé (arrêt en cours) : l'enregistrement est perdu
+            pass
+
+    def transition(self, change) -> None:
+        """Observateur ``on_change`` du ``StateStore``."""
+        control = change.current
+        override = control.override
+        r, g, b = control.last_command_color
+        data = _TRANSITION.pack(
+            control.light_on,
+            control.pilot_switch,
+            r,
+            g,
+            b,
+            control.last_brightness,
+            0 if override is None else EFFECTS.index(override.kind),
+            -1 if override is None else int(override.remaining_seconds() * 1000),
+        )
+        self._append(TRANSITION, MODES.index(control.state), change.version & 0xFFFFFFFF, data)
+
+    def command(self, code: int, payload: bytes) -> None:
+        self._append(COMMAND, code, len(payload), bytes(payload[:_PAYLOAD_BYTES]))
+
+    def write(self, rgb) -> None:
+        self._append(WRITE, 0, 0, bytes(rgb))
+
+
+@dataclass(frozen=True)
+class JournalEntry:
+    sequence: int
+    timestamp_ns: int
+    kind: str
+    device: Optional[str]
+    fields: Mapping[str, Any] = field(default_factory=dict)
+    # Heure murale, reconstituée depuis l'enregistrement de session précédent
+    at: Optional[datetime] = None
+
+    def to_line(self) -> str:
+        at = self.at.isoformat(timespec="microseconds") if self.at is not None else f"{self.timestamp_ns / 1e9:.6f}"
+        details = " ".join(f"{key}={value}" for key, value in self.fields.items())
+        return f"{at}\t#{self.sequence}\t{self.device or '-'}\t{self.kind}\t{details}"
+
+
+def read_journal(path: Path | str) -> Tuple[List[str], List[JournalEntry]]:
+    """Device names and records of a journal, oldest first."""
+    data = Path(path).expanduser().read_bytes()
+    if len(data) < HEADER_SIZE or data[:len(MAGIC)] != MAGIC:
+        raise JournalError(f"{path} n'est pas un journal")
+    _magic, record_size, header_size, capacity, session_offset = _HEADER.unpack_from(data)
+    if record_size != RECORD_SIZE or header_size != HEADER_SIZE or len(data) < HEADER_SIZE + capacity * RECORD_SIZE:
+        raise JournalError(f"{path} : géométrie de journal inattendue")
+    devices = _decode_devices(data)
+    raw = sorted(
+        record
+        for record in _RECORD.iter_unpack(data[HEADER_SIZE:HEADER_SIZE + capacity * RECORD_SIZE])
+        if record[0]
+    )
+    entries: List[JournalEntry] = []
+    # Tant qu'aucun enregistrement de session n'a été lu (écrasé par le ring) : écart de la dernière session
+    wall_offset = session_offset
+    for sequence, timestamp_ns, kind, device, code, value, payload in raw:
+        if kind == SESSION:
+            wall_offset = _SESSION.unpack_from(payload)[0]
+            fields: Dict[str, Any] = {"pid": value}
+        elif kind == TRANSITION:
+            light_on, pilot, r, g, b, brightness, effect, remaining_ms = _TRANSITION.unpack_from(payload)
+            fields = {
+                "version": value,
+                "mode": MODES[code].value if code < len(MODES) else code,
+                "light": "on" if light_on else "off",
+                "pilot": bool(pilot),
+                "rgb": f"#{r:02X}{g:02X}{b:02X}",
+                "brightness": brightness,
+            }
+            if effect:
+                fields["effect"] = EFFECTS[effect] if effect < len(EFFECTS) else effect
+                fields["remaining_ms"] = remaining_ms
+        elif kind == COMMAND:
+            head = payload[:min(value, _PAYLOAD_BYTES)]
+            fields = {
+                "topic": COMMAND_KINDS[code] if code < len(COMMAND_KINDS) else code,
+                "bytes": value,
+                "payload": head.decode("utf-8") if _printable(head) else head.hex(),
+            }
+        elif kind == WRITE:
+            r, g, b = payload[:3]
+            fields = {"rgb": f"#{r:02X}{g:02X}{b:02X}"}
+        else:
+            fields = {"code": code, "value": value}
+        at = _EPOCH + timedelta(microseconds=(timestamp_ns + wall_offset) // 1000)
+        entries.append(
+            JournalEntry(
+                sequence=sequence,
+                timestamp_ns=timestamp_ns,
+                kind=KIND_NAMES.get(kind, str(kind)),
+                device=None if kind == SESSION else (devices[device] if device < len(devices) else str(device)),
+                fields=fields,
+                at=at,
+            )
+        )
+    return devices, entries
+
+
+def _encode_header(capacity: int, devices: Sequence[str], wall_offset: int) -> bytes:
+    header = bytearray(HEADER_SIZE)
+    _HEADER.pack_into(header, 0, MAGIC, RECORD_SIZE, HEADER_SIZE, capacity, wall_offset)
+    offset = _HEADER.size
+    header[offset] = len(devices)
+    offset += 1
+    for name in devices:
+        encoded = name.encode("utf-8")[:_DEVICE_NAME]
+        header[offset] = len(encoded)
+        header[offset + 1:offset + 1 + len(encoded)] = encoded
+        offset += _DEVICE_NAME + 1
+    return bytes(header)
+
+
+def _decode_devices(data: bytes) -> List[str]:
+    offset = _HEADER.size
+    devices = []
+    for _ in range(min(data[offset], MAX_DEVICES)):
+        length = data[offset + 1]
+        devices.append(data[offset + 2:offset + 2 + length].decode("utf-8", errors="replace"))
+        offset += _DEVICE_NAME + 1
+    return devices
+
+
+def _last_sequence(journal_map: mmap.mmap, capacity: int) -> int:
+    last = 0
+    for offset in range(HEADER_SIZE, HEADER_SIZE + capacity * RECORD_SIZE, RECORD_SIZE):
+        sequence = int.from_bytes(journal_map[offset:offset + 8], "little")
+        if sequence > last:
+            last = sequence
+    return last
+
+
+def _printable(data: bytes) -> bool:
+    try:
+        return data.decode("utf-8").isprintable()
+    except UnicodeDecodeError:
+        return False
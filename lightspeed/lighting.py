@@ -9,10 +9,25 @@ import sys
 import threading
 import time
 from pathlib import Path
-from typing import Optional, Sequence, Tuple
+from typing import Callable, Optional, Sequence, Tuple
 
 import types
-from lightspeed.config import ConfigProfile, PaletteDefinition
+from lightspeed.colors import (  # noqa: F401 - réexportés pour compatibilité
+    PatternHandoff,
+    alert_frames,
+    apply_brightness,
+    clamp_channel,
+    default_color,
+    info_frames,
+    palette_frames,
+    parse_color_string,
+    reapply_cached_color,
+    restore_logitech_control,
+    run_pattern,
+    to_pct,
+    warning_frames,
+)
+from lightspeed.metrics import Timing
 
 # Charger explicitement la DLL LogitechLed depuis lib/
 _dll_name = "LogitechLed.dll"
@@ -67,6 +82,9 @@ def logi_led_save_current_lighting():
 def logi_led_restore_lighting():
     return logi_led.led_dll.LogiLedRestoreLighting()
 
+def logi_led_set_target_device(target_device):
+    return logi_led.led_dll.LogiLedSetTargetDevice(target_device)
+
 
 # Attacher ces fonctions au module patché
 logi_led.logi_led_init = logi_led_init
@@ -76,6 +94,20 @@ logi_led.logi_led_flash_lighting = logi_led_flash_lighting
 logi_led.logi_led_pulse_lighting = logi_led_pulse_lighting
 logi_led.logi_led_save_current_lighting = logi_led_save_current_lighting
 logi_led.logi_led_restore_lighting = logi_led_restore_lighting
+logi_led.logi_led_set_target_device = logi_led_set_target_device
+
+# Masques LOGI_DEVICETYPE_* du SDK, indexés par la valeur `target` des devices de config.yaml
+TARGET_DEVICE_MASKS = {
+    "monochrome": 0x1,
+    "rgb": 0x2,
+    "perkey_rgb": 0x4,
+    "all": 0x7,
+}
+# Le SDK est global au processus : un seul verrou partagé par tous les contrôleurs,
+# pour que sélection de la cible et écriture restent atomiques.
+_SDK_LOCK = threading.Lock()
+# Contrôleurs attachés au SDK (protégé par _SDK_LOCK) : init au premier, shutdown au dernier
+_SDK_USERS = 0
 
 # Types utilitaires
 RGB = Tuple[int, int, int]
@@ -100,58 +132,64 @@ def _test_led():
     except Exception as e:
         logger.error(f"Erreur lors du test de la DLL : {e}")
 
-def clamp_channel(value: int) -> int:
-    return max(0, min(255, int(value)))
-
-
-def to_pct(value: int) -> int:
-    return int(round((clamp_channel(value) / 255) * 100))
-
-
-def apply_brightness(color: RGB, brightness: int) -> RGB:
-    value = max(0, min(255, int(brightness)))
-    if value >= 255:
-        return color
-    ratio = value / 255 if value else 0
-    return tuple(int(channel * ratio) for channel in color)
-
-
-def parse_color_string(value: str) -> RGB:
-    if not value:
-        raise ValueError("Couleur vide")
-    text = value.strip()
+def _with_target(target_mask: int, call: Callable[[], object]) -> object:
+    """Appelle ``call`` avec la cible SDK ``target_mask`` (appelant détenteur de _SDK_LOCK)."""
+    if target_mask == TARGET_DEVICE_MASKS["all"]:
+        return call()
+    logi_led.logi_led_set_target_device(target_mask)
     try:
-        data = json.loads(text)
-        if isinstance(data, dict):
-            return clamp_channel(data['r']), clamp_channel(data['g']), clamp_channel(data['b'])
-        if isinstance(data, list) and len(data) == 3:
-            r, g, b = data
-            return clamp_channel(r), clamp_channel(g), clamp_channel(b)
-    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
-        pass
-
-    if text.startswith('#'):
-        hex_value = text.lstrip('#')
-        if len(hex_value) != 6:
-            raise ValueError('Format hex attendu: #RRGGBB')
-        return tuple(int(hex_value[i:i + 2], 16) for i in (0, 2, 4))  # type: ignore[return-value]
-
-    separators = ',' if ',' in text else ' '
-    parts = [p for p in text.split(separators) if p]
-    if len(parts) == 3:
-        r, g, b = (int(part) for part in parts)
-        return clamp_channel(r), clamp_channel(g), clamp_channel(b)
-
-    raise ValueError("Impossible de lire la couleur (attendu #RRGGBB ou R,G,B)")
+        return call()
+    finally:
+        logi_led.logi_led_set_target_device(TARGET_DEVICE_MASKS["all"])
+
+
+def _sdk_attach(target_mask: int) -> bool:
+    """Initialise le SDK pour le premier contrôleur puis sauvegarde l'éclairage de la cible."""
+    global _SDK_USERS
+    with _SDK_LOCK:
+        if _SDK_USERS == 0 and not logi_led.logi_led_init():
+            return False
+        _SDK_USERS += 1
+        _with_target(target_mask, logi_led.logi_led_save_current_lighting)
+    return True
+
+
+def _sdk_detach(target_mask: int) -> None:
+    """Rend la cible au profil Logitech; le dernier contrôleur restaure tout et arrête le SDK."""
+    global _SDK_USERS
+    with _SDK_LOCK:
+        _SDK_USERS = max(0, _SDK_USERS - 1)
+        if _SDK_USERS:
+            # D'autres périphériques restent pilotés : ne toucher qu'à notre cible
+            _with_target(target_mask, logi_led.logi_led_restore_lighting)
+            return
+        logi_led.logi_led_restore_lighting()
+        logi_led.logi_led_shutdown()
 
 
 class LightingController:
-    def __init__(self, dll_path: Optional[str] = None, *, lock_file: Optional[str] = None) -> None:
-        self.lock = threading.Lock()
+    def __init__(
+        self,
+        dll_path: Optional[str] = None,
+        *,
+        lock_file: Optional[str] = None,
+        target: str = "all",
+    ) -> None:
+        self.lock = _SDK_LOCK
+        self.target_mask = TARGET_DEVICE_MASKS[target]
         self.pattern_thread: Optional[threading.Thread] = None
         self.stop_event = threading.Event()
+        self._handoff: Optional[PatternHandoff] = None
+        # Timings optionnels (voir MqttLightingService) : durée d'une écriture, retard des frames
+        self.write_timing: Optional[Timing] = None
+        self.frame_jitter: Optional[Timing] = None
         self.initialized = False
         self.released = False
+        # Compteur d'écritures SDK et (index, nombre de frames) du pattern en cours, pour le diagnostic
+        self.write_count = 0
+        self.frame_position: Optional[Tuple[int, int]] = None
+        # Appelé après chaque écriture SDK (trace de rejeu)
+        self.on_write: Optional[Callable[[RGB], None]] = None
         # Si dll_path est relatif, le rendre absolu par rapport au cwd
         if dll_path:
             dll_path = os.path.expanduser(dll_path)
@@ -233,7 +271,7 @@ class LightingController:
             return
         self._acquire_lock()
         with self.lock:
-            logi_led.logi_led_save_current_lighting()
+            _with_target(self.target_mask, logi_led.logi_led_save_current_lighting)
         self.released = False
 
     def start(self) -> None:
@@ -248,11 +286,10 @@ class LightingController:
             sys.exit(1)
         self._acquire_lock()
         try:
-            if not logi_led.logi_led_init():
+            if not _sdk_attach(self.target_mask):
                 raise RuntimeError(
                     "Impossible d'initialiser le SDK Logitech. Vérifiez que G Hub / LGS est en cours d'exécution."
                 )
-            logi_led.logi_led_save_current_lighting()
             self.initialized = True
             self.released = False
         except Exception:
@@ -264,9 +301,7 @@ class LightingController:
     def shutdown(self) -> None:
         self.stop_pattern()
         if self.initialized:
-            with self.lock:
-                logi_led.logi_led_restore_lighting()
-                logi_led.logi_led_shutdown()
+            _sdk_detach(self.target_mask)
         self._release_lock()
         self.initialized = False
         self.released = False
@@ -274,7 +309,19 @@ class LightingController:
     def _set_color_now(self, rgb: RGB) -> None:
         r, g, b = (clamp_channel(channel) for channel in rgb)
         with self.lock:
+            # Durée des appels SDK seuls (hors attente du verrou partagé entre devices)
+            started = time.perf_counter()
+            if self.target_mask != TARGET_DEVICE_MASKS["all"]:
+                logi_led.logi_led_set_target_device(self.target_mask)
             logi_led.logi_led_set_lighting(to_pct(r), to_pct(g), to_pct(b))
+            self.write_count += 1
+            if self.target_mask != TARGET_DEVICE_MASKS["all"]:
+                logi_led.logi_led_set_target_device(TARGET_DEVICE_MASKS["all"])
+            elapsed = time.perf_counter() - started
+        if self.write_timing is not None:
+            self.write_timing.observe(elapsed)
+        if self.on_write is not None:
+            self.on_write((r, g, b))
 
     def set_static_color(self, rgb: RGB) -> None:
         self.start()
@@ -282,60 +329,75 @@ class LightingController:
         self.stop_pattern()
         self._set_color_now(rgb)
 
-    def start_pattern(self, frames: Sequence[PatternFrame]) -> None:
+    def start_pattern(
+        self,
+        frames: Sequence[PatternFrame],
+        *,
+        on_first_frame: Optional[Callable[[], None]] = None,
+        start_offset: float = 0.0,
+    ) -> None:
+        """Lance le pattern en boucle; ``on_first_frame`` est appelé après la première écriture.
+
+        ``start_offset`` (secondes) cale le pattern sur une ligne de temps partagée
+        (voir ``colors.run_pattern``).
+        """
         if not frames:
             raise ValueError("Aucun frame fourni pour le pattern")
         self.start()
-        self.stop_pattern()
         self._reattach_control()
         self.released = False
+        handoff = self._handoff
+        if handoff is not None and self.pattern_thread is not None and self.pattern_thread.is_alive():
+            # Même thread de pattern : le nouvel effet enchaîne sans arrêt ni redémarrage
+            if handoff.offer(frames, on_first_frame=on_first_frame, start_offset=start_offset):
+                return
+        self.stop_pattern()
         self.stop_event = threading.Event()
 
+        palette = list(frames)
+        stop_event = self.stop_event
+        handoff = self._handoff = PatternHandoff(stop_event, palette)
+
+        def write_frame(index: int, color: RGB) -> None:
+            self._set_color_now(color)
+            self.frame_position = (index, len(handoff.frames))
+
         def worker() -> None:
-            palette = list(frames)
-            if not palette:
-                return
-            while not self.stop_event.is_set():
-                for color, duration in palette:
-                    if self.stop_event.is_set():
-                        break
-                    self._set_color_now(color)
-                    wait_time = max(duration, 0.05)
-                    if self.stop_event.wait(wait_time):
-                        break
+            run_pattern(
+                palette,
+                write_frame,
+                stop_event,
+                on_first_frame=on_first_frame,
+                start_offset=start_offset,
+                handoff=handoff,
+                on_jitter=None if self.frame_jitter is None else self.frame_jitter.observe,
+            )
 
         self.pattern_thread = threading.Thread(target=worker, daemon=True)
         self.pattern_thread.start()
 
     def stop_pattern(self) -> None:
         if self.pattern_thread and self.pattern_thread.is_alive():
+            if self._handoff is not None:
+                self._handoff.close()
             self.stop_event.set()
             self.pattern_thread.join()
         self.pattern_thread = None
+        self._handoff = None
+        self.frame_position = None
 
     def release(self) -> None:
         if not self.initialized:
             return
         self.stop_pattern()
-        with self.lock:
-            logi_led.logi_led_restore_lighting()
-            # Force la restauration en désactivant temporairement notre contrôle
-            logi_led.logi_led_shutdown()
+        # Rend la main au profil Logitech pour ce périphérique seulement; le SDK
+        # n'est arrêté (restauration forcée) que si plus aucun contrôleur n'est attaché.
+        _sdk_detach(self.target_mask)
         self._release_lock()
         self.released = True
         self.initialized = False
 
 
-def restore_logitech_control(controller: LightingController) -> None:
-    """Return keyboard control to Logitech Options+/G HUB via the controller."""
-    controller.release()
-
-
-def reapply_cached_color(controller: LightingController, base_color: RGB, brightness: int) -> None:
-    """Reapply the cached automation color/brightness after regaining pilot control."""
-    controller.set_static_color(apply_brightness(base_color, brightness))
-
-
 def ensure_logi_dll_loaded(override_path: Optional[Path] = None) -> bool:
     if getattr(logi_led, 'led_dll', None):
         return True
@@ -367,32 +429,3 @@ def ensure_logi_dll_loaded(override_path: Optional[Path] = None) -> bool:
             logi_led.led_dll = ctypes.cdll.LoadLibrary(str(dll_path))
             return True
     return False
-
-
-def palette_frames(palette: PaletteDefinition) -> Tuple[PatternFrame, ...]:
-    frames = tuple((frame.color, frame.duration_ms / 1000.0) for frame in palette.frames)
-    logger.debug(
-        "palette_frames: Palette '%s' utilisée: %s",
-        getattr(palette, 'name', '?'),
-        [
-            {"color": f"#{r:02X}{g:02X}{b:02X}", "duration": d}
-            for (r, g, b), d in frames
-        ]
-    )
-    return frames
-
-
-def alert_frames(profile: ConfigProfile) -> Tuple[PatternFrame, ...]:
-    """Retourne les frames de la palette d'alerte."""
-    return palette_frames(profile.palettes.alert)
-
-
-def warning_frames(profile: ConfigProfile) -> Tuple[PatternFrame, ...]:
-    return palette_frames(profile.palettes.warning)
-
-def info_frames(profile: ConfigProfile) -> Tuple[PatternFrame, ...]:
-    return palette_frames(profile.palettes.info)
-
-
-def default_color(profile: ConfigProfile) -> RGB:
-    return profile.lighting.default_color
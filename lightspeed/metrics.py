@@ -0,0 +1,135 @@
+"""In-process counters and timing samples shared by the runtime components."""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+
+LabelSet = Tuple[Tuple[str, str], ...]
+TIMING_WINDOW = 512
+# Bornes supérieures (secondes) des buckets d'histogramme; le dernier bucket est +Inf
+TIMING_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _labels(labels: Dict[str, Any]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    """Monotonic counter; increments are plain attribute updates under the GIL."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """Last observed value."""
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Timing:
+    """Duration samples (seconds) with count/sum/max, histogram buckets and a bounded recent window.
+
+    ``buckets[i]`` counts the samples falling in bucket ``i`` alone (upper bound
+    ``TIMING_BUCKETS[i]``, the last one unbounded); exporters accumulate them.
+    """
+
+    __slots__ = ("count", "total", "maximum", "last", "recent", "buckets")
+
+    def __init__(self, window: int = TIMING_WINDOW) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.last = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+        self.buckets: List[int] = [0] * (len(TIMING_BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.recent.append(seconds)
+        self.buckets[bisect_left(TIMING_BUCKETS, seconds)] += 1
+
+    def percentile(self, fraction: float) -> float:
+        samples = sorted(self.recent)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, max(0, int(round(fraction * (len(samples) - 1)))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "max": round(self.maximum, 6),
+            "last": round(self.last, 6),
+            "p50": round(self.percentile(0.50), 6),
+            "p95": round(self.percentile(0.95), 6),
+        }
+
+
+class MetricsRegistry:
+    """Get-or-create registry of named, optionally labelled, metrics."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelSet], Counter] = {}
+        self._gauges: Dict[Tuple[str, LabelSet], Gauge] = {}
+        self._timings: Dict[Tuple[str, LabelSet], Timing] = {}
+
+    def counter(self, name: str, **labels: Any) -> Counter:
+        return self._get(self._counters, Counter, name, labels)
+
+    def gauge(self, name: str, **labels: Any) -> Gauge:
+        return self._get(self._gauges, Gauge, name, labels)
+
+    def timing(self, name: str, **labels: Any) -> Timing:
+        return self._get(self._timings, Timing, name, labels)
+
+    def collect(self) -> Tuple[list, list, list]:
+        """``((name, labels), metric)`` pairs of the counters, gauges and timings, for exporters."""
+        with self._lock:
+            return list(self._counters.items()), list(self._gauges.items()), list(self._timings.items())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-friendly view of every metric."""
+        counters, gauges, timings = self.collect()
+        return {
+            "counters": {_render_key(key): metric.value for key, metric in counters},
+            "gauges": {_render_key(key): metric.value for key, metric in gauges},
+            "timings": {_render_key(key): metric.snapshot() for key, metric in timings},
+        }
+
+    def _get(self, store: Dict, factory, name: str, labels: Dict[str, Any]):
+        key = (name, _labels(labels))
+        metric = store.get(key)
+        if metric is None:
+            with self._lock:
+                metric = store.setdefault(key, factory())
+        return metric
+
+
+def _render_key(key: Tuple[str, LabelSet]) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    rendered = ",".join(f"{label}={value}" for label, value in labels)
+    return f"{name}{{{rendered}}}"
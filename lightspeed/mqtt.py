@@ -5,68 +5,226 @@ import json
 import logging
 import threading
 import time
+import uuid
+from collections import deque
 from dataclasses import dataclass
-from datetime import datetime
-from types import ModuleType
-from typing import TYPE_CHECKING, Tuple
+from datetime import datetime, timezone
+from typing import Callable, List, Optional, Sequence, Tuple
 
 import paho.mqtt.client as mqtt
 
+from lightspeed import colors
+from lightspeed.capture import CommandRecorder
+from lightspeed.codec import BINARY_CONTENT_TYPE, CodecError, LightCommand, decode_command
+from lightspeed.colors import LightingBackend
 from lightspeed.config import ConfigProfile
-from lightspeed.control_mode import ControlMode
-from lightspeed.ha_contracts import iter_discovery_messages
-from lightspeed.observability import (
-    configure_last_will,
-    publish_availability,
-)
+from lightspeed.connection import SYNC_MARKER_EXPIRY_SECONDS, MqttConnection, message_deadline
+from lightspeed.control_mode import ControlMode, OverrideAction
+from lightspeed.dispatch import CommandDispatcher, Lane, TokenBucket
+from lightspeed.ha_contracts import LIGHT_EFFECTS, cached_discovery_messages
+from lightspeed.ipc import LocalCommandServer
+from lightspeed.journal import DeviceJournal, FlightJournal, command_codes
+from lightspeed.metrics import Counter, MetricsRegistry
+from lightspeed.observability import thread_inventory
+from lightspeed.performance import PerformanceSampler
+from lightspeed.prometheus import MetricsServer
+from lightspeed.renderer import LightingRenderer
+from lightspeed.scheduler import default_scheduler
+from lightspeed.snapshot import SnapshotWriter, read_snapshot
+from lightspeed.state_store import StateChange, StateStore
 
-if TYPE_CHECKING:  # pragma: no cover - type hints only
-    from lightspeed.lighting import LightingController
-
-
-_LIGHTING_MODULE: ModuleType | None = None
 RGB = Tuple[int, int, int]
+# Nombre d'erreurs récentes conservées pour le diagnostic
+ERROR_HISTORY = 10
+# Marqueur de synchronisation jamais revenu (ACL, perte) : bootstrap avec ce qui a été lu
+SYNC_TIMEOUT_SECONDS = 10.0
+# Commandes mises en attente avant le bootstrap : les plus anciennes sont abandonnées au-delà
+MAX_PENDING_COMMANDS = 256
 
 
 @dataclass(frozen=True)
 class AlertCommand:
     kind: str
     duration: int
+    received_at: Optional[float] = None
+    # Effet synchronisé : début sur l'horloge partagée et heure d'envoi (epoch, secondes)
+    start_at: Optional[float] = None
+    sent_at: Optional[float] = None
 
 
-def _lighting_module() -> ModuleType:
-    global _LIGHTING_MODULE
-    if _LIGHTING_MODULE is None:
-        from lightspeed import lighting as lighting_module  # Local import to defer logipy load
+@dataclass(frozen=True)
+class _JsonMessage:
+    """Message du topic JSON, décodé une seule fois : le routage et le handler lisent ``document``."""
+
+    topic: str
+    payload: bytes
+    properties: object
+    document: object = None
+    # Erreur de décodage (document invalide), signalée par le handler
+    error: Optional[str] = None
+
+    @classmethod
+    def parse(cls, message) -> "_JsonMessage":
+        payload = bytes(message.payload)
+        properties = getattr(message, "properties", None)
+        try:
+            document = json.loads(payload.decode("utf-8", errors="ignore").strip())
+        except ValueError as exc:
+            return cls(message.topic, payload, properties, error=str(exc))
+        return cls(message.topic, payload, properties, document)
 
-        _LIGHTING_MODULE = lighting_module
-    return _LIGHTING_MODULE
+    @property
+    def effect(self) -> bool:
+        return isinstance(self.document, dict) and bool(self.document.get("effect"))
 
 
 logger = logging.getLogger(__name__)
 
 
 class MqttLightingService:
-    def __init__(self, controller: "LightingController", profile: ConfigProfile, *, validated_at: datetime) -> None:
+    """Logique d'un device (état, handlers, discovery) sur une connexion MQTT éventuellement partagée."""
+
+    def __init__(
+        self,
+        controller: LightingBackend,
+        profile: ConfigProfile,
+        *,
+        validated_at: datetime,
+        metrics: MetricsRegistry | None = None,
+        connection: MqttConnection | None = None,
+    ) -> None:
         self.controller = controller
         self.profile = profile
         self.validated_at = validated_at
-        self.stop_event = threading.Event()
+        self.connection = connection or MqttConnection(profile, metrics=metrics)
+        self.metrics = self.connection.metrics
+        self.client = self.connection.client
+        self.stop_event = self.connection.stop_event
         self.last_error: str | None = None
-        self.control = ControlMode.bootstrap(default_color=profile.lighting.default_color)
+        # Capture des commandes reçues (observability.capture_file), partagée entre devices
+        self.recorder: CommandRecorder | None = None
+        # Journal circulaire de ce device (observability.journal_file), branché par run_services
+        self.journal: DeviceJournal | None = None
+        self._recent_errors: deque[dict] = deque(maxlen=ERROR_HISTORY)
+        self._started_at = time.monotonic()
+        # Aller-retour broker (marqueur de synchronisation), moyenne glissante
+        self._sync_sent_at: float | None = None
+        self.broker_rtt: float | None = None
         # Initialiser avec un état par défaut (lumière on, couleur par défaut, brightness max)
-        self.control = self.control.set_light_state(on=True).record_color_command(
-            base_color=profile.lighting.default_color,
-            brightness=255,
+        initial = ControlMode.bootstrap(default_color=profile.lighting.default_color)
+        self.store = StateStore(
+            initial.set_light_state(on=True).record_color_command(
+                base_color=profile.lighting.default_color,
+                brightness=255,
+            )
         )
-        self._connected = False
-        self.client = mqtt.Client(client_id=profile.mqtt.client_id, clean_session=True)
-        self._timer_factory = threading.Timer
-        if profile.mqtt.username:
-            self.client.username_pw_set(profile.mqtt.username, profile.mqtt.password or None)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        configure_last_will(self.client, self.profile)
+        # Effets de bord abonnés au store : rendu clavier, timer de fin d'effet, publication d'état
+        self.renderer = LightingRenderer(controller, profile, metrics=self.metrics)
+        # Journalisée avant ses effets de bord
+        self.store.on_change(self._journal_transition)
+        self.store.on_change(self.renderer.state_changed)
+        self.store.on_effect_end(self._on_effect_ended)
+        self.store.on_effect_start(self._on_effect_started)
+        self.store.on_settled(self._on_state_settled)
+        # Snapshot local (lighting.state_snapshot) : relu au démarrage avant toute connexion MQTT
+        self.snapshot: SnapshotWriter | None = None
+        if profile.lighting.state_snapshot:
+            self.snapshot = SnapshotWriter(profile.lighting.state_snapshot)
+            self.store.on_settled(lambda change: self.snapshot.schedule(change.current))
+        self._effect_timer = None
+        self._effect_timer_lock = threading.Lock()
+        # Copies retained lues sur le broker pendant la synchronisation post-connexion
+        self._retained: dict[str, bytes] = {}
+        self._probe_topics: frozenset[str] = frozenset()
+        self._sync_token: str | None = None
+        self._sync_lock = threading.Lock()
+        self._sync_deadline = None
+        self._bootstrapped = False
+        # Commandes reçues avant la restauration de l'état (session persistante), rejouées ensuite
+        self._pending_commands: deque = deque()
+        self._last_state_payload: str | None = None
+        topics = profile.topics
+        self._command_topics = frozenset((
+            topics.command_topic,
+            topics.rgb_command_topic,
+            topics.brightness_command_topic,
+            topics.alert_command_topic,
+            topics.warn_command_topic,
+            topics.info_command_topic,
+            topics.mode_command_topic,
+            topics.binary_command_topic,
+            topics.json_command_topic,
+        ))
+        self._override_topics = frozenset((
+            topics.alert_command_topic,
+            topics.warn_command_topic,
+            topics.info_command_topic,
+        ))
+        # Topics à valeur unique : seule la dernière commande en attente compte
+        self._coalesced_topics = frozenset((
+            topics.command_topic,
+            topics.rgb_command_topic,
+            topics.brightness_command_topic,
+            topics.mode_command_topic,
+        ))
+        self._journal_codes = command_codes(topics)
+        # Compteurs par topic résolus au premier message : ensuite un simple incrément, sans verrou
+        self._message_counters: dict[str, Counter] = {}
+        device = profile.home_assistant.device_id
+        if hasattr(controller, "write_timing"):
+            controller.write_timing = self.metrics.timing("sdk_write_seconds", device=device)
+            controller.frame_jitter = self.metrics.timing("pattern_frame_jitter_seconds", device=device)
+        # Un seau de jetons par topic d'override (créé à la première commande)
+        self._override_buckets: dict[str, TokenBucket] = {}
+        self.dispatcher = CommandDispatcher(
+            self._dispatch,
+            metrics=self.metrics,
+            name=profile.home_assistant.device_id,
+        )
+        self._timer_factory = default_scheduler().timer
+        # Capteurs de diagnostic HA : agrégés en mémoire, publiés à intervalle fixe (pas par événement)
+        self.performance: Optional[PerformanceSampler] = None
+        self._performance_task = None
+        if profile.home_assistant.metrics_interval_seconds > 0:
+            self.performance = PerformanceSampler(self.metrics, device, controller, self._queue_depth)
+        self.connection.register(self)
+
+    @property
+    def control(self) -> ControlMode:
+        """Dernière version de l'état (voir ``store``)."""
+        return self.store.state
+
+    @property
+    def _connected(self) -> bool:
+        return self.connection.connected
+
+    @property
+    def bootstrapped(self) -> bool:
+        """Vrai une fois l'état retained relu et appliqué au clavier."""
+        return self._bootstrapped
+
+    def command_topics(self) -> frozenset[str]:
+        """Topics de commande acceptés (MQTT et canal local)."""
+        return self._command_topics
+
+    def routed_topics(self) -> List[str]:
+        """Topics dont les messages doivent être routés vers ce device."""
+        topics = self.profile.topics
+        discovery = [message.topic for message in cached_discovery_messages(self.profile)]
+        return sorted(self._command_topics) + [
+            topics.state_topic,
+            topics.sync_topic,
+            topics.diagnostics_topic,
+        ] + discovery
+
+    def subscribed_topics(self) -> List[str]:
+        """Abonnements permanents : commandes, marqueur de synchronisation et diagnostic.
+
+        L'état et la discovery ne sont lus que pendant la synchronisation
+        (abonnement temporaire, voir ``_begin_retained_sync``).
+        """
+        topics = self.profile.topics
+        return sorted(self._command_topics) + [topics.sync_topic, topics.diagnostics_topic]
 
     def bootstrap_from_retained(self, state: dict) -> None:
         """Initialise l'état depuis un message retained."""
@@ -90,9 +248,11 @@ class MqttLightingService:
             pilot_mode = (mode == "pilot")
             
             # Mettre à jour l'état interne
-            self.control = self.control.set_pilot_switch(pilot_mode).set_light_state(on=is_on).record_color_command(
-                base_color=color,
-                brightness=brightness,
+            self.store.update(
+                lambda control: control.set_pilot_switch(pilot_mode).set_light_state(on=is_on).record_color_command(
+                    base_color=color,
+                    brightness=brightness,
+                )
             )
             
             logger.info(
@@ -103,117 +263,433 @@ class MqttLightingService:
             logger.warning("Échec du bootstrap depuis retained", extra={"error": str(exc)})
 
     def start(self) -> None:
+        """Démarre le contrôleur puis la connexion MQTT (partagée ou non).
+
+        L'état du clavier est appliqué une fois l'état retained lu sur cette même
+        connexion (voir ``_handle_sync_marker``).
+        """
         self.controller.start()
-        
-        # Appliquer l'état actuel au clavier seulement si en mode pilot
-        if self.control.pilot_switch:
-            if self.control.light_on:
-                lighting = _lighting_module()
-                color_to_apply = lighting.apply_brightness(
-                    self.control.last_command_color,
-                    self.control.last_brightness
-                )
-                self.controller.set_static_color(color_to_apply)
-                logger.info("Clavier initialisé (pilot mode)", extra={"color": color_to_apply})
-            else:
-                self.controller.set_static_color((0, 0, 0))
-                logger.info("Clavier éteint (pilot mode)")
-        else:
-            logger.info("Mode auto, contrôle Logitech actif")
-        
-        logger.info(
-            "Connexion MQTT",
-            extra={"host": self.profile.mqtt.host, "port": self.profile.mqtt.port},
-        )
-        self.client.connect(
-            self.profile.mqtt.host,
-            self.profile.mqtt.port,
-            keepalive=self.profile.mqtt.keepalive,
-        )
-        self.client.loop_start()
+        self.warm_start()
+        self.dispatcher.start()
+        self.connection.start()
+
+    def warm_start(self) -> bool:
+        """Applique le snapshot local au clavier, avant la connexion MQTT.
+
+        L'état retained du broker, lu ensuite pendant la synchronisation,
+        reste la référence : il remplace le snapshot et le renderer ne
+        réécrit le clavier que si la cible diffère.
+        """
+        if self.snapshot is None or self._bootstrapped:
+            return False
+        state = read_snapshot(self.snapshot.path)
+        if state is None:
+            return False
+        self.bootstrap_from_retained(state)
+        self.renderer.activate(self.control)
+        self.metrics.counter("warm_starts").inc()
+        logger.info("État local réappliqué avant connexion", extra={"path": str(self.snapshot.path)})
+        return True
 
     def stop(self) -> None:
         self.stop_event.set()
 
     def loop_forever(self) -> None:
-        try:
-            while not self.stop_event.is_set():
-                time.sleep(0.5)
-        finally:
-            if self._connected:
-                self._publish_availability("offline")
-            self.client.loop_stop()
-            self.client.disconnect()
-            self._connected = False
-            self.controller.shutdown()
-
-    def on_connect(self, client: mqtt.Client, _userdata, _flags, rc: int) -> None:
-        if rc != 0:
-            logger.error("Connexion MQTT refusée", extra={"code": rc})
-            return
-        self._connected = True
-        
-        # S'abonner aux topics de commande
-        client.subscribe(self.profile.topics.command_topic, qos=1)
-        client.subscribe(self.profile.topics.rgb_command_topic, qos=1)
-        client.subscribe(self.profile.topics.brightness_command_topic, qos=1)
-        client.subscribe(self.profile.topics.alert_command_topic, qos=1)
-        client.subscribe(self.profile.topics.warn_command_topic, qos=1)
-        client.subscribe(self.profile.topics.info_command_topic, qos=1)
-        client.subscribe(self.profile.topics.mode_command_topic, qos=1)
-        
-        logger.info("Connecté au broker")
-        self._publish_availability("online")
-        self._publish_light_state()
+        """Bloque jusqu'à ``stop()`` puis ferme la connexion et tous ses devices."""
+        self.connection.loop_forever()
+
+    def close(self) -> None:
+        """Appelé par la connexion à l'arrêt."""
+        if self._performance_task is not None:
+            self._performance_task.cancel()
+        if self._sync_deadline is not None:
+            self._sync_deadline.cancel()
+        self.dispatcher.stop()
+        if self.snapshot is not None:
+            self.snapshot.flush()
+        self.controller.shutdown()
+
+    def on_connected(self, *, session_present: bool) -> None:
+        """Appelé par la connexion après chaque CONNACK accepté."""
+        if self.performance is not None and self._performance_task is None:
+            self._performance_task = default_scheduler().call_every(
+                self.profile.home_assistant.metrics_interval_seconds, self._publish_performance
+            )
+        if self._bootstrapped and session_present:
+            # Session reprise : abonnements, retained et discovery sont intacts côté broker,
+            # seules les évolutions d'état survenues pendant la coupure sont publiées.
+            self._publish_light_state(only_if_changed=True)
+            return
         # self._publish_mode_state()  # Suppression : ne publie plus le mode seul sur state_topic
-        self._publish_discovery()
+        self._begin_retained_sync(self.client)
+
+    def on_home_assistant_online(self) -> None:
+        """Home Assistant a redémarré : republie discovery et état courant sans comparaison."""
+        if not self._bootstrapped:
+            # Synchronisation en cours : elle publiera état et discovery à son terme
+            return
+        for message in cached_discovery_messages(self.profile):
+            self.client.publish(message.topic, payload=message.payload, qos=1, retain=message.retain)
+        self._publish_light_state()
+
+    def _bootstrap_from_broker(self) -> None:
+        """Restaure l'état depuis le retained lu pendant la synchronisation puis l'applique."""
+        state = None
+        retained = self._retained.get(self.profile.topics.state_topic)
+        if retained:
+            try:
+                state = json.loads(retained.decode("utf-8", errors="ignore"))
+            except ValueError:
+                logger.warning("État retained illisible", extra={"payload": retained[:200]})
+        if isinstance(state, dict):
+            self.bootstrap_from_retained(state)
+            logger.info("État restauré depuis MQTT", extra={"state": state})
+        else:
+            logger.info("Aucun état retained trouvé, utilisation des valeurs par défaut")
+        self._bootstrapped = True
+        self._apply_current_state()
+
+    def _apply_current_state(self) -> None:
+        """Premier rendu de l'état courant : le clavier suit ensuite chaque version du store."""
+        self.renderer.activate(self.control)
 
-    def on_message(self, _client: mqtt.Client, _userdata, message) -> None:
+    def handle_message(self, message) -> None:
+        """Point d'entrée du routeur pour les messages de ce device."""
         topic = message.topic
-        payload = message.payload.decode("utf-8", errors="ignore").strip()
+        if topic == self.profile.topics.sync_topic:
+            self._handle_sync_marker(message.payload)
+            return
+        if self._sync_token and topic in self._probe_topics:
+            self._retained[topic] = bytes(message.payload)
+            return
+        if topic == self.profile.topics.diagnostics_topic:
+            # Hors dispatcher : la réponse reste possible même si la file de commandes est bloquée
+            self._answer_diagnostics(message)
+            return
+        if topic not in self._command_topics:
+            # Retained d'état ou de discovery livré après la fin de la synchronisation
+            return
+        counter = self._message_counters.get(topic)
+        if counter is None:
+            counter = self._message_counters[topic] = self.metrics.counter("mqtt_messages_received", topic=topic)
+        counter.inc()
+        if self.recorder is not None:
+            self.recorder.record(message)
+        if self.journal is not None:
+            self.journal.command(self._journal_codes[topic], message.payload)
+        now = time.monotonic()
+        deadline = message_deadline(message, now=now)
+        if deadline is not None and deadline <= now:
+            self._drop_expired(message)
+            return
+        if not self._bootstrapped:
+            if len(self._pending_commands) >= MAX_PENDING_COMMANDS:
+                self._pending_commands.popleft()
+                self.metrics.counter("pending_commands_dropped").inc()
+            self._pending_commands.append((message, deadline, now))
+            return
+        self._submit(message, now)
+
+    def _submit(self, message, received_at: float) -> None:
+        """Classe la commande : les overrides passent devant le trafic couleur en attente."""
+        topic = message.topic
+        if _is_binary(message) and topic in self._override_topics:
+            # Les trames binaires ne portent que des commandes lumière : refusée avant
+            # la voie prioritaire et le seau de jetons des overrides
+            logger.warning("Commande binaire refusée sur un topic d'override", extra={"topic": topic})
+            self.metrics.counter("commands_rejected", topic=topic).inc()
+            return
+        if topic == self.profile.topics.json_command_topic and not _is_binary(message):
+            message = _JsonMessage.parse(message)
+        if topic in self._override_topics or (isinstance(message, _JsonMessage) and message.effect):
+            if not self._admit_override(topic):
+                return
+            self.dispatcher.submit(message, Lane.OVERRIDE, received_at=received_at)
+            return
+        coalesce_key = topic if topic in self._coalesced_topics else None
+        self.dispatcher.submit(message, Lane.LIGHT, received_at=received_at, coalesce_key=coalesce_key)
+
+    def _drop_expired(self, message) -> None:
+        """Ignore une commande MQTT v5 expirée (ex. alerte livrée trop tard)."""
+        logger.info("Commande expirée ignorée", extra={"topic": message.topic})
+        self.metrics.counter("commands_expired").inc()
+
+    def _admit_override(self, topic: str) -> bool:
+        """Seau de jetons par topic : limite le churn timer/pattern d'une automatisation en boucle."""
+        bucket = self._override_buckets.get(topic)
+        if bucket is None:
+            effects = self.profile.effects
+            bucket = self._override_buckets.setdefault(
+                topic, TokenBucket(effects.override_rate_per_second, effects.override_burst)
+            )
+        if bucket.try_acquire():
+            return True
+        logger.info("Override refusé (débit dépassé)", extra={"topic": topic})
+        self.metrics.counter("overrides_rejected", topic=topic).inc()
+        return False
+
+    def _dispatch(self, message, received_at: Optional[float] = None) -> None:
+        """Exécute une commande (thread du dispatcher, ou inline avant son démarrage).
+
+        Les versions committées par le handler sont rendues dans l'ordre, puis
+        l'état est publié une seule fois pour toute la commande.
+        """
+        topic = message.topic
+        with self.store.batch():
+            try:
+                if topic == self.profile.topics.binary_command_topic or _is_binary(message):
+                    # Décodé directement depuis les octets, sans passer par str/JSON
+                    try:
+                        command = decode_command(message.payload)
+                    except CodecError as exc:
+                        logger.warning(
+                            "Commande binaire invalide",
+                            extra={"payload": bytes(message.payload[:32]).hex(), "error": str(exc)},
+                        )
+                        return
+                    self._apply_light_command(command, received_at=received_at)
+                    self.last_error = None
+                    return
+                if topic == self.profile.topics.json_command_topic:
+                    if not isinstance(message, _JsonMessage):
+                        message = _JsonMessage.parse(message)
+                    self._handle_json_command(message, received_at=received_at)
+                    self.last_error = None
+                    return
+                payload = message.payload.decode("utf-8", errors="ignore").strip()
+                if topic == self.profile.topics.command_topic:
+                    self._handle_switch_command(payload)
+                elif topic == self.profile.topics.rgb_command_topic:
+                    self._handle_rgb_command(payload)
+                elif topic == self.profile.topics.brightness_command_topic:
+                    self._handle_brightness_command(payload)
+                elif topic == self.profile.topics.alert_command_topic:
+                    self._handle_alert_button(payload, received_at=received_at)
+                elif topic == self.profile.topics.warn_command_topic:
+                    self._handle_warn_button(payload, received_at=received_at)
+                elif topic == self.profile.topics.info_command_topic:
+                    self._handle_info_button(payload, received_at=received_at)
+                elif topic == self.profile.topics.mode_command_topic:
+                    self._handle_mode_command(payload)
+                else:
+                    logger.debug("Topic ignoré", extra={"topic": topic})
+                self.last_error = None
+            except Exception as exc:  # pragma: no cover - defensive logging
+                self._record_error(topic, exc)
+                logger.exception("Erreur MQTT", extra={"topic": topic})
+
+    def _record_error(self, topic: str, exc: Exception) -> None:
+        self.last_error = str(exc)
+        self._recent_errors.append({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "topic": topic,
+            "error": f"{type(exc).__name__}: {exc}",
+        })
+
+    def diagnostics(self) -> dict:
+        """Instantané du service, construit uniquement depuis la mémoire (aucun accès au clavier)."""
+        snapshot = self.metrics.snapshot()
+        control = self.control
+        effect = None
+        if control.override is not None:
+            effect = control.override.to_payload()
+            position = getattr(self.controller, "frame_position", None)
+            if position is not None:
+                effect["frame"], effect["frames"] = position
+        return {
+            "device": self.profile.home_assistant.device_id,
+            "uptime_seconds": round(time.monotonic() - self._started_at, 3),
+            "connected": self._connected,
+            "broker": str(self.connection.endpoint),
+            "bootstrapped": self._bootstrapped,
+            "mode": control.state.value,
+            "state_version": self.store.version,
+            "queues": dict(self.dispatcher.depths(), pending_bootstrap=len(self._pending_commands)),
+            "timings": snapshot["timings"],
+            "counters": snapshot["counters"],
+            "device_writes": getattr(self.controller, "write_count", None),
+            "effect": effect,
+            "broker_rtt_seconds": None if self.broker_rtt is None else round(self.broker_rtt, 6),
+            "threads": thread_inventory(),
+            "scheduled_timers": default_scheduler().pending,
+            "last_errors": list(self._recent_errors),
+        }
+
+    def _answer_diagnostics(self, message) -> None:
+        """Répond à une demande de diagnostic sur ``diagnostics_response_topic`` (ou un sous-topic).
+
+        La demande peut fournir ``{"id": ..., "reply_to": ...}``; en MQTT v5,
+        ``ResponseTopic`` et ``CorrelationData`` sont aussi honorés.
+        """
+        if getattr(message, "retain", False):
+            return
+        response_topic = self.profile.topics.diagnostics_response_topic
+        properties = getattr(message, "properties", None)
+        reply_to = getattr(properties, "ResponseTopic", None)
+        correlation = getattr(properties, "CorrelationData", None)
+        request_id = None
         try:
-            if topic == self.profile.topics.command_topic:
-                self._handle_switch_command(payload)
-            elif topic == self.profile.topics.rgb_command_topic:
-                self._handle_rgb_command(payload)
-            elif topic == self.profile.topics.brightness_command_topic:
-                self._handle_brightness_command(payload)
-            elif topic == self.profile.topics.alert_command_topic:
-                self._handle_alert_button()
-            elif topic == self.profile.topics.warn_command_topic:
-                self._handle_warn_button()
-            elif topic == self.profile.topics.info_command_topic:
-                self._handle_info_button()
-            elif topic == self.profile.topics.mode_command_topic:
-                self._handle_mode_command(payload)
-            else:
-                logger.debug("Topic ignoré", extra={"topic": topic})
-            self.last_error = None
-        except Exception as exc:  # pragma: no cover - defensive logging
-            self.last_error = str(exc)
-            logger.exception("Erreur MQTT", extra={"topic": topic})
+            request = json.loads(message.payload.decode("utf-8", errors="ignore") or "{}")
+        except ValueError:
+            request = {}
+        if isinstance(request, dict):
+            reply_to = request.get("reply_to") or reply_to
+            request_id = request.get("id")
+        if reply_to != response_topic and not str(reply_to or "").startswith(response_topic + "/"):
+            if reply_to:
+                # Jamais de réponse vers un topic arbitraire (ex. un topic de commande)
+                logger.warning("Topic de réponse de diagnostic refusé", extra={"reply_to": reply_to})
+            reply_to = response_topic
+        report = self.diagnostics()
+        if request_id is not None:
+            report["id"] = request_id
+        self.metrics.counter("diagnostics_requests").inc()
+        self.connection.publish(
+            reply_to,
+            json.dumps(report, separators=(",", ":"), default=str),
+            qos=0,
+            correlation=correlation,
+        )
+
+    def _apply_light_command(
+        self,
+        command: LightCommand,
+        *,
+        received_at: Optional[float] = None,
+        timeline: Tuple[Optional[float], Optional[float]] = (None, None),
+    ) -> None:
+        """Applique état, couleur et luminosité en une seule version (une écriture, une publication).
+
+        ``timeline`` (``start_at``, ``sent_at``) synchronise l'effet éventuel.
+        """
+        version = self.store.version
+
+        def transition(control: ControlMode) -> ControlMode:
+            if command.on is not None:
+                control = control.set_light_state(on=command.on)
+            if not control.light_on:
+                return control.clear_override()
+            if (command.rgb is not None or command.brightness is not None) and control.pilot_switch:
+                control = control.record_color_command(
+                    base_color=control.last_command_color if command.rgb is None else command.rgb,
+                    brightness=control.last_brightness if command.brightness is None else command.brightness,
+                )
+            return control
+
+        change = self.store.update(transition, cause=command)
+        control = change.current
+        color_ignored = (command.rgb is not None or command.brightness is not None) and not control.pilot_switch
+        if not control.light_on:
+            logger.info("Lumière éteinte", extra={"pilot": control.pilot_switch})
+        elif command.effect:
+            # La couleur éventuelle est mise en cache (ignorée en mode auto, où les effets
+            # restent autorisés) : l'effet prend la main jusqu'à sa fin
+            if color_ignored:
+                logger.info("Couleur/luminosité ignorées (mode auto), effet lancé", extra={"effect": command.effect})
+            start_at, sent_at = timeline
+            self._handle_override_command(
+                AlertCommand(
+                    kind=command.effect,
+                    duration=self.profile.effects.override_duration_seconds,
+                    received_at=received_at,
+                    start_at=start_at,
+                    sent_at=sent_at,
+                )
+            )
+        elif color_ignored:
+            logger.info("Couleur/luminosité ignorées (mode auto)")
+        elif change.changed and control.override:
+            logger.info("Couleur mise en cache (effet actif)", extra={"rgb": control.last_command_color})
+        elif change.changed:
+            logger.info("Commande lumière appliquée", extra={"rgb": control.last_command_color})
+        self._confirm_state(version)
 
-    def _publish_light_state(self) -> None:
+    def _handle_json_command(self, message: _JsonMessage, *, received_at: Optional[float] = None) -> None:
+        """Commande Home Assistant schéma JSON : état, couleur, luminosité et effet en un seul message."""
+        try:
+            if message.error is not None:
+                raise ValueError(message.error)
+            command = _json_light_command(message.document)
+            timeline = _timeline_fields(message.document)
+        except (ValueError, TypeError, KeyError) as exc:
+            logger.warning("Commande JSON invalide", extra={"payload": message.payload[:200], "error": str(exc)})
+            self._publish_light_state()
+            return
+        self._apply_light_command(command, received_at=received_at, timeline=timeline)
+
+    def _state_document(self) -> dict:
+        control = self.control
+        if self.profile.home_assistant.light_schema != "json":
+            return {
+                "state": "on" if control.light_on else "off",
+                "rgb": list(control.last_command_color),
+                "brightness": control.last_brightness,
+                "mode": "pilot" if control.pilot_switch else "auto",
+            }
+        r, g, b = control.last_command_color
+        # Format attendu par le schéma JSON de HA; "rgb"/"mode" restent pour le bootstrap et les autres entités
+        return {
+            "state": "ON" if control.light_on else "OFF",
+            "color_mode": "rgb",
+            "color": {"r": r, "g": g, "b": b},
+            "brightness": control.last_brightness,
+            "effect": _override_kind(control),
+            "rgb": [r, g, b],
+            "mode": "pilot" if control.pilot_switch else "auto",
+        }
+
+    def _publish_light_state(self, *, only_if_changed: bool = False) -> None:
         """Publie l'état complet de la lumière sur state_topic."""
         if not self._connected:
             return
         
-        payload = json.dumps({
-            "state": "on" if self.control.light_on else "off",
-            "rgb": list(self.control.last_command_color),
-            "brightness": self.control.last_brightness,
-            "mode": "pilot" if self.control.pilot_switch else "auto",
-        }, separators=(",", ":"))
+        payload = json.dumps(self._state_document(), separators=(",", ":"))
+        if only_if_changed and payload == self._last_state_payload:
+            return
+        self._last_state_payload = payload
         
-        self.client.publish(
+        self.connection.publish(
             self.profile.topics.state_topic,
-            payload=payload,
+            payload,
             qos=1,
-            retain=True
+            retain=True,
+            expiry=self.profile.mqtt.state_expiry_seconds or None,
         )
 
+    def _publish_performance(self) -> None:
+        """Tâche périodique (thread du scheduler) : un document JSON lu par tous les capteurs de diagnostic."""
+        if self.performance is None:
+            return
+        document = self.performance.sample()
+        if not (self._connected and self._bootstrapped):
+            return
+        self.connection.publish(
+            self.profile.topics.performance_topic,
+            json.dumps(document, separators=(",", ":")),
+            qos=0,
+            retain=False,
+            alias=True,
+        )
+
+    def _queue_depth(self) -> int:
+        return sum(self.dispatcher.depths().values()) + len(self._pending_commands)
+
     # _publish_mode_state supprimé : le mode est inclus dans l'état complet publié par _publish_light_state
 
+    def _confirm_state(self, version: int) -> None:
+        """Commande sans effet sur l'état : republie quand même l'état, Home Assistant attend une confirmation."""
+        if self.store.version == version:
+            self._publish_light_state()
+
+    def _journal_transition(self, change: StateChange) -> None:
+        if self.journal is not None:
+            self.journal.transition(change)
+
+    def _on_state_settled(self, change: StateChange) -> None:
+        """Observateur du store : publie l'état une fois par lot de versions."""
+        if self._bootstrapped:
+            self._publish_light_state()
+
     def _handle_switch_command(self, payload: str) -> None:
         """Gère les commandes on/off sur command_topic."""
         desired = payload.strip().lower()
@@ -221,35 +697,22 @@ class MqttLightingService:
             logger.warning("Commande switch invalide", extra={"payload": payload})
             self._publish_light_state()
             return
-        
+        version = self.store.version
         if desired == "on":
-            updated = self.control.set_light_state(on=True)
-            self.control = updated
-            
-            # Appliquer physiquement seulement si en mode pilot
-            if self.control.pilot_switch:
-                lighting = _lighting_module()
-                color_to_apply = lighting.apply_brightness(
-                    updated.last_command_color,
-                    updated.last_brightness
-                )
-                self.controller.set_static_color(color_to_apply)
-                logger.info("Lumière allumée", extra={"color": color_to_apply})
+            control = self.store.update(lambda control: control.set_light_state(on=True)).current
+            # Appliqué physiquement (par le renderer) seulement en mode pilot
+            if control.pilot_switch:
+                logger.info("Lumière allumée", extra={"rgb": control.last_command_color})
             else:
                 logger.info("Lumière allumée (état uniquement, mode auto)")
         else:
-            updated = self.control.set_light_state(on=False)
-            self.control = updated
-            
-            # Appliquer physiquement seulement si en mode pilot
-            if self.control.pilot_switch:
-                self.controller.stop_pattern()
-                self.controller.set_static_color((0, 0, 0))
+            # Éteindre arrête aussi l'effet en cours
+            control = self.store.update(lambda control: control.set_light_state(on=False).clear_override()).current
+            if control.pilot_switch:
                 logger.info("Lumière éteinte")
             else:
                 logger.info("Lumière éteinte (état uniquement, mode auto)")
-        
-        self._publish_light_state()
+        self._confirm_state(version)
 
     def _handle_rgb_command(self, payload: str) -> None:
         """Gère les commandes RGB sur rgb_command_topic."""
@@ -261,34 +724,20 @@ class MqttLightingService:
             logger.info("Commande RGB ignorée (mode auto)")
             return
         
-        lighting = _lighting_module()
         try:
-            rgb = lighting.parse_color_string(payload)
+            rgb = colors.parse_color_string(payload)
         except ValueError as exc:
             logger.warning("Commande RGB invalide", extra={"payload": payload, "error": str(exc)})
             return
         
-        # Si un effet est actif, on cache la couleur
-        if self.control.override:
-            updated = self.control.record_color_command(
-                base_color=rgb,
-                brightness=self.control.last_brightness,
-            )
-            self.control = updated
+        version = self.store.version
+        control = self._record_color(base_color=rgb)
+        if control.override:
+            # Effet actif : la couleur est mise en cache et réappliquée à la fin de l'effet
             logger.info("Couleur mise en cache (effet actif)", extra={"rgb": rgb})
-            return
-        
-        # Applique la couleur avec la luminosité actuelle
-        color_to_apply = lighting.apply_brightness(rgb, self.control.last_brightness)
-        self.controller.set_static_color(color_to_apply)
-        
-        updated = self.control.record_color_command(
-            base_color=rgb,
-            brightness=self.control.last_brightness,
-        )
-        self.control = updated
-        self._publish_light_state()
-        logger.info("Couleur RGB appliquée", extra={"rgb": rgb})
+        else:
+            logger.info("Couleur RGB appliquée", extra={"rgb": rgb})
+        self._confirm_state(version)
 
     def _handle_brightness_command(self, payload: str) -> None:
         """Gère les commandes de luminosité sur brightness_command_topic."""
@@ -320,61 +769,72 @@ class MqttLightingService:
         
         brightness = max(0, min(255, brightness))
         
-        # Si un effet est actif, on cache la luminosité
-        if self.control.override:
-            updated = self.control.record_color_command(
-                base_color=self.control.last_command_color,
-                brightness=brightness,
-            )
-            self.control = updated
+        version = self.store.version
+        control = self._record_color(brightness=brightness)
+        if control.override:
             logger.info("Luminosité mise en cache (effet actif)", extra={"brightness": brightness})
-            return
-        
-        # Applique la luminosité
-        lighting = _lighting_module()
-        color_to_apply = lighting.apply_brightness(self.control.last_command_color, brightness)
-        self.controller.set_static_color(color_to_apply)
-        
-        updated = self.control.record_color_command(
-            base_color=self.control.last_command_color,
-            brightness=brightness,
-        )
-        self.control = updated
-        self._publish_light_state()
-        logger.info("Luminosité appliquée", extra={"brightness": brightness})
+        else:
+            logger.info("Luminosité appliquée", extra={"brightness": brightness})
+        self._confirm_state(version)
 
-    def _handle_alert_button(self) -> None:
+    def _record_color(self, *, base_color: Optional[RGB] = None, brightness: Optional[int] = None) -> ControlMode:
+        """Enregistre couleur et/ou luminosité si la lumière est allumée en mode pilot (revérifié au commit)."""
+
+        def transition(control: ControlMode) -> ControlMode:
+            if not (control.light_on and control.pilot_switch):
+                return control
+            return control.record_color_command(
+                base_color=control.last_command_color if base_color is None else base_color,
+                brightness=control.last_brightness if brightness is None else brightness,
+            )
+
+        return self.store.update(transition).current
+
+    def _handle_alert_button(self, payload: str = "", *, received_at: Optional[float] = None) -> None:
         """Déclenche une alerte visuelle Alert (rouge clignotant)."""
-        duration = self.profile.effects.override_duration_seconds
-        self._handle_override_command(AlertCommand(kind="alert", duration=duration))
+        self._handle_override_command(self._button_command("alert", payload, received_at))
         logger.info("⚠️ Alerte visuelle déclenchée")
 
-    def _handle_warn_button(self) -> None:
+    def _handle_warn_button(self, payload: str = "", *, received_at: Optional[float] = None) -> None:
         """Déclenche une alerte visuelle Warn (orange clignotant)."""
-        duration = self.profile.effects.override_duration_seconds
-        self._handle_override_command(AlertCommand(kind="warning", duration=duration))
+        self._handle_override_command(self._button_command("warning", payload, received_at))
         logger.info("⚠️ Avertissement visuel déclenché")
 
-    def _handle_info_button(self) -> None:
+    def _handle_info_button(self, payload: str = "", *, received_at: Optional[float] = None) -> None:
         """Déclenche une alerte visuelle Info (palette info)."""
-        duration = self.profile.effects.override_duration_seconds
-        self._handle_override_command(AlertCommand(kind="info", duration=duration))
+        self._handle_override_command(self._button_command("info", payload, received_at))
         logger.info("ℹ️ Info visuelle déclenchée")
 
+    def _button_command(self, kind: str, payload: str, received_at: Optional[float]) -> AlertCommand:
+        """Commande d'effet d'un bouton; un payload JSON peut porter ``start_at``/``sent_at``."""
+        start_at = sent_at = None
+        if payload.startswith("{"):
+            try:
+                start_at, sent_at = _timeline_fields(json.loads(payload))
+            except (ValueError, TypeError):
+                logger.warning("Payload d'effet illisible, effet non synchronisé", extra={"payload": payload[:200]})
+        return AlertCommand(
+            kind=kind,
+            duration=self.profile.effects.override_duration_seconds,
+            received_at=received_at,
+            start_at=start_at,
+            sent_at=sent_at,
+        )
+
     def _handle_mode_command(self, payload: str) -> None:
         """Gère les commandes de mode (pilot/auto) depuis mode_command_topic."""
         mode = payload.strip().lower()
         
         if mode not in {"pilot", "auto"}:
             logger.warning("Commande mode invalide", extra={"payload": payload})
-            self._publish_mode_state()
+            self._publish_light_state()
             return
         
         desired_pilot = (mode == "pilot")
         
         if desired_pilot == self.control.pilot_switch:
             # Pas de changement
-            self._publish_mode_state()
+            self._publish_light_state()
             return
         
         if desired_pilot:
@@ -384,122 +844,426 @@ class MqttLightingService:
 
     def _enter_pilot_mode(self) -> None:
         """Active le mode pilot - le programme pilote le clavier."""
-        updated = self.control.set_pilot_switch(True)
-        self.control = updated
-        
-        # Synchroniser le clavier avec l'état actuel de la light
-        if self.control.light_on:
-            lighting = _lighting_module()
-            color_to_apply = lighting.apply_brightness(
-                self.control.last_command_color,
-                self.control.last_brightness
-            )
-            self.controller.set_static_color(color_to_apply)
-            logger.info("Mode pilot activé, clavier synchronisé", extra={"color": color_to_apply})
+        # Le renderer synchronise le clavier avec l'état actuel de la light
+        control = self.store.update(lambda control: control.set_pilot_switch(True)).current
+        if control.light_on:
+            logger.info("Mode pilot activé, clavier synchronisé", extra={"rgb": control.last_command_color})
         else:
-            self.controller.set_static_color((0, 0, 0))
             logger.info("Mode pilot activé, clavier éteint")
-        
-        self._publish_light_state()
 
     def _exit_pilot_mode(self) -> None:
         """Désactive le mode pilot - rend la main au logiciel Logitech."""
-        updated = self.control.set_pilot_switch(False)
-        self.control = updated
-        
-        # Arrêter tout pattern en cours et rendre la main
-        self.controller.stop_pattern()
-        lighting = _lighting_module()
-        lighting.restore_logitech_control(self.controller)
-        
+        # L'effet en cours s'arrête avec le mode pilot
+        self.store.update(lambda control: control.set_pilot_switch(False).clear_override())
         logger.info("Mode pilot désactivé, contrôle rendu à Logitech")
+
+    def _begin_retained_sync(self, client: mqtt.Client) -> None:
+        """Lit les copies retained (discovery, et état au premier démarrage) sur la connexion.
+
+        Le broker livre les messages retained d'un abonnement avant tout message
+        publié ensuite sur la même connexion : le retour du marqueur publié sur
+        ``sync_topic`` signale donc la fin de la lecture, qu'un retained existe ou non.
+        """
+        self._retained.clear()
+        probe = {message.topic for message in cached_discovery_messages(self.profile)}
+        if not self._bootstrapped:
+            # Abonnement temporaire lui aussi : le retained d'état arrive avant le marqueur
+            probe.add(self.profile.topics.state_topic)
+        self._probe_topics = frozenset(probe)
+        token = uuid.uuid4().hex
+        with self._sync_lock:
+            self._sync_token = token
+            if self._sync_deadline is not None:
+                self._sync_deadline.cancel()
+            self._sync_deadline = default_scheduler().call_later(
+                SYNC_TIMEOUT_SECONDS, self._sync_timed_out, token
+            )
+        self._sync_sent_at = time.monotonic()
+        client.subscribe([(topic, 1) for topic in sorted(probe)])
+        self.connection.publish(
+            self.profile.topics.sync_topic,
+            token,
+            qos=1,
+            expiry=SYNC_MARKER_EXPIRY_SECONDS,
+        )
+
+    def _handle_sync_marker(self, payload: bytes) -> None:
+        """Termine la synchronisation quand notre marqueur revient du broker."""
+        token = payload.decode("utf-8", errors="ignore").strip()
+        if not self._end_sync(token):
+            return
+        self._record_broker_rtt()
+        self._finish_sync()
+
+    def _sync_timed_out(self, token: str) -> None:
+        """Tâche du scheduler : le marqueur n'est pas revenu, bootstrap avec le retained déjà reçu."""
+        if not self._end_sync(token):
+            return
+        self._sync_sent_at = None
+        self.metrics.counter("sync_timeouts").inc()
+        logger.warning(
+            "Marqueur de synchronisation non reçu, état retained lu jusqu'ici (ou défaut) appliqué",
+            extra={"topic": self.profile.topics.sync_topic, "timeout_seconds": SYNC_TIMEOUT_SECONDS},
+        )
+        self._finish_sync()
+
+    def _end_sync(self, token: str) -> bool:
+        """Consomme le jeton de synchronisation : un seul des deux chemins (marqueur, délai) termine."""
+        with self._sync_lock:
+            if not self._sync_token or token != self._sync_token:
+                return False
+            self._sync_token = None
+            if self._sync_deadline is not None:
+                self._sync_deadline.cancel()
+                self._sync_deadline = None
+        return True
+
+    def _finish_sync(self) -> None:
+        self.client.unsubscribe(sorted(self._probe_topics))
+        if not self._bootstrapped:
+            self._bootstrap_from_broker()
         self._publish_light_state()
+        self._publish_discovery()
+        self._replay_pending_commands()
 
-    def _publish_availability(self, state: str) -> None:
-        if not self._connected:
+    def _record_broker_rtt(self) -> None:
+        """Aller-retour du marqueur via le broker : base de l'estimation d'écart d'horloge (``sync_skew_ms: auto``)."""
+        if self._sync_sent_at is None:
             return
-        publish_availability(self.client, self.profile, state)
+        rtt = time.monotonic() - self._sync_sent_at
+        self._sync_sent_at = None
+        self.metrics.timing("broker_round_trip_seconds").observe(rtt)
+        self.broker_rtt = rtt if self.broker_rtt is None else 0.7 * self.broker_rtt + 0.3 * rtt
+
+    def _shared_clock_offset(self, command: AlertCommand) -> float:
+        """Écart horloge locale − horloge partagée, en secondes.
+
+        ``effects.sync_skew_ms`` fixe l'écart; en ``auto``, il est estimé à partir
+        de ``sent_at`` : réception − envoi − trajet émetteur → broker → nous,
+        approché par notre aller-retour broker.
+        """
+        skew_ms = self.profile.effects.sync_skew_ms
+        if skew_ms is not None:
+            return skew_ms / 1000
+        if command.sent_at is None or command.received_at is None:
+            return 0.0
+        received_wall = time.time() - (time.monotonic() - command.received_at)
+        offset = received_wall - command.sent_at - (self.broker_rtt or 0.0)
+        self.metrics.gauge("sync_clock_offset_seconds").set(round(offset, 6))
+        return offset
+
+    def _replay_pending_commands(self) -> None:
+        """Rejoue, dans l'ordre, les commandes mises en file par le broker pendant l'arrêt."""
+        pending, self._pending_commands = self._pending_commands, deque()
+        if pending:
+            logger.info("Commandes en attente rejouées", extra={"count": len(pending)})
+            self.metrics.counter("commands_replayed").inc(len(pending))
+        now = time.monotonic()
+        for message, deadline, received_at in pending:
+            if deadline is not None and deadline <= now:
+                self._drop_expired(message)
+                continue
+            self._submit(message, received_at)
 
     def _publish_discovery(self) -> None:
-        for message in iter_discovery_messages(self.profile):
+        """Republie uniquement les payloads discovery absents ou différents sur le broker."""
+        for message in cached_discovery_messages(self.profile):
+            if message.matches(self._retained.get(message.topic)):
+                logger.debug("Discovery inchangée, publication ignorée", extra={"topic": message.topic})
+                continue
             self.client.publish(message.topic, payload=message.payload, qos=1, retain=message.retain)
+        self._retained.clear()
 
     def _handle_override_command(self, command: AlertCommand) -> None:
-        """Démarre un effet (alert, warning ou info) avec logs détaillés sur les frames."""
-        self._clear_override(resume_base=False, event="replaced")
-        lighting = _lighting_module()
-        if command.kind == "alert":
-            frames = lighting.alert_frames(self.profile)
-        elif command.kind == "warning":
-            frames = lighting.warning_frames(self.profile)
-        elif command.kind == "info":
-            frames = lighting.info_frames(self.profile)
-        else:
-            logger.warning(f"Type d'effet inconnu: {command.kind}")
-            return
-        # Log détaillé sur les frames utilisées
-        logger.debug(
-            "Palette utilisée pour %s: %s",
-            command.kind,
-            [
-                {"color": f"#{r:02X}{g:02X}{b:02X}", "duration": d}
-                for (r, g, b), d in frames
-            ]
-        )
-        timer = self._timer_factory(command.duration, self._complete_override, args=(command.kind,))
-        timer.daemon = True
-        timer.start()
-        control = self.control.start_override(
-            kind=command.kind,
-            duration_seconds=command.duration,
-            timer_handle=timer,
+        """Démarre un effet (alert, warning ou info); le renderer lance le pattern."""
+        current = self.control.override
+        if current is not None and current.kind == command.kind:
+            # Même effet déjà en cours : prolongé sans relancer timer ni pattern
+            change = self.store.update(
+                lambda control: control.extend_override(duration_seconds=command.duration)
+                if control.override is not None and control.override.kind == command.kind
+                else control
+            )
+            self.metrics.counter("overrides_extended", kind=command.kind).inc()
+            override = change.current.override
+            if override is not None:
+                logger.info("Effet %s prolongé", command.kind, extra={"expires_at": override.expires_at.isoformat()})
+            return
+        started_at = None
+        if command.start_at is not None:
+            # Effet synchronisé : position sur la ligne de temps partagée (négative = pas encore commencé)
+            local_start = command.start_at + self._shared_clock_offset(command)
+            if time.time() - local_start >= command.duration:
+                logger.info("Effet synchronisé déjà terminé, ignoré", extra={"kind": command.kind})
+                self.metrics.counter("effects_sync_expired", kind=command.kind).inc()
+                return
+            started_at = datetime.fromtimestamp(local_start, tz=timezone.utc)
+            self.metrics.counter("effects_synchronized", kind=command.kind).inc()
+        # Un effet plus grave préempte l'effet en cours (suspendu avec son temps restant),
+        # un effet moins grave attend son tour; fin et départ sont notifiés par le store
+        change = self.store.update(
+            lambda control: control.start_override(
+                kind=command.kind,
+                duration_seconds=command.duration,
+                timestamp=started_at,
+            ),
+            cause=command,
         )
-        logger.debug("Lancement du pattern sur le contrôleur: %r", frames)
-        self.controller.start_pattern(frames)
-        logger.info("Effet %s démarré", command.kind, extra={"duration": command.duration})
-        self.control = control
-
-    def _complete_override(self, kind: str) -> None:
-        """Appelé quand un effet se termine."""
-        cleared = self._clear_override(resume_base=True, event="complete")
-        if cleared:
-            logger.info("Effet %s terminé", kind)
-            self._publish_light_state()
+        started = change.effect_started
+        if started is None or started.kind != command.kind:
+            logger.info("Effet %s en attente", command.kind, extra={"running": _override_kind(change.current)})
+            self.metrics.counter("overrides_queued", kind=command.kind).inc()
+        elif change.effect_ended is not None and any(
+            paused.kind == change.effect_ended.kind for paused in change.current.suspended
+        ):
+            logger.info("Effet %s suspendu par %s", change.effect_ended.kind, command.kind)
+            self.metrics.counter("overrides_preempted", kind=change.effect_ended.kind).inc()
 
-    def _clear_override(self, *, resume_base: bool, event: str) -> bool:
-        """Arrête l'effet en cours."""
-        override = self.control.override
-        if not override:
-            return False
-        
-        timer = override.timer_handle
-        if timer and hasattr(timer, "cancel"):
+    def _on_effect_started(self, change: StateChange) -> None:
+        """Observateur du store : arme le timer de fin du nouvel effet."""
+        self._arm_effect_timer(change.effect_started)
+
+    def _on_effect_ended(self, change: StateChange) -> None:
+        """Observateur du store : annule le timer de l'effet terminé ou remplacé."""
+        override = change.effect_ended
+        with self._effect_timer_lock:
+            timer, self._effect_timer = self._effect_timer, None
+        if timer is not None:
             try:
                 timer.cancel()
             except Exception:  # pragma: no cover - defensive
                 logger.debug("Annulation du timer override impossible", exc_info=True)
-        
-        self.controller.stop_pattern()
-        control = self.control.clear_override()
-        
-        # Réappliquer l'état selon le mode
-        if resume_base:
-            if control.pilot_switch:
-                # Mode pilot : appliquer la couleur du light
-                if control.light_on:
-                    lighting = _lighting_module()
-                    lighting.reapply_cached_color(
-                        self.controller,
-                        control.last_command_color,
-                        control.last_brightness,
-                    )
-                else:
-                    self.controller.set_static_color((0, 0, 0))
-            else:
-                # Mode auto : rendre la main à Logitech
-                lighting = _lighting_module()
-                lighting.restore_logitech_control(self.controller)
-        
-        self.control = control
-        logger.info("Effet %s arrêté (%s)", override.kind, event)
-        return True
\ No newline at end of file
+        logger.info("Effet %s arrêté", override.kind)
+
+    def _arm_effect_timer(self, override: OverrideAction) -> None:
+        timer = self._timer_factory(
+            override.remaining_seconds(),
+            self._complete_override,
+            args=(override.kind, override.started_ns),
+        )
+        timer.daemon = True
+        with self._effect_timer_lock:
+            previous, self._effect_timer = self._effect_timer, timer
+        if previous is not None:
+            previous.cancel()
+        timer.start()
+
+    def _complete_override(self, kind: str, started_ns: Optional[int] = None) -> None:
+        """Appelé (thread du scheduler) quand un effet doit se terminer."""
+
+        def is_current(override: Optional[OverrideAction]) -> bool:
+            return override is not None and override.kind == kind and started_ns in (None, override.started_ns)
+
+        override = self.control.override
+        if not is_current(override):
+            # Timer d'un effet déjà remplacé ou arrêté
+            return
+        if override.remaining_seconds() > 0:
+            # Effet prolongé entre-temps : un seul nouveau timer pour le reste de la durée
+            self._arm_effect_timer(override)
+            return
+        # Terminé seulement si l'effet n'a pas été prolongé ou remplacé entre-temps (CAS);
+        # l'effet suspendu le plus grave reprend alors pour son temps restant
+        change = self.store.update(
+            lambda control: control.finish_override()
+            if is_current(control.override) and control.override.remaining_seconds() <= 0
+            else control
+        )
+        if change.changed:
+            logger.info("Effet %s terminé", kind)
+            resumed = change.effect_started
+            if resumed is not None:
+                logger.info("Effet %s repris", resumed.kind, extra={"remaining_seconds": resumed.duration_seconds})
+                self.metrics.counter("overrides_resumed", kind=resumed.kind).inc()
+
+
+def _override_kind(control: ControlMode) -> Optional[str]:
+    return control.override.kind if control.override else None
+
+
+def _json_light_command(data) -> LightCommand:
+    """Traduit une commande HA schéma JSON; la transition est acceptée mais appliquée immédiatement."""
+    if not isinstance(data, dict):
+        raise TypeError("objet JSON attendu")
+    state = data.get("state")
+    if state is not None and str(state).upper() not in {"ON", "OFF"}:
+        raise ValueError(f"état inconnu: {state}")
+    color = data.get("color")
+    effect = data.get("effect")
+    if effect is not None and effect not in LIGHT_EFFECTS:
+        raise ValueError(f"effet inconnu: {effect}")
+    brightness = data.get("brightness")
+    return LightCommand(
+        on=None if state is None else str(state).upper() == "ON",
+        rgb=None if color is None else tuple(colors.clamp_channel(color[key]) for key in ("r", "g", "b")),
+        brightness=None if brightness is None else int(brightness),
+        effect=effect,
+    )
+
+
+def _timeline_fields(data) -> Tuple[Optional[float], Optional[float]]:
+    """``start_at``/``sent_at`` (epoch en secondes) d'une commande d'effet synchronisé."""
+    if not isinstance(data, dict):
+        return None, None
+    start_at, sent_at = data.get("start_at"), data.get("sent_at")
+    return (
+        None if start_at is None else float(start_at),
+        None if sent_at is None else float(sent_at),
+    )
+
+
+def _is_binary(message) -> bool:
+    """True quand le message MQTT v5 annonce le content-type des commandes binaires."""
+    properties = getattr(message, "properties", None)
+    return getattr(properties, "ContentType", None) == BINARY_CONTENT_TYPE
+
+
+def build_device_services(
+    profile: ConfigProfile,
+    *,
+    validated_at: datetime,
+    metrics: MetricsRegistry | None = None,
+    client_factory: Callable[..., object] | None = None,
+) -> List[MqttLightingService]:
+    """Crée un service par device de ``profile.devices``, tous sur une seule connexion."""
+    from lightspeed.backends import create_controller
+
+    connection = MqttConnection(profile, metrics=metrics, client_factory=client_factory)
+    return [
+        MqttLightingService(
+            create_controller(device, profile),
+            profile.for_device(device),
+            validated_at=validated_at,
+            connection=connection,
+        )
+        for device in profile.devices
+    ]
+
+
+def request_diagnostics(profile: ConfigProfile, *, timeout: float = 5.0) -> dict:
+    """Interroge le topic de diagnostic du device de ``profile`` et retourne sa réponse.
+
+    Client MQTT éphémère (3.1.1) : s'abonne à ``<diagnostics_response_topic>/<id>``,
+    publie la demande puis attend la réponse au plus ``timeout`` secondes.
+    """
+    settings = profile.mqtt
+    topics = profile.topics
+    request_id = uuid.uuid4().hex
+    reply_topic = f"{topics.diagnostics_response_topic}/{request_id}"
+    answered = threading.Event()
+    report: dict = {}
+    client = mqtt.Client(client_id=f"{settings.client_id}-stats-{request_id[:8]}", clean_session=True)
+    if settings.username:
+        client.username_pw_set(settings.username, settings.password or None)
+    if settings.tls.enabled:
+        from lightspeed.tls import build_ssl_context
+
+        client.tls_set_context(build_ssl_context(settings.tls))
+
+    def on_connect(client, _userdata, _flags, rc) -> None:
+        if rc == 0:
+            client.subscribe(reply_topic, qos=1)
+
+    def on_subscribe(client, _userdata, _mid, _granted) -> None:
+        request = json.dumps({"id": request_id, "reply_to": reply_topic}, separators=(",", ":"))
+        client.publish(topics.diagnostics_topic, payload=request, qos=1)
+
+    def on_message(_client, _userdata, message) -> None:
+        try:
+            data = json.loads(message.payload.decode("utf-8"))
+        except ValueError:
+            return
+        if isinstance(data, dict) and data.get("id") == request_id:
+            report.update(data)
+            answered.set()
+
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_message = on_message
+    last_error: Optional[OSError] = None
+    for endpoint in settings.brokers:
+        try:
+            client.connect(endpoint.host, endpoint.port, keepalive=settings.keepalive)
+            break
+        except OSError as exc:
+            last_error = exc
+    else:
+        raise ConnectionError(f"Aucun broker joignable: {last_error}")
+    client.loop_start()
+    try:
+        if not answered.wait(timeout):
+            raise TimeoutError(f"Pas de réponse de diagnostic sur {reply_topic} après {timeout} s")
+    finally:
+        client.disconnect()
+        client.loop_stop()
+    return report
+
+
+def run_services(services: Sequence[MqttLightingService]) -> None:
+    """Démarre des devices partageant une connexion et bloque jusqu'à l'arrêt.
+
+    Avec ``ipc.enabled``, le canal de commandes local est ouvert avant la
+    connexion MQTT : il reste utilisable pendant une coupure du broker. Avec
+    ``observability.capture_file``, les commandes reçues (MQTT et canal local)
+    y sont ajoutées pour ``simple-logi.py replay``. Avec ``observability.journal_file``,
+    transitions, commandes et écritures clavier alimentent le journal circulaire
+    (``simple-logi.py journal``). Avec ``observability.metrics_port``, les métriques
+    sont exposées au format Prometheus sur ``http://<metrics_address>:<port>/metrics``.
+    """
+    if not services:
+        raise ValueError("Aucun device à démarrer")
+    connection = services[0].connection
+    if any(service.connection is not connection for service in services):
+        raise ValueError("Les devices doivent partager la même connexion MQTT")
+    ipc = services[0].profile.ipc
+    local_server = LocalCommandServer(services, ipc.address, metrics=connection.metrics) if ipc.enabled else None
+    observability = services[0].profile.observability
+    recorder = CommandRecorder(observability.capture_file) if observability.capture_file else None
+    metrics_server = None
+    if observability.metrics_port is not None:
+        metrics_server = MetricsServer(connection.metrics, observability.metrics_address, observability.metrics_port)
+    journal = None
+    if observability.journal_file:
+        journal = FlightJournal(
+            observability.journal_file,
+            records=observability.journal_records,
+            devices=[service.profile.home_assistant.device_id for service in services],
+        )
+    for service in services:
+        service.recorder = recorder
+        if journal is not None:
+            service.journal = journal.device(service.profile.home_assistant.device_id)
+            if hasattr(service.controller, "on_write"):
+                service.controller.on_write = service.journal.write
+    try:
+        for service in services:
+            service.controller.start()
+            service.warm_start()
+            service.dispatcher.start()
+        if local_server is not None:
+            local_server.start()
+        if metrics_server is not None:
+            metrics_server.start()
+        connection.start()
+    except BaseException:
+        if local_server is not None:
+            local_server.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        connection.close()
+        if recorder is not None:
+            recorder.close()
+        if journal is not None:
+            journal.close()
+        raise
+    try:
+        connection.loop_forever()
+    finally:
+        if local_server is not None:
+            local_server.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if recorder is not None:
+            recorder.close()
+        if journal is not None:
+            journal.close()
@@ -1,8 +1,12 @@
 """Logging helpers and health payload builders."""
 from __future__ import annotations
 
+import ctypes
 import json
 import logging
+import os
+import sys
+import threading
 from datetime import datetime, timezone
 from typing import Any, Optional, TYPE_CHECKING
 
@@ -62,7 +66,7 @@ def build_status_payload(
         "mode": control.state.value,
         "pilot_switch": "ON" if control.pilot_switch else "OFF",
         "light_state": "ON" if control.light_on else "OFF",
-        "updated_at": control.updated_at.astimezone(timezone.utc).isoformat(),
+        "updated_at": control.updated_at_iso,
         "last_color": control.last_command_color,
         "last_brightness": control.last_brightness,
     }
@@ -73,6 +77,55 @@ def build_status_payload(
     return json.dumps(payload, separators=(",", ":"))
 
 
+def thread_inventory() -> list[dict[str, Any]]:
+    """Live threads of the process (name, daemon flag, native id), sorted by name."""
+    return [
+        {"name": thread.name, "daemon": thread.daemon, "native_id": thread.native_id}
+        for thread in sorted(threading.enumerate(), key=lambda thread: thread.name)
+    ]
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or ``None`` where it cannot be read."""
+    if sys.platform == "win32":
+        return _windows_rss_bytes()
+    try:
+        with open("/proc/self/statm", "rb") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _windows_rss_bytes() -> Optional[int]:
+    class _Counters(ctypes.Structure):
+        _fields_ = [
+            ("cb", ctypes.c_ulong),
+            ("PageFaultCount", ctypes.c_ulong),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = _Counters()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        windll = ctypes.windll  # type: ignore[attr-defined]
+        current_process = windll.kernel32.GetCurrentProcess
+        current_process.restype = ctypes.c_void_p
+        memory_info = windll.psapi.GetProcessMemoryInfo
+        memory_info.argtypes = [ctypes.c_void_p, ctypes.POINTER(_Counters), ctypes.c_ulong]
+        if not memory_info(current_process(), ctypes.byref(counters), counters.cb):
+            return None
+    except (AttributeError, OSError):
+        return None
+    return int(counters.WorkingSetSize)
+
+
 def override_reason(kind: str, action: str) -> str:
     subject = (kind or "override").strip() or "override"
     return f"{subject}_{action}"
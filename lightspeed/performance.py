@@ -0,0 +1,97 @@
+"""Per-device performance figures behind the Home Assistant diagnostic sensors.
+
+Nothing is published per event: the hot paths only feed the cumulative
+metrics they already maintain (timings, write counter). Every
+``home_assistant.metrics_interval_seconds`` the service asks
+:class:`PerformanceSampler` for the figures of the elapsed interval and
+publishes them as one JSON document on ``topics.performance_topic``, read by
+all the diagnostic entities (see :mod:`lightspeed.ha_contracts`).
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lightspeed.metrics import MetricsRegistry, Timing
+
+# Écriture SDK plus lente (p95 de l'intervalle) : le SDK est signalé « slow »
+SDK_SLOW_SECONDS = 0.05
+SDK_STATUSES = ("ok", "slow", "released", "stopped")
+
+
+class PerformanceSampler:
+    """Turns one device's cumulative metrics into per-interval figures."""
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry,
+        device: str,
+        controller: Any,
+        queue_depth: Callable[[], int],
+    ) -> None:
+        self.metrics = metrics
+        self.device = device
+        self.controller = controller
+        self._queue_depth = queue_depth
+        self._sampled_at = time.monotonic()
+        self._counts: Dict[str, int] = {}
+
+    def sample(self) -> Dict[str, Any]:
+        """Figures since the previous call (or since creation)."""
+        now = time.monotonic()
+        elapsed = max(now - self._sampled_at, 1e-6)
+        self._sampled_at = now
+        commands, latency = self._new_samples("command_latency_seconds")
+        frames, jitter = self._new_samples("pattern_frame_jitter_seconds")
+        _writes, sdk = self._new_samples("sdk_write_seconds")
+        writes = self._delta("device_writes", getattr(self.controller, "write_count", None) or 0)
+        return {
+            "command_latency_p95_ms": _p95_ms(latency),
+            "commands": commands,
+            "device_writes_per_second": round(writes / elapsed, 2),
+            "effect_fps": round(frames / elapsed, 2),
+            "frame_jitter_p95_ms": _p95_ms(jitter),
+            "sdk_write_p95_ms": _p95_ms(sdk),
+            "sdk_status": self._sdk_status(sdk),
+            "queue_depth": self._queue_depth(),
+            "interval_seconds": round(elapsed, 1),
+        }
+
+    def _sdk_status(self, samples: List[float]) -> str:
+        if getattr(self.controller, "released", False):
+            return "released"
+        if not getattr(self.controller, "initialized", True):
+            return "stopped"
+        if samples and _percentile(samples, 0.95) > SDK_SLOW_SECONDS:
+            return "slow"
+        return "ok"
+
+    def _new_samples(self, name: str) -> Tuple[int, List[float]]:
+        """Number of observations since the last call, and the latest of them.
+
+        The count comes from the cumulative counter; the samples are bounded by
+        the timing's recent window and only feed the percentiles.
+        """
+        timing: Timing = self.metrics.timing(name, device=self.device)
+        new = self._delta(name, timing.count)
+        if new <= 0:
+            return 0, []
+        # Copie en C sous le GIL : pas de mutation concurrente pendant la copie
+        recent = list(timing.recent)
+        return new, recent[-new:]
+
+    def _delta(self, key: str, value: int) -> int:
+        previous = self._counts.get(key, 0)
+        self._counts[key] = value
+        return value - previous
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))]
+
+
+def _p95_ms(samples: List[float]) -> Optional[float]:
+    if not samples:
+        return None
+    return round(_percentile(samples, 0.95) * 1000, 3)
@@ -0,0 +1,144 @@
+"""Prometheus text exposition of a :class:`~lightspeed.metrics.MetricsRegistry`.
+
+:class:`MetricsServer` is an optional stdlib HTTP server on a background
+thread (``observability.metrics_port``, off by default) answering
+``GET /metrics``. The page is rendered from the registry at scrape time:
+the hot paths only update the plain counters, gauges and histogram buckets
+they already hold, with no lock and no exporter work.
+
+* counters → ``lightspeed_<name>_total``;
+* gauges → ``lightspeed_<name>``;
+* timings → histogram ``lightspeed_<name>`` (``_bucket``, ``_sum``, ``_count``);
+* process → ``process_resident_memory_bytes``, ``lightspeed_threads`` and
+  ``lightspeed_scheduled_timers``.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from lightspeed.metrics import TIMING_BUCKETS, LabelSet, MetricsRegistry
+from lightspeed.observability import process_rss_bytes
+from lightspeed.scheduler import default_scheduler
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "lightspeed_"
+
+_INVALID_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def render(registry: MetricsRegistry) -> str:
+    """Every metric of ``registry`` plus the process gauges, in text exposition format."""
+    counters, gauges, timings = registry.collect()
+    families: Dict[str, Tuple[str, List[str]]] = {}
+
+    def family(name: str, kind: str) -> List[str]:
+        return families.setdefault(name, (kind, []))[1]
+
+    for (name, labels), counter in counters:
+        metric = f"{PREFIX}{_metric_name(name)}_total"
+        family(metric, "counter").append(_sample(metric, labels, counter.value))
+    for (name, labels), gauge in gauges:
+        metric = PREFIX + _metric_name(name)
+        family(metric, "gauge").append(_sample(metric, labels, gauge.value))
+    for (name, labels), timing in timings:
+        metric = PREFIX + _metric_name(name)
+        samples = family(metric, "histogram")
+        cumulative = 0
+        for bound, count in zip(TIMING_BUCKETS + (float("inf"),), list(timing.buckets)):
+            cumulative += count
+            samples.append(_sample(f"{metric}_bucket", labels + (("le", _format(bound)),), cumulative))
+        samples.append(_sample(f"{metric}_sum", labels, timing.total))
+        samples.append(_sample(f"{metric}_count", labels, cumulative))
+
+    rss = process_rss_bytes()
+    if rss is not None:
+        family("process_resident_memory_bytes", "gauge").append(_sample("process_resident_memory_bytes", (), rss))
+    family(f"{PREFIX}threads", "gauge").append(_sample(f"{PREFIX}threads", (), threading.active_count()))
+    family(f"{PREFIX}scheduled_timers", "gauge").append(
+        _sample(f"{PREFIX}scheduled_timers", (), default_scheduler().pending)
+    )
+
+    lines: List[str] = []
+    for name in sorted(families):
+        kind, samples = families[name]
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves :func:`render` on ``http://<address>:<port>/metrics`` from a daemon thread."""
+
+    def __init__(self, registry: MetricsRegistry, address: str = "127.0.0.1", port: int = 9464) -> None:
+        self.registry = registry
+        self.address = address
+        self.port = port
+        self._server: Optional[HTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._server is not None:
+            return
+        self._server = HTTPServer((self.address, self.port), _handler(self.registry))
+        # Port 0 : port choisi par le système (tests)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics-http")
+        self._thread.start()
+        logger.info("Endpoint Prometheus ouvert", extra={"address": self.address, "port": self.port})
+
+    def close(self) -> None:
+        server, self._server = self._server, None
+        if server is None:
+            return
+        server.shutdown()
+        server.server_close()
+        if self._thread is not None:
+            self._thread.join(1.0)
+
+
+def _handler(registry: MetricsRegistry) -> type:
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - nom imposé par http.server
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render(registry).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:  # noqa: A002 - signature http.server
+            logger.debug("Scrape Prometheus: " + format, *args)
+
+    return MetricsHandler
+
+
+def _metric_name(name: str) -> str:
+    return _INVALID_NAME.sub("_", name)
+
+
+def _sample(name: str, labels: Iterable[Tuple[str, str]] | LabelSet, value: float) -> str:
+    rendered = ",".join(f'{_metric_name(key)}="{_escape(str(val))}"' for key, val in labels)
+    return f"{name}{{{rendered}}} {_format(value)}" if rendered else f"{name} {_format(value)}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
@@ -0,0 +1,122 @@
+"""Device rendering driven by :class:`~lightspeed.state_store.StateStore` changes.
+
+The renderer reduces a :class:`ControlMode` to what the keyboard should show
+(the running effect, a static color, black, or Logitech in control) and only
+touches the device when that target differs from what it last rendered.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Callable, Optional, Tuple
+
+from lightspeed import colors
+from lightspeed.colors import LightingBackend
+from lightspeed.config import ConfigProfile
+from lightspeed.control_mode import ControlMode, OverrideAction
+from lightspeed.metrics import MetricsRegistry
+from lightspeed.state_store import StateChange
+
+logger = logging.getLogger(__name__)
+
+# Cible de rendu : ("effect", kind, started_ns), ("static", rgb) ou ("released",)
+Target = Tuple
+
+RELEASED: Target = ("released",)
+
+
+def render_target(control: ControlMode) -> Target:
+    """What the device should show for ``control``: the effect first, then pilot/auto and on/off."""
+    if control.override is not None:
+        return ("effect", control.override.kind, control.override.started_ns)
+    if not control.pilot_switch:
+        return RELEASED
+    if not control.light_on:
+        return ("static", (0, 0, 0))
+    return ("static", colors.apply_brightness(control.last_command_color, control.last_brightness))
+
+
+class LightingRenderer:
+    """Applique au clavier chaque version de l'état (observateur ``on_change`` du store)."""
+
+    def __init__(self, controller: LightingBackend, profile: ConfigProfile, *, metrics: MetricsRegistry) -> None:
+        self.controller = controller
+        self.profile = profile
+        self.metrics = metrics
+        self.active = False
+        self._rendered: Optional[Target] = None
+
+    def activate(self, control: ControlMode) -> None:
+        """Premier rendu : snapshot local au démarrage, ou état restauré après la synchronisation."""
+        self.active = True
+        target = render_target(control)
+        if target == RELEASED and self._rendered is None:
+            # Au démarrage le logiciel Logitech a déjà la main : rien à rendre
+            self._rendered = target
+            logger.info("Mode auto, contrôle Logitech actif")
+            return
+        if target == self._rendered:
+            return
+        self._render(target, control, cause=None)
+        if target[0] == "static":
+            logger.info("Clavier initialisé (pilot mode)", extra={"color": target[1]})
+
+    def state_changed(self, change: StateChange) -> None:
+        if not self.active:
+            return
+        self._render(render_target(change.current), change.current, cause=change.cause)
+
+    def _render(self, target: Target, control: ControlMode, *, cause) -> None:
+        if target == self._rendered:
+            return
+        if target[0] == "effect":
+            self._start_effect(control.override, cause)
+        elif target == RELEASED:
+            self.controller.stop_pattern()
+            colors.restore_logitech_control(self.controller)
+            logger.info("Contrôle rendu à Logitech")
+        else:
+            # set_static_color arrête aussi le pattern éventuel
+            self.controller.set_static_color(target[1])
+        self._rendered = target
+
+    def _start_effect(self, override: OverrideAction, cause) -> None:
+        if override.kind == "alert":
+            frames = colors.alert_frames(self.profile)
+        elif override.kind == "warning":
+            frames = colors.warning_frames(self.profile)
+        else:
+            frames = colors.info_frames(self.profile)
+        logger.debug(
+            "Palette utilisée pour %s: %s",
+            override.kind,
+            [{"color": f"#{r:02X}{g:02X}{b:02X}", "duration": d} for (r, g, b), d in frames],
+        )
+        # Position sur la ligne de temps de l'effet (négative = début différé, effet synchronisé)
+        start_offset = (time.monotonic_ns() - override.started_ns) / 1e9
+        # Départ différé volontaire : la latence de première frame n'a plus de sens
+        probe = self._first_frame_probe(override.kind, getattr(cause, "received_at", None)) if start_offset >= 0 else None
+        self.controller.start_pattern(frames, on_first_frame=probe, start_offset=start_offset)
+        logger.info(
+            "Effet %s démarré",
+            override.kind,
+            extra={"duration": override.duration_seconds, "start_offset": round(start_offset, 3)},
+        )
+
+    def _first_frame_probe(self, kind: str, received_at: Optional[float]) -> Optional[Callable[[], None]]:
+        """Mesure réception MQTT → première frame écrite (SLO ``effects.alert_latency_slo_ms``)."""
+        if received_at is None:
+            return None
+        slo_seconds = self.profile.effects.alert_latency_slo_ms / 1000
+
+        def observe() -> None:
+            latency = time.monotonic() - received_at
+            self.metrics.timing("alert_first_frame_seconds", kind=kind).observe(latency)
+            if latency > slo_seconds:
+                self.metrics.counter("alert_slo_breaches", kind=kind).inc()
+                logger.warning(
+                    "SLO de latence d'alerte dépassé",
+                    extra={"kind": kind, "latency_ms": round(latency * 1000, 1)},
+                )
+
+        return observe
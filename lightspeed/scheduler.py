@@ -0,0 +1,210 @@
+"""One timer thread for the whole process: a heap of deadlines on the monotonic clock.
+
+Override expiry, debounce windows and periodic tasks all go through the
+same :class:`Scheduler` instead of one ``threading.Timer`` (one OS thread)
+each, so thread count and timer overhead stay flat however many effects and
+devices are active.
+
+* scheduling and :meth:`ScheduledCall.reschedule` push a heap entry: O(log n);
+* :meth:`ScheduledCall.cancel` invalidates the entry in O(1); stale entries are
+  dropped when they reach the top, or compacted once they outnumber live ones.
+
+Callbacks run on the scheduler thread, one at a time: they must stay short
+(a state transition, a publish) and hand blocking work to their own thread.
+:meth:`Scheduler.timer` returns an unstarted call with the ``threading.Timer``
+surface (``daemon``, ``start()``, ``cancel()``), so it can replace
+``threading.Timer`` wherever a ``timer_factory`` is injected.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledCall:
+    """Handle of a scheduled callback: cancel, reschedule, inspect."""
+
+    __slots__ = ("_scheduler", "_token", "deadline_ns", "interval_ns", "function", "args", "daemon")
+
+    def __init__(
+        self,
+        scheduler: Scheduler,
+        delay: float,
+        function: Callable[..., Any],
+        args: Tuple[Any, ...] = (),
+        *,
+        interval: Optional[float] = None,
+    ) -> None:
+        self._scheduler = scheduler
+        # Jeton de l'entrée valide dans le tas (None = pas planifié ou annulé)
+        self._token: Optional[int] = None
+        self.deadline_ns = time.monotonic_ns() + _to_ns(delay)
+        self.interval_ns = None if interval is None else _to_ns(interval)
+        self.function = function
+        self.args = args
+        # Compatibilité threading.Timer : le thread du scheduler est toujours daemon
+        self.daemon = True
+
+    @property
+    def scheduled(self) -> bool:
+        return self._token is not None
+
+    def remaining_seconds(self) -> float:
+        return max(0.0, (self.deadline_ns - time.monotonic_ns()) / 1e9)
+
+    def start(self) -> None:
+        """Schedule the call (``threading.Timer`` style); no-op when already scheduled."""
+        if self._token is None:
+            self._scheduler._push(self, self.deadline_ns)
+
+    def cancel(self) -> None:
+        self._scheduler._cancel(self)
+
+    def reschedule(self, delay: float) -> None:
+        """Move the deadline to ``delay`` seconds from now (also re-arms a cancelled call)."""
+        self._scheduler._push(self, time.monotonic_ns() + _to_ns(delay))
+
+
+class Scheduler:
+    """Heap-based timer queue served by one daemon thread, started on first use."""
+
+    # Compactage du tas quand les entrées annulées dépassent les entrées vivantes
+    _COMPACT_MIN = 64
+
+    def __init__(self, *, name: str = "scheduler", clock: Callable[[], int] = time.monotonic_ns) -> None:
+        self.name = name
+        self._clock = clock
+        self._heap: List[Tuple[int, int, ScheduledCall]] = []
+        self._tokens = itertools.count(1)
+        self._live = 0
+        self._condition = threading.Condition(threading.Lock())
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        """Number of scheduled (not cancelled, not yet run) calls."""
+        return self._live
+
+    def call_later(self, delay: float, function: Callable[..., Any], *args: Any) -> ScheduledCall:
+        call = ScheduledCall(self, delay, function, args)
+        self._push(call, call.deadline_ns)
+        return call
+
+    def call_every(self, interval: float, function: Callable[..., Any], *args: Any, delay: Optional[float] = None) -> ScheduledCall:
+        """Run ``function`` every ``interval`` seconds (first run after ``delay``, default ``interval``).
+
+        Deadlines advance from the previous deadline, not from the end of the
+        run, so the period does not drift; missed periods are skipped.
+        """
+        if interval <= 0:
+            raise ValueError("interval doit être > 0")
+        call = ScheduledCall(self, interval if delay is None else delay, function, args, interval=interval)
+        self._push(call, call.deadline_ns)
+        return call
+
+    def timer(self, delay: float, function: Callable[..., Any], args: Tuple[Any, ...] = ()) -> ScheduledCall:
+        """``threading.Timer``-compatible factory: the call starts with ``start()``."""
+        return ScheduledCall(self, delay, function, tuple(args))
+
+    def close(self) -> None:
+        """Stop the thread; pending calls are dropped."""
+        with self._condition:
+            self._closed = True
+            self._heap.clear()
+            self._live = 0
+            self._condition.notify()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+
+    def _push(self, call: ScheduledCall, deadline_ns: int) -> None:
+        with self._condition:
+            if self._closed:
+                return
+            if call._token is None:
+                self._live += 1
+            token = next(self._tokens)
+            call._token = token
+            call.deadline_ns = deadline_ns
+            heapq.heappush(self._heap, (deadline_ns, token, call))
+            if self._heap[0][1] == token:
+                # Nouvelle échéance la plus proche : réveille le thread
+                self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+                self._thread.start()
+
+    def _cancel(self, call: ScheduledCall) -> None:
+        with self._condition:
+            if call._token is None:
+                return
+            call._token = None
+            self._live -= 1
+            if len(self._heap) > self._COMPACT_MIN and len(self._heap) > 2 * self._live:
+                self._heap = [entry for entry in self._heap if entry[2]._token == entry[1]]
+                heapq.heapify(self._heap)
+
+    def _next_due(self) -> Optional[ScheduledCall]:
+        """Wait for the earliest live deadline; ``None`` once closed."""
+        with self._condition:
+            while not self._closed:
+                heap = self._heap
+                while heap and heap[0][2]._token != heap[0][1]:
+                    heapq.heappop(heap)  # entrée annulée ou replanifiée
+                if not heap:
+                    self._condition.wait()
+                    continue
+                deadline_ns, _token, call = heap[0]
+                delay_ns = deadline_ns - self._clock()
+                if delay_ns > 0:
+                    self._condition.wait(delay_ns / 1e9)
+                    continue
+                heapq.heappop(heap)
+                if call.interval_ns is None:
+                    call._token = None
+                    self._live -= 1
+                else:
+                    # Tâche périodique : prochaine échéance alignée sur la période, retards sautés
+                    now = self._clock()
+                    periods = max(1, (now - deadline_ns) // call.interval_ns + 1)
+                    next_deadline = deadline_ns + periods * call.interval_ns
+                    token = next(self._tokens)
+                    call._token = token
+                    call.deadline_ns = next_deadline
+                    heapq.heappush(heap, (next_deadline, token, call))
+                return call
+            return None
+
+    def _run(self) -> None:
+        while True:
+            call = self._next_due()
+            if call is None:
+                return
+            try:
+                call.function(*call.args)
+            except Exception:
+                logger.exception("Tâche planifiée en échec", extra={"function": getattr(call.function, "__qualname__", repr(call.function))})
+
+
+_default: Optional[Scheduler] = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler() -> Scheduler:
+    """Process-wide scheduler shared by every device and connection."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Scheduler()
+        return _default
+
+
+def _to_ns(seconds: float) -> int:
+    return max(0, int(seconds * 1_000_000_000))
@@ -0,0 +1,136 @@
+"""Local snapshot of a device's light state for an instant warm start.
+
+The snapshot holds the same fields as the retained ``state_topic`` document
+(``state``, ``rgb``, ``brightness``, ``mode``). It is rewritten at most once
+per debounce interval after state changes, atomically: the new content goes
+to a temporary file in the same directory, is fsynced, then replaces the
+snapshot with ``os.replace``, so a crash leaves either the old or the new
+file, never a truncated one. Running effects are not persisted.
+
+The debounce timer lives on the shared scheduler, whose callbacks must stay
+short: it only hands the write (and its ``fsync``) to a single writer thread
+shared by every snapshot of the process.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from lightspeed.control_mode import ControlMode
+from lightspeed.scheduler import default_scheduler
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE_SECONDS = 0.5
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _writer_executor() -> ThreadPoolExecutor:
+    """Single writer thread shared by all snapshots, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-writer")
+        return _executor
+
+
+def snapshot_document(control: ControlMode) -> Dict[str, Any]:
+    return {
+        "state": "on" if control.light_on else "off",
+        "rgb": list(control.last_command_color),
+        "brightness": control.last_brightness,
+        "mode": "pilot" if control.pilot_switch else "auto",
+        "saved_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def read_snapshot(path: Path | str) -> Optional[Dict[str, Any]]:
+    """Snapshot content, or ``None`` when the file is missing or unreadable."""
+    try:
+        data = json.loads(Path(path).expanduser().read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as exc:
+        logger.warning("Snapshot d'état illisible, ignoré", extra={"path": str(path), "error": str(exc)})
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def write_snapshot(path: Path | str, document: Dict[str, Any]) -> None:
+    """Replace ``path`` atomically with ``document``."""
+    target = Path(path).expanduser()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temporary = target.with_name(f"{target.name}.tmp")
+    with temporary.open("w", encoding="utf-8") as handle:
+        handle.write(json.dumps(document, separators=(",", ":")))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, target)
+
+
+class SnapshotWriter:
+    """Debounced writer fed by the state store's ``on_settled`` observer."""
+
+    def __init__(
+        self,
+        path: Path | str,
+        *,
+        debounce_seconds: float = DEBOUNCE_SECONDS,
+        timer_factory: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        self.path = Path(path).expanduser()
+        self.debounce_seconds = debounce_seconds
+        self._timer_factory = timer_factory or default_scheduler().timer
+        self._lock = threading.Lock()
+        # Sérialise les écritures du thread d'écriture et du flush final (arrêt)
+        self._write_lock = threading.Lock()
+        self._latest: Optional[ControlMode] = None
+        self._timer = None
+        self._written: Optional[tuple] = None
+        self.writes = 0
+
+    def schedule(self, control: ControlMode) -> None:
+        """Retient ``control``; l'écriture part au plus tard ``debounce_seconds`` après le premier changement."""
+        with self._lock:
+            self._latest = control
+            if self._timer is not None:
+                return
+            timer = self._timer_factory(self.debounce_seconds, self.flush_async)
+            timer.daemon = True
+            self._timer = timer
+        timer.start()
+
+    def flush_async(self) -> Future:
+        """Fin du délai (thread du scheduler) : l'écriture et son fsync partent sur le thread d'écriture."""
+        return _writer_executor().submit(self.flush)
+
+    def flush(self) -> None:
+        """Écrit immédiatement l'état retenu (thread d'écriture, ou arrêt du service)."""
+        with self._lock:
+            control, self._latest = self._latest, None
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if control is None:
+            return
+        document = snapshot_document(control)
+        key = (document["state"], tuple(document["rgb"]), document["brightness"], document["mode"])
+        with self._write_lock:
+            if key == self._written:
+                # Seuls des champs non persistés ont changé (effet, horodatage)
+                return
+            try:
+                write_snapshot(self.path, document)
+            except OSError as exc:
+                logger.warning("Écriture du snapshot d'état impossible", extra={"path": str(self.path), "error": str(exc)})
+                return
+            self._written = key
+            self.writes += 1
@@ -0,0 +1,193 @@
+"""Versioned store for a device's :class:`ControlMode` with ordered observers.
+
+Every transition is committed by compare-and-swap on a version number, so
+handlers, effect timers and the network thread never overwrite each other's
+updates. Side effects (device rendering, state publication) are observers:
+
+* ``on_change`` receives every committed :class:`StateChange`, in version order;
+* ``on_effect_start`` / ``on_effect_end`` fire when the running override
+  changes identity (kind and start instant; extending it is not a new effect);
+* ``on_settled`` runs once the pending changes are drained, with the last one,
+  so publishing happens once per batch instead of once per version.
+
+Observers run outside the state lock, synchronously on the committing
+thread; one re-entrant lock serializes delivery. A commit made from inside an
+observer (or a :meth:`StateStore.batch` block) is queued and delivered by the
+running loop. A writer on another thread still commits at once, then blocks
+on that lock until the ongoing delivery ends, which keeps notifications
+strictly ordered: a slow observer stalls every writer.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from lightspeed.control_mode import ControlMode, OverrideAction
+
+logger = logging.getLogger(__name__)
+
+Observer = Callable[["StateChange"], None]
+
+
+def effect_key(override: Optional[OverrideAction]) -> Optional[Tuple[str, int]]:
+    """Identity of a running effect: extending or re-arming it keeps the same key."""
+    if override is None:
+        return None
+    return override.kind, override.started_ns
+
+
+@dataclass(frozen=True)
+class StateChange:
+    version: int
+    previous: ControlMode
+    current: ControlMode
+    # Commande (ou autre objet) à l'origine de la transition, transmise aux observateurs
+    cause: Any = None
+
+    @property
+    def changed(self) -> bool:
+        return self.current is not self.previous
+
+    @property
+    def effect_started(self) -> Optional[OverrideAction]:
+        """The override that starts with this change, if any."""
+        if self.current.override is not None and effect_key(self.current.override) != effect_key(self.previous.override):
+            return self.current.override
+        return None
+
+    @property
+    def effect_ended(self) -> Optional[OverrideAction]:
+        """The override that stops (completed, replaced or cleared) with this change, if any."""
+        if self.previous.override is not None and effect_key(self.previous.override) != effect_key(self.current.override):
+            return self.previous.override
+        return None
+
+
+class StateStore:
+    """Holds the current :class:`ControlMode` and its version; safe to share between threads."""
+
+    def __init__(self, initial: ControlMode) -> None:
+        self._lock = threading.Lock()
+        self._state = initial
+        self._version = 0
+        self._pending: deque[StateChange] = deque()
+        # Un seul thread livre les notifications à la fois; réentrant pour les commits des observateurs
+        self._delivery = threading.RLock()
+        self._delivering = False
+        self._change_observers: List[Observer] = []
+        self._effect_start_observers: List[Observer] = []
+        self._effect_end_observers: List[Observer] = []
+        self._settled_observers: List[Observer] = []
+
+    @property
+    def state(self) -> ControlMode:
+        return self._state
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def read(self) -> Tuple[int, ControlMode]:
+        """Consistent ``(version, state)`` pair for a later :meth:`compare_and_set`."""
+        with self._lock:
+            return self._version, self._state
+
+    def on_change(self, observer: Observer) -> None:
+        self._change_observers.append(observer)
+
+    def on_effect_start(self, observer: Observer) -> None:
+        self._effect_start_observers.append(observer)
+
+    def on_effect_end(self, observer: Observer) -> None:
+        self._effect_end_observers.append(observer)
+
+    def on_settled(self, observer: Observer) -> None:
+        self._settled_observers.append(observer)
+
+    def compare_and_set(self, expected_version: int, state: ControlMode, *, cause: Any = None) -> Optional[StateChange]:
+        """Commit ``state`` if the store is still at ``expected_version``.
+
+        Returns the resulting change (``changed`` is false and the version is
+        kept when ``state`` is the current object), or ``None`` on conflict.
+        """
+        with self._lock:
+            if self._version != expected_version:
+                return None
+            previous = self._state
+            if state is previous:
+                return StateChange(self._version, previous, previous, cause)
+            self._version += 1
+            self._state = state
+            change = StateChange(self._version, previous, state, cause)
+            self._pending.append(change)
+        self._deliver()
+        return change
+
+    def update(self, transition: Callable[[ControlMode], ControlMode], *, cause: Any = None) -> StateChange:
+        """Apply ``transition`` to the latest state, retrying on conflict.
+
+        ``transition`` must be a pure function of its argument: it is called
+        again with the newer state when another writer committed first.
+        """
+        while True:
+            version, state = self.read()
+            change = self.compare_and_set(version, transition(state), cause=cause)
+            if change is not None:
+                return change
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Defer notifications of the commits made inside the block until it exits."""
+        with self._delivery:
+            outer = self._delivering
+            self._delivering = True
+            try:
+                yield
+            finally:
+                self._delivering = outer
+                if not outer:
+                    self._deliver()
+
+    def _deliver(self) -> None:
+        with self._delivery:
+            if self._delivering:
+                # Commit depuis un observateur ou un batch : la boucle en cours le livrera
+                return
+            self._delivering = True
+            try:
+                while True:
+                    last = self._drain()
+                    if last is None:
+                        break
+                    # Un observateur « settled » peut encore committer : on reboucle
+                    self._notify(self._settled_observers, last)
+            finally:
+                self._delivering = False
+
+    def _drain(self) -> Optional[StateChange]:
+        """Deliver the queued changes in version order; returns the last one."""
+        last: Optional[StateChange] = None
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return last
+                change = self._pending.popleft()
+            self._notify(self._change_observers, change)
+            if change.effect_ended is not None:
+                self._notify(self._effect_end_observers, change)
+            if change.effect_started is not None:
+                self._notify(self._effect_start_observers, change)
+            last = change
+
+    @staticmethod
+    def _notify(observers: List[Observer], change: StateChange) -> None:
+        for observer in observers:
+            try:
+                observer(change)
+            except Exception:
+                # Un observateur défaillant ne doit pas bloquer les suivants ni la version suivante
+                logger.exception("Observateur d'état en échec", extra={"version": change.version})
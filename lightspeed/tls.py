@@ -0,0 +1,95 @@
+"""TLS client context that resumes sessions across reconnects.
+
+A broker flap normally costs a full handshake (certificate chain, key
+exchange) on every reconnect. :class:`ResumingSSLContext` remembers the last
+session negotiated with each server name and offers it on the next
+``wrap_socket``, so the broker can answer with an abbreviated handshake.
+"""
+from __future__ import annotations
+
+import logging
+import ssl
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from lightspeed.config import TlsSettings
+from lightspeed.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedSSLSocket(ssl.SSLSocket):
+    """SSL socket reporting its handshake to the owning :class:`ResumingSSLContext`."""
+
+    def do_handshake(self, block: bool = False) -> None:
+        started = time.perf_counter()
+        super().do_handshake(block)
+        context = self.context
+        if isinstance(context, ResumingSSLContext):
+            context.handshake_completed(self, time.perf_counter() - started)
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """Client context keeping one resumable session per server name.
+
+    With TLS 1.3 the session ticket only arrives after the handshake, with the
+    first application data; call :meth:`remember` once the peer has answered
+    (e.g. on CONNACK) to capture it.
+    """
+
+    sslsocket_class = _TimedSSLSocket
+
+    def __init__(self, protocol: int = ssl.PROTOCOL_TLS_CLIENT, *, metrics: Optional[MetricsRegistry] = None) -> None:
+        self.metrics = metrics or MetricsRegistry()
+        self._sessions: Dict[Optional[str], ssl.SSLSession] = {}
+        self._sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock: Any, *args: Any, server_hostname: Optional[str] = None, session: Any = None, **kwargs: Any):
+        if session is None:
+            session = self.session_for(server_hostname)
+        return super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+
+    def session_for(self, server_hostname: Optional[str]) -> Optional[ssl.SSLSession]:
+        with self._sessions_lock:
+            return self._sessions.get(server_hostname)
+
+    def remember(self, sock: Any) -> None:
+        """Store the resumable session of ``sock`` for its server name."""
+        session = getattr(sock, "session", None)
+        if session is None:
+            return
+        if sock.version() == "TLSv1.3" and not session.has_ticket:
+            # Pas encore de ticket : la session ne permettrait pas de reprise
+            return
+        with self._sessions_lock:
+            self._sessions[sock.server_hostname] = session
+
+    def forget(self, server_hostname: Optional[str]) -> None:
+        with self._sessions_lock:
+            self._sessions.pop(server_hostname, None)
+
+    def handshake_completed(self, sock: ssl.SSLSocket, seconds: float) -> None:
+        resumed = "true" if sock.session_reused else "false"
+        self.metrics.timing("mqtt_tls_handshake_seconds", resumed=resumed).observe(seconds)
+        self.metrics.counter("mqtt_tls_handshakes", resumed=resumed).inc()
+        logger.debug(
+            "Handshake TLS terminé",
+            extra={"server": sock.server_hostname, "resumed": resumed, "seconds": round(seconds, 6)},
+        )
+        self.remember(sock)
+
+
+def build_ssl_context(settings: TlsSettings, *, metrics: Optional[MetricsRegistry] = None) -> ResumingSSLContext:
+    """Client context for ``settings``: CA bundle, optional client certificate, verification mode."""
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT, metrics=metrics)
+    if settings.ca_file:
+        context.load_verify_locations(cafile=settings.ca_file)
+    else:
+        context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    if settings.cert_file:
+        context.load_cert_chain(settings.cert_file, settings.key_file)
+    if settings.verify == "none":
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
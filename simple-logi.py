@@ -2,29 +2,23 @@
 from __future__ import annotations
 
 import argparse
+import json
 import logging
 import os
 import sys
-import threading
 import time
+from dataclasses import asdict
 from datetime import datetime, timezone
 from pathlib import Path
 from types import ModuleType
-from typing import Mapping, Optional, Sequence, Tuple
+from typing import Mapping, Sequence, Tuple
 
-from lightspeed.config import ConfigError, ConfigProfile, load_config
+from lightspeed.config import ALLOWED_BACKENDS, ConfigError, ConfigProfile, load_config
+from lightspeed.ipc import IpcError, send_command
 from lightspeed.observability import configure_logging
 
 try:
-    from lightspeed.mqtt import MqttLightingService
-except ImportError as exc:  # pragma: no cover - dependency guard
-    if "paho" in str(exc).lower():
-        print("Le module 'paho-mqtt' est requis. Installez-le avec: pip install -r requirements.txt")
-        sys.exit(1)
-    raise
-
-try:
-    import paho.mqtt.client as bootstrap_mqtt
+    from lightspeed.mqtt import build_device_services, request_diagnostics, run_services
 except ImportError as exc:  # pragma: no cover - dependency guard
     if "paho" in str(exc).lower():
         print("Le module 'paho-mqtt' est requis. Installez-le avec: pip install -r requirements.txt")
@@ -129,61 +123,6 @@ def run_cli_auto(profile: ConfigProfile) -> None:
         controller.shutdown()
 
 
-def _read_retained_state(
-    profile: ConfigProfile,
-    *,
-    logger: logging.Logger,
-    timeout: float = 2.0,
-) -> Optional[dict]:
-    """Lit l'état retained du state_topic si disponible."""
-
-    event = threading.Event()
-    state: dict[str, Optional[str]] = {"value": None}
-
-    client = bootstrap_mqtt.Client(
-        client_id=f"{profile.mqtt.client_id}-bootstrap",
-        clean_session=True,
-    )
-    if profile.mqtt.username:
-        client.username_pw_set(profile.mqtt.username, profile.mqtt.password or None)
-
-    def _on_connect(mqtt_client, _userdata, _flags, rc):
-        if rc != 0:
-            logger.warning("Connexion bootstrap échouée", extra={"code": rc})
-            event.set()
-            return
-        mqtt_client.subscribe(profile.topics.state_topic, qos=1)
-
-    def _on_message(_mqtt_client, _userdata, message):
-        try:
-            state["value"] = message.payload.decode("utf-8", errors="ignore").strip()
-        except Exception:
-            pass
-        event.set()
-
-    client.on_connect = _on_connect
-    client.on_message = _on_message
-
-    try:
-        client.connect(profile.mqtt.host, profile.mqtt.port, keepalive=profile.mqtt.keepalive)
-        client.loop_start()
-        event.wait(timeout)
-    except Exception as exc:  # pragma: no cover - defensive
-        logger.warning("Lecture état retained impossible", extra={"error": str(exc)})
-        return None
-    finally:
-        client.loop_stop()
-        client.disconnect()
-
-    if state["value"]:
-        try:
-            import json
-            return json.loads(state["value"])
-        except (json.JSONDecodeError, ValueError):
-            pass
-    return None
-
-
 def run_validate_command(config_path: Path) -> int:
     try:
         profile = load_config(config_path)
@@ -200,6 +139,102 @@ def run_validate_command(config_path: Path) -> int:
     return 0
 
 
+def run_send_command(profile: ConfigProfile, topic: str, payload: str) -> int:
+    try:
+        send_command(profile.ipc.address, topic, payload)
+    except (OSError, TimeoutError) as exc:
+        print(f"❌ Canal local injoignable ({profile.ipc.address}) : {exc}")
+        return 1
+    except IpcError as exc:
+        print(f"❌ Commande refusée : {exc}")
+        return 1
+    return 0
+
+
+def run_stats_command(profile: ConfigProfile, device_name: str | None, timeout: float) -> int:
+    devices = {device.name: device for device in profile.devices}
+    if device_name is not None and device_name not in devices:
+        print(f"❌ Device inconnu : {device_name} (attendu : {', '.join(devices)})")
+        return 1
+    device = devices[device_name] if device_name is not None else profile.devices[0]
+    try:
+        report = request_diagnostics(profile.for_device(device), timeout=timeout)
+    except (OSError, TimeoutError) as exc:
+        print(f"❌ Diagnostic indisponible : {exc}")
+        return 1
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+def run_loadtest_command(profile: ConfigProfile, rate: float, duration: float, mix: str | None, seed: int | None) -> int:
+    from lightspeed.harness import parse_mix, run_load  # Local import: harness only needed here
+
+    try:
+        report = run_load(profile, rate=rate, duration=duration, mix=parse_mix(mix) if mix else None, seed=seed)
+    except (ValueError, TimeoutError) as exc:
+        print(f"❌ Test de charge impossible : {exc}")
+        return 1
+    print(json.dumps(asdict(report), indent=2, ensure_ascii=False))
+    return 0 if report.drained else 1
+
+
+def _replay_speed(value: str) -> float | None:
+    if value.strip().lower() == 'max':
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("la vitesse doit être positive (ou 'max')")
+    return speed
+
+
+def run_replay_command(profile: ConfigProfile, capture: str, speed: float | None, backend: str | None, trace: str | None) -> int:
+    from lightspeed.capture import CaptureError
+    from lightspeed.harness import run_replay  # Local import: harness only needed here
+
+    try:
+        report = run_replay(profile, capture, speed=speed, backend=backend)
+    except (OSError, CaptureError, TimeoutError) as exc:
+        print(f"❌ Rejeu impossible : {exc}")
+        return 1
+    if trace:
+        Path(trace).write_text(''.join(entry.to_line() + '\n' for entry in report.trace), encoding='utf-8')
+    summary = {
+        'commands': report.commands,
+        'skipped': report.skipped,
+        'duration_seconds': report.duration_seconds,
+        'writes': len(report.trace),
+        'drained': report.drained,
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if report.drained else 1
+
+
+def run_journal_command(path: str | None, last: int | None, as_json: bool) -> int:
+    from lightspeed.journal import JournalError, read_journal
+
+    if not path:
+        print("❌ Aucun journal : passer le fichier ou définir observability.journal_file")
+        return 1
+    try:
+        devices, entries = read_journal(path)
+    except (OSError, JournalError) as exc:
+        print(f"❌ Journal illisible : {exc}")
+        return 1
+    if last is not None:
+        entries = entries[-last:] if last > 0 else []
+    if as_json:
+        print(json.dumps(
+            {'devices': devices, 'records': [asdict(entry) for entry in entries]},
+            indent=2,
+            ensure_ascii=False,
+            default=str,
+        ))
+    else:
+        for entry in entries:
+            print(entry.to_line())
+    return 0
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description='Middleware Logitech LED contrôlé par MQTT')
     parser.add_argument(
@@ -224,6 +259,40 @@ def main() -> None:
 
     subparsers.add_parser('auto', help='Rend la main immédiatement')
 
+    stats_parser = subparsers.add_parser('stats', help='Interroge le service en cours via le topic de diagnostic')
+    stats_parser.add_argument('--device', default=None, help='Nom du device (défaut: le premier)')
+    stats_parser.add_argument('--timeout', type=float, default=5.0, help='Attente max de la réponse en secondes')
+
+    load_parser = subparsers.add_parser(
+        'loadtest',
+        help='Charge le premier device sur un broker en mémoire (backend simulé) et mesure débit et latences',
+    )
+    load_parser.add_argument('--rate', type=float, default=1000.0, help='Commandes par seconde')
+    load_parser.add_argument('--duration', type=float, default=10.0, help='Durée de la charge en secondes')
+    load_parser.add_argument('--mix', default=None, help='Poids par type, ex: rgb=0.6,binary=0.2,json=0.1,brightness=0.1,alert=0')
+    load_parser.add_argument('--seed', type=int, default=None, help='Graine du tirage des commandes')
+
+    replay_parser = subparsers.add_parser(
+        'replay',
+        help='Rejoue une capture de commandes (observability.capture_file) sur un broker en mémoire',
+    )
+    replay_parser.add_argument('capture', help='Fichier de capture')
+    replay_parser.add_argument('--speed', type=_replay_speed, default=1.0, help='Facteur de vitesse (1, 10...) ou max')
+    replay_parser.add_argument('--backend', choices=sorted(ALLOWED_BACKENDS), default=None, help='Backend de tous les devices (défaut: celui de la config)')
+    replay_parser.add_argument('--trace', default=None, help='Écrit la trace des écritures clavier (secondes, device, #RRGGBB)')
+
+    journal_parser = subparsers.add_parser(
+        'journal',
+        help='Décode le journal circulaire (observability.journal_file), par exemple après un crash',
+    )
+    journal_parser.add_argument('file', nargs='?', default=None, help='Fichier journal (défaut: observability.journal_file)')
+    journal_parser.add_argument('--last', type=int, default=None, help='N derniers enregistrements seulement')
+    journal_parser.add_argument('--json', action='store_true', help='Sortie JSON au lieu d\'une ligne par enregistrement')
+
+    send_parser = subparsers.add_parser('send', help='Envoie une commande au service via le canal local (sans broker)')
+    send_parser.add_argument('topic', help='Topic de commande, complet ou relatif à topics.base (ex: alert, rgb/set)')
+    send_parser.add_argument('payload', nargs='?', default='', help='Payload de la commande')
+
     normalized_args = _normalize_global_args(sys.argv[1:])
     args = parser.parse_args(normalized_args)
     config_path = resolve_config_path(args.config, os.environ)
@@ -231,8 +300,21 @@ def main() -> None:
 
     if command == 'validate-config':
         sys.exit(run_validate_command(config_path))
+    if command == 'journal' and args.file:
+        # Lecture post-mortem : le fichier suffit, sans config
+        sys.exit(run_journal_command(args.file, args.last, args.json))
 
     profile = load_config(config_path)
+    if command == 'send':
+        sys.exit(run_send_command(profile, args.topic, args.payload))
+    if command == 'journal':
+        sys.exit(run_journal_command(profile.observability.journal_file, args.last, args.json))
+    if command == 'stats':
+        sys.exit(run_stats_command(profile, args.device, args.timeout))
+    if command == 'replay':
+        sys.exit(run_replay_command(profile, args.capture, args.speed, args.backend, args.trace))
+    if command == 'loadtest':
+        sys.exit(run_loadtest_command(profile, args.rate, args.duration, args.mix, args.seed))
     configure_logging(profile.observability.log_level)
     logger = logging.getLogger('lightspeed.app')
     validated_at = datetime.now(timezone.utc)
@@ -244,31 +326,16 @@ def main() -> None:
         },
     )
     if command == 'serve':
-        lighting = _lighting_module()
-        service = MqttLightingService(
-            lighting.LightingController(
-                profile.logitech.dll_path,
-                lock_file=profile.lighting.lock_file,
-            ),
-            profile,
-            validated_at=validated_at,
-        )
-        
-        # Lire l'état retained pour restaurer l'état précédent
-        retained_state = _read_retained_state(profile, logger=logger)
-        if retained_state:
-            service.bootstrap_from_retained(retained_state)
-            logger.info("État restauré depuis MQTT", extra={"state": retained_state})
-        else:
-            logger.info("Aucun état retained trouvé, utilisation des valeurs par défaut")
-        
+        # Un service par device, tous sur une seule connexion MQTT ; l'état retained
+        # de chaque device est relu sur cette connexion.
+        services = build_device_services(profile, validated_at=validated_at)
+        logger.info("Devices configurés", extra={"devices": [device.name for device in profile.devices]})
         try:
-            service.start()
-            service.loop_forever()
+            run_services(services)
         except KeyboardInterrupt:
             logger.info('Arrêt demandé par l\'utilisateur.')
         finally:
-            service.stop()
+            services[0].stop()
     elif command == 'color':
         run_cli_color(profile, args.value, args.duration)
     elif command == 'alert':
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import copy
+
+import pytest
+import yaml
+
+from lightspeed.config import load_config
+
+BASE_CONFIG = {
+    "mqtt": {"host": "broker.local", "client_id": "alerts"},
+    "topics": {"base": "foo/bar"},
+    "home_assistant": {"device_id": "foo", "device_name": "Foo Device"},
+    "lighting": {"default_color": "#336699", "lock_file": "lock.bin"},
+    "logitech": {"profile_backup": "backup.json"},
+}
+
+
+def _merge(base: dict, overrides: dict) -> dict:
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@pytest.fixture
+def make_profile(tmp_path):
+    """Écrit BASE_CONFIG complété des sections fournies, puis le charge avec load_config."""
+
+    def make(filename: str = "config.yaml", **overrides):
+        config_path = tmp_path / filename
+        config_path.write_text(yaml.safe_dump(_merge(BASE_CONFIG, overrides)), encoding="utf-8")
+        return load_config(config_path)
+
+    return make
+
+
+@pytest.fixture
+def profile(request, make_profile):
+    """Profil de base ; ``@pytest.mark.parametrize("profile", [{...}], indirect=True)`` pour le surcharger."""
+    return make_profile(**getattr(request, "param", {}))
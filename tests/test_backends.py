@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.colors import timeline_position
+
+RED, GREEN, BLUE = (255, 0, 0), (0, 255, 0), (0, 0, 255)
+FRAMES = ((RED, 0.2), (GREEN, 0.3), (BLUE, 0.5))
+
+
+def test_timeline_position_wraps_around_the_pattern_period():
+    assert timeline_position(FRAMES, 0.0) == (0, 0.2)
+    index, remaining = timeline_position(FRAMES, 0.35)
+    assert index == 1 and abs(remaining - 0.15) < 1e-9
+    index, remaining = timeline_position(FRAMES, 1.0 + 0.6)
+    assert index == 2 and abs(remaining - 0.4) < 1e-9
+
+
+def test_late_joiner_starts_mid_pattern_and_early_start_waits():
+    controller = SimulatedLightingController()
+    controller.start_pattern(FRAMES, start_offset=0.6)
+    time.sleep(0.05)
+    controller.stop_pattern()
+    assert controller.colors()[0] == BLUE
+
+    delayed = SimulatedLightingController()
+    delayed.start_pattern(FRAMES, start_offset=-0.3)
+    time.sleep(0.1)
+    assert delayed.colors() == []
+    time.sleep(0.3)
+    delayed.stop_pattern()
+    assert delayed.colors()[0] == RED
+
+
+def test_new_pattern_takes_over_the_running_loop_without_a_gap():
+    controller = SimulatedLightingController()
+    controller.start_pattern(FRAMES)
+    time.sleep(0.05)
+    thread = controller.pattern_thread
+    switched_at = time.monotonic_ns()
+    controller.start_pattern(((GREEN, 0.2), (BLUE, 0.2)), start_offset=0.25)
+    time.sleep(0.05)
+
+    assert controller.pattern_thread is thread and thread.is_alive()
+    assert controller.frame_position == (1, 2)
+    first_after = next(at for at, _color in controller.writes if at >= switched_at)
+    assert (first_after - switched_at) / 1e9 < 0.03
+    assert controller.colors()[:2] == [RED, BLUE]
+
+    controller.stop_pattern()
+    assert not thread.is_alive()
+    controller.start_pattern(FRAMES)
+    assert controller.pattern_thread is not thread
+    controller.stop_pattern()
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+
+import pytest
+
+from lightspeed.capture import CaptureError, CapturedCommand, CommandRecorder, read_capture, replay
+from lightspeed.codec import BINARY_CONTENT_TYPE, encode_rgb
+from lightspeed.harness import run_replay
+from lightspeed.ipc import LocalMessage
+
+
+def test_recorder_appends_sessions_and_reader_tolerates_a_cut_tail(tmp_path):
+    path = tmp_path / "capture.bin"
+    first = CommandRecorder(path)
+    first.record(LocalMessage("foo/bar/rgb/set", b"255,0,0"), timestamp_ns=5_000)
+    first.close()
+    second = CommandRecorder(path)
+    binary = LocalMessage("foo/bar/bin/set", encode_rgb((1, 2, 3)), properties=_binary_properties())
+    second.record(binary, timestamp_ns=1_000)
+    second.close()
+    with path.open("ab") as handle:
+        handle.write(b"\x00\x00\x01")
+
+    assert list(read_capture(path)) == [
+        CapturedCommand(5_000, "foo/bar/rgb/set", b"255,0,0"),
+        CapturedCommand(1_000, "foo/bar/bin/set", encode_rgb((1, 2, 3)), binary=True),
+    ]
+
+
+def test_reader_rejects_foreign_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("hello", encoding="utf-8")
+    with pytest.raises(CaptureError):
+        list(read_capture(path))
+
+
+def test_replay_keeps_spacing_scaled_by_speed_and_reanchors_new_sessions():
+    now = [0.0]
+    fed: list[tuple[float, str]] = []
+    commands = [
+        CapturedCommand(1_000_000_000, "a", b""),
+        CapturedCommand(3_000_000_000, "b", b""),
+        CapturedCommand(500_000_000, "c", b""),  # nouvelle session : horloge repartie de zéro
+        CapturedCommand(1_500_000_000, "d", b""),
+    ]
+
+    def sleep(seconds: float) -> None:
+        now[0] += seconds
+
+    count = replay(commands, lambda command: fed.append((now[0], command.topic)), speed=4, clock=lambda: now[0], sleep=sleep)
+
+    assert count == 4
+    assert fed == [(0.0, "a"), (0.5, "b"), (0.5, "c"), (0.75, "d")]
+
+
+@pytest.mark.parametrize("profile", [{"devices": [{"name": "keyboard", "backend": "simulated"}]}], indirect=True)
+def test_replayed_capture_produces_the_same_write_trace_on_every_run(tmp_path, profile):
+    path = tmp_path / "storm.bin"
+    recorder = CommandRecorder(path)
+    topics = profile.devices[0].topics
+    for index, (topic, payload) in enumerate([
+        (topics.rgb_command_topic, b"10,20,30"),
+        (topics.binary_command_topic, encode_rgb((40, 50, 60))),
+        ("other/device/rgb/set", b"1,1,1"),
+        (topics.brightness_command_topic, b"0"),
+    ]):
+        recorder.record(LocalMessage(topic, payload), timestamp_ns=index * 1_000_000)
+    recorder.close()
+
+    runs = [run_replay(profile, str(path), speed=None) for _ in range(2)]
+
+    for report in runs:
+        assert report.drained
+        assert (report.commands, report.skipped) == (3, 1)
+        assert [entry.color for entry in report.trace] == [(10, 20, 30), (40, 50, 60), (0, 0, 0)]
+        assert {entry.device for entry in report.trace} == {"keyboard"}
+    assert runs[0].trace[0].to_line().endswith("\tkeyboard\t#0A141E")
+
+
+def _binary_properties():
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = BINARY_CONTENT_TYPE
+    return properties
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import pytest
+
+from lightspeed.codec import CodecError, LightCommand, decode_command, encode_brightness, encode_command, encode_rgb
+
+
+def test_single_field_frames_round_trip():
+    assert decode_command(encode_rgb((1, 2, 3))) == LightCommand(rgb=(1, 2, 3))
+    assert decode_command(encode_brightness(128)) == LightCommand(brightness=128)
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        LightCommand(on=True, rgb=(255, 0, 10), brightness=40),
+        LightCommand(on=False),
+        LightCommand(rgb=(0, 0, 0)),
+    ],
+)
+def test_combined_set_round_trip(command):
+    frame = encode_command(command)
+
+    assert len(frame) == 6
+    assert decode_command(frame) == command
+
+
+@pytest.mark.parametrize("payload", [b"", b"\x01\x00", b"\x7f\x00\x00\x00"])
+def test_malformed_frames_raise(payload):
+    with pytest.raises(CodecError):
+        decode_command(payload)
@@ -299,3 +299,84 @@ def test_topics_allow_custom_suffixes(tmp_path):
     assert profile.topics.info_command_topic == "foo/bar/info"
 
 
+
+
+def test_devices_inherit_root_sections_and_share_lwt(tmp_path):
+    config_path = _write_config(
+        tmp_path,
+        """
+        mqtt:
+          host: localhost
+          client_id: alerts
+        topics:
+          base: desk
+        home_assistant:
+          device_id: desk
+          device_name: Desk
+          manufacturer: Test
+          model: RevA
+        lighting:
+          default_color: "#112233"
+          lock_file: lightspeed.lock
+        devices:
+        - name: keyboard
+          target: perkey_rgb
+        - name: headset
+          backend: simulated
+          topics:
+            base: desk/audio/headset
+          lighting:
+            default_color: "#FF0000"
+        """,
+    )
+
+    profile = load_config(config_path)
+    keyboard, headset = profile.devices
+
+    assert keyboard.backend == "logitech"
+    assert keyboard.target == "perkey_rgb"
+    assert keyboard.topics.rgb_command_topic == "desk/keyboard/rgb/set"
+    assert keyboard.home_assistant.device_id == "desk_keyboard"
+    assert keyboard.lighting.default_color == (17, 34, 51)
+    assert keyboard.lighting.lock_file == "lightspeed-keyboard.lock"
+    assert headset.backend == "simulated"
+    assert headset.topics.state_topic == "desk/audio/headset/status"
+    assert headset.topics.lwt == keyboard.topics.lwt == "desk/lwt"
+    assert profile.for_device(headset).lighting.default_color == (255, 0, 0)
+
+
+def test_single_device_profile_without_devices_section(tmp_path):
+    config_path = _write_config(
+        tmp_path,
+        """
+        mqtt:
+          host: localhost
+          client_id: alerts
+        topics:
+          base: foo/bar
+        """,
+    )
+
+    profile = load_config(config_path)
+
+    (device,) = profile.devices
+    assert device.topics == profile.topics
+    assert profile.for_device(device) == profile
+
+
+def test_duplicate_device_names_raise(tmp_path):
+    config_path = _write_config(
+        tmp_path,
+        """
+        mqtt:
+          host: localhost
+          client_id: alerts
+        devices:
+        - name: keyboard
+        - name: keyboard
+          backend: simulated
+        """,
+    )
+
+    with pytest.raises(ConfigError):
+        load_config(config_path)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from dataclasses import FrozenInstanceError
+from datetime import datetime, timedelta, timezone
 
 import pytest
 
@@ -53,6 +54,35 @@ def test_start_override_then_clear():
     assert cleared.override is None
 
 
+def test_severe_override_preempts_and_the_interrupted_one_resumes_with_its_remaining_time():
+    start = datetime(2026, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+    state = ControlMode.bootstrap(default_color=(1, 2, 3)).start_override(
+        kind="info", duration_seconds=30, timestamp=start
+    )
+    state = state.start_override(kind="alert", duration_seconds=10, timestamp=start + timedelta(seconds=12))
+    assert state.override.kind == "alert"
+    assert [(paused.kind, paused.duration_seconds) for paused in state.suspended] == [("info", 18)]
+
+    # Moins grave que l'alerte : attend, une entrée par type (la plus longue)
+    state = state.start_override(kind="warning", duration_seconds=5, timestamp=start + timedelta(seconds=13))
+    state = state.start_override(kind="info", duration_seconds=10, timestamp=start + timedelta(seconds=14))
+    assert state.state is Mode.OVERRIDE_ALERT
+    assert [(paused.kind, paused.duration_seconds) for paused in state.suspended] == [("warning", 5), ("info", 18)]
+    assert state.snapshot()["suspended"][0] == {"kind": "warning", "remaining_seconds": 5}
+
+    resumed_at = start + timedelta(seconds=22)
+    state = state.finish_override(timestamp=resumed_at)
+    assert (state.override.kind, state.override.started_at, state.override.expires_at) == (
+        "warning", resumed_at, resumed_at + timedelta(seconds=5)
+    )
+    state = state.finish_override().finish_override()
+    assert state.override is None and state.suspended == () and state.state is Mode.PILOT
+
+    queued = ControlMode.bootstrap(default_color=(1, 2, 3)).start_override(kind="alert", duration_seconds=5)
+    queued = queued.start_override(kind="info", duration_seconds=5)
+    assert queued.clear_override().suspended == ()
+
+
 def test_invalid_override_kind_raises():
     state = ControlMode.bootstrap(default_color=(1, 2, 3))
     with pytest.raises(ValueError):
@@ -75,3 +105,45 @@ def test_parse_mode_payload_accepts_valid_values():
     assert parse_mode_payload(" LOGI ") is Mode.LOGI
     assert parse_mode_payload("invalid") is None
     assert parse_mode_payload("") is None
+
+
+def test_noop_transition_returns_the_same_version():
+    state = ControlMode.bootstrap(default_color=(1, 2, 3))
+
+    assert state.set_light_state(on=True) is state
+    assert state.set_pilot_switch(True) is state
+    assert state.record_color_command(base_color=(1, 2, 3), brightness=255) is state
+    assert state.clear_override() is state
+    assert state.record_color_command(base_color=(1, 2, 4), brightness=255) is not state
+
+
+def test_state_is_slotted_immutable_and_serializes_iso_once_per_version():
+    state = ControlMode.bootstrap(default_color=(1, 2, 3))
+
+    assert not hasattr(state, "__dict__")
+    with pytest.raises(FrozenInstanceError):
+        state.light_on = False
+    snapshot = state.snapshot()
+    assert snapshot["updated_at"] == state.updated_at.isoformat()
+    assert state.snapshot()["updated_at"] is snapshot["updated_at"]
+    assert state.updated_at.tzinfo is not None
+
+
+def test_override_timestamps_round_trip_through_the_monotonic_clock():
+    started = datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+    state = ControlMode.bootstrap(default_color=(1, 2, 3)).start_override(
+        kind="warning", duration_seconds=10, timestamp=started
+    )
+
+    assert state.updated_at == started
+    assert state.override.expires_at == started + timedelta(seconds=10)
+    assert state.override.to_payload() == {
+        "kind": "warning",
+        "duration_seconds": 10,
+        "started_at": "2026-03-01T12:00:00.123456+00:00",
+        "expires_at": "2026-03-01T12:00:10.123456+00:00",
+    }
+    extended = state.extend_override(duration_seconds=10, timestamp=started + timedelta(seconds=5))
+    assert extended.override.duration_seconds == 15
+    assert extended.override.started_at == started
+    assert extended.override.remaining_seconds(now_ns=extended.override.started_ns) == 15
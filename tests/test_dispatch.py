@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import threading
+import time
+from types import SimpleNamespace
+
+from lightspeed.dispatch import CommandDispatcher, Lane, TokenBucket
+from lightspeed.metrics import MetricsRegistry
+
+
+def _command(topic: str, payload: str):
+    return SimpleNamespace(topic=topic, payload=payload)
+
+
+def test_overrides_preempt_queued_light_commands_which_coalesce():
+    handled: list[str] = []
+    release = threading.Event()
+    done = threading.Event()
+
+    def handler(message, _received_at):
+        if message.payload == "blocker":
+            release.wait(2)
+        handled.append(message.payload)
+        if message.payload == "done":
+            done.set()
+
+    metrics = MetricsRegistry()
+    dispatcher = CommandDispatcher(handler, metrics=metrics)
+    dispatcher.start()
+    try:
+        now = time.monotonic()
+        dispatcher.submit(_command("rgb", "blocker"), Lane.LIGHT, received_at=now)
+        while dispatcher.pending():
+            time.sleep(0.001)
+        for value in ("#000001", "#000002", "#000003"):
+            dispatcher.submit(_command("rgb", value), Lane.LIGHT, received_at=now, coalesce_key="rgb")
+        dispatcher.submit(_command("alert", "alert-1"), Lane.OVERRIDE, received_at=now)
+        dispatcher.submit(_command("alert", "alert-2"), Lane.OVERRIDE, received_at=now)
+        dispatcher.submit(_command("bin", "done"), Lane.LIGHT, received_at=now)
+        release.set()
+        assert done.wait(2)
+    finally:
+        dispatcher.stop()
+
+    assert handled == ["blocker", "alert-1", "alert-2", "#000003", "done"]
+    assert metrics.counter("commands_coalesced").value == 2
+
+
+def test_commands_run_inline_until_started():
+    handled: list[str] = []
+    dispatcher = CommandDispatcher(lambda message, _at: handled.append(message.payload), metrics=MetricsRegistry())
+
+    dispatcher.submit(_command("rgb", "#FFFFFF"), Lane.LIGHT, received_at=time.monotonic(), coalesce_key="rgb")
+
+    assert handled == ["#FFFFFF"]
+
+
+def test_token_bucket_allows_burst_then_refills_at_rate():
+    now = [0.0]
+    bucket = TokenBucket(2.0, 3, clock=lambda: now[0])
+
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    now[0] = 0.5
+    assert bucket.try_acquire() is True
+    assert bucket.try_acquire() is False
+
+
+class _SlowRate(float):
+    """Taux nul dont le calcul de recharge cède la main : élargit la fenêtre lecture/écriture du solde."""
+
+    def __rmul__(self, other: float) -> float:
+        time.sleep(0.0005)
+        return 0.0
+
+
+def test_token_bucket_never_grants_more_than_its_burst_across_threads():
+    bucket = TokenBucket(_SlowRate(0.0), 40, clock=lambda: 0.0)
+    granted: list[bool] = []
+    start = threading.Barrier(2)
+
+    def worker() -> None:
+        start.wait()
+        granted.extend(bucket.try_acquire() for _ in range(40))
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert granted.count(True) == 40
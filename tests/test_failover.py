@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import socket
+import threading
+import time
+
+import pytest
+
+from lightspeed import connection as connection_module
+from lightspeed.config import BrokerEndpoint
+from lightspeed.connection import MqttConnection
+from lightspeed.failover import ProbeResult, choose_endpoint, probe_broker
+
+
+class _FakeBroker:
+    """Accepts TCP connections and answers each CONNECT with a CONNACK."""
+
+    def __init__(self, return_code: int = 0) -> None:
+        self.return_code = return_code
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.connects: list[bytes] = []
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                self.connects.append(conn.recv(1024))
+                conn.sendall(bytes([0x20, 0x02, 0x00, self.return_code]))
+                conn.recv(16)
+
+    def close(self) -> None:
+        self.server.close()
+
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def broker():
+    server = _FakeBroker()
+    yield server
+    server.close()
+
+
+def _profile(make_profile, primary_port: int, fallback_port: int):
+    return make_profile(
+        mqtt={
+            "host": "127.0.0.1",
+            "port": primary_port,
+            "username": "user",
+            "password": "secret",
+            "probe_timeout_seconds": 1,
+            "fallback_brokers": [{"host": "127.0.0.1", "port": fallback_port}],
+        }
+    )
+
+
+def test_probe_measures_healthy_broker_and_reports_unreachable(make_profile, broker):
+    profile = _profile(make_profile, _unused_port(), broker.port)
+    primary, fallback = profile.mqtt.brokers
+
+    up = probe_broker(fallback, profile.mqtt, timeout=1)
+    down = probe_broker(primary, profile.mqtt, timeout=1)
+
+    assert up.healthy and up.rtt_seconds is not None
+    assert b"alerts-probe-" in broker.connects[0]
+    assert b"user" in broker.connects[0] and b"secret" in broker.connects[0]
+    assert not down.healthy and down.latency == float("inf")
+
+
+def test_choose_endpoint_prefers_primary_within_margin():
+    primary = BrokerEndpoint("edge", 1883)
+    central = BrokerEndpoint("central", 1883)
+    results = [
+        ProbeResult(primary, True, connect_seconds=0.010, rtt_seconds=0.005),
+        ProbeResult(central, True, connect_seconds=0.002, rtt_seconds=0.002),
+    ]
+
+    assert choose_endpoint(results, primary=primary, margin_seconds=0.020) == primary
+    assert choose_endpoint(results, primary=primary, margin_seconds=0.001) == central
+    assert choose_endpoint([ProbeResult(primary, False)], primary=primary, margin_seconds=0.02) is None
+
+
+class _FakeClient:
+    def __init__(self, *args, **kwargs) -> None:
+        self.targets: list[tuple[str, int]] = []
+
+    def username_pw_set(self, *_args) -> None:
+        pass
+
+    def will_set(self, *_args, **_kwargs) -> None:
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120) -> None:
+        pass
+
+    def connect_async(self, host, port=1883, keepalive=60, **_kwargs) -> None:
+        self.targets.append((host, port))
+
+    def loop_stop(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+
+def test_disconnect_fails_over_to_healthy_fallback(monkeypatch, make_profile, broker):
+    monkeypatch.setattr(connection_module.mqtt, "Client", _FakeClient)
+    profile = _profile(make_profile, _unused_port(), broker.port)
+    connection = MqttConnection(profile)
+
+    # Callback du thread réseau : aucune sonde, la re-sélection est confiée au thread de failback
+    connection.on_disconnect(connection.client, None, 7)
+    assert connection.client.targets == []
+    connection._start_failback_thread()
+    deadline = time.monotonic() + 5
+    while not connection.client.targets and time.monotonic() < deadline:
+        time.sleep(0.01)
+    connection.close()
+
+    assert connection.endpoint == BrokerEndpoint("127.0.0.1", broker.port)
+    assert connection.client.targets == [("127.0.0.1", broker.port)]
+    assert connection.metrics.counter("mqtt_failovers").value == 1
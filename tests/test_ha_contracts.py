@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import dataclasses
 import json
 import textwrap
 
+from lightspeed import ha_contracts
 from lightspeed.config import load_config
-from lightspeed.ha_contracts import iter_discovery_messages
+from lightspeed.ha_contracts import cached_discovery_messages, iter_discovery_messages
 
 
 def _write_config(tmp_path, content: str):
@@ -95,3 +97,60 @@ def test_iter_discovery_messages_publishes_single_device_payload(tmp_path):
     info_btn = payload["components"]["info_button"]
     assert info_btn["platform"] == "button"
     assert info_btn["command_topic"] == "foo/bar/info"
+
+
+def test_json_schema_light_uses_single_command_topic(tmp_path):
+    config_path = _write_config(
+        tmp_path,
+        """
+        mqtt:
+          host: broker.local
+          client_id: alerts
+        topics:
+          base: foo/bar
+        home_assistant:
+          device_id: foo
+          light_schema: json
+        """,
+    )
+    profile = load_config(config_path)
+
+    (message,) = iter_discovery_messages(profile)
+    components = json.loads(message.payload)["components"]
+    light = components["light"]
+
+    assert light["schema"] == "json"
+    assert light["command_topic"] == "foo/bar/light/set"
+    assert light["effect_list"] == ["alert", "warning", "info"]
+    assert "rgb_command_topic" not in light
+    assert components["status_sensor"]["payload_on"] == "ON"
+
+
+def test_discovery_cache_hashes_once_and_keeps_one_entry_per_device(monkeypatch, tmp_path):
+    config_path = _write_config(
+        tmp_path,
+        """
+        mqtt:
+          host: broker.local
+          client_id: alerts
+        topics:
+          base: foo/bar
+        home_assistant:
+          device_id: foo
+        """,
+    )
+    profile = load_config(config_path)
+    ha_contracts._fingerprint.cache_clear()
+    copies = []
+    monkeypatch.setattr(ha_contracts, "asdict", lambda value: copies.append(value) or dataclasses.asdict(value))
+
+    first = cached_discovery_messages(profile)
+    for _ in range(3):
+        assert cached_discovery_messages(profile) is first
+    assert len(copies) == 2  # home_assistant + topics, une seule fois
+
+    renamed = dataclasses.replace(
+        profile, home_assistant=dataclasses.replace(profile.home_assistant, device_name="Renamed")
+    )
+    assert cached_discovery_messages(renamed) is not first
+    assert ha_contracts._DISCOVERY_CACHE["foo"][1] is cached_discovery_messages(renamed)
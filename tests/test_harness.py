@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.connection import MqttConnection
+from lightspeed.harness import FakeBroker, parse_mix, run_load
+from lightspeed.mqtt import MqttLightingService
+
+
+def _wait(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_fake_broker_delivers_retained_before_later_publications_and_loops_back():
+    broker = FakeBroker()
+    publisher, subscriber = broker.client(client_id="pub"), broker.client(client_id="sub")
+    received: list[tuple[str, bytes, bool]] = []
+    done = threading.Event()
+
+    def on_message(_client, _userdata, message) -> None:
+        received.append((message.topic, message.payload, message.retain))
+        if message.payload == b"live":
+            done.set()
+
+    publisher.loop_start()
+    assert _wait(lambda: publisher.connected)
+    publisher.publish("a/state", "kept", retain=True)
+    publisher.publish("a/other", "kept too", retain=True)
+
+    subscriber.on_message = on_message
+    subscriber.on_connect = lambda client, *_: (client.subscribe("a/+", qos=1), client.publish("a/marker", "live"))
+    subscriber.loop_start()
+    assert done.wait(2.0)
+
+    assert received == [
+        ("a/state", b"kept", True),
+        ("a/other", b"kept too", True),
+        ("a/marker", b"live", False),
+    ]
+    publisher.publish("a/state", "", retain=True)
+    assert broker.retained("a/state") is None
+    for client in (publisher, subscriber):
+        client.disconnect()
+        client.loop_stop()
+
+
+def test_service_runs_on_fake_broker_and_restores_retained_state(profile):
+    broker = FakeBroker()
+    seed = broker.client(client_id="seed")
+    seed.loop_start()
+    assert _wait(lambda: seed.connected)
+    seed.publish(
+        profile.topics.state_topic,
+        json.dumps({"state": "on", "rgb": [1, 2, 3], "brightness": 255, "mode": "pilot"}),
+        retain=True,
+    )
+    controller = SimulatedLightingController()
+    connection = MqttConnection(profile, client_factory=broker.client)
+    service = MqttLightingService(controller, profile, validated_at=datetime.now(timezone.utc), connection=connection)
+    service.dispatcher.start()
+    connection.start()
+    try:
+        assert _wait(lambda: service.bootstrapped)
+        seed.publish(profile.topics.rgb_command_topic, "10,20,30")
+        assert _wait(lambda: controller.colors()[-1:] == [(10, 20, 30)])
+    finally:
+        seed.disconnect()
+        seed.loop_stop()
+        connection.close()
+
+    assert controller.colors() == [(1, 2, 3), (10, 20, 30)]
+    assert json.loads(broker.retained(profile.topics.state_topic))["rgb"] == [10, 20, 30]
+
+
+def test_load_run_reports_latency_and_accounts_for_every_color_command(profile):
+    report = run_load(profile, rate=400, duration=0.5, seed=7)
+
+    colored = report.sent["rgb"] + report.sent["binary"] + report.sent["json"]
+    assert report.drained
+    assert sum(report.sent.values()) == 200
+    assert report.written + report.unwritten == colored
+    assert report.written > 0 and report.latency_seconds["count"] == report.written
+    assert 0 <= report.latency_seconds["p50"] <= report.latency_seconds["p99"] <= report.latency_seconds["max"]
+    assert report.handled + report.coalesced == sum(report.sent.values())
+
+
+def test_load_mix_is_validated():
+    assert parse_mix("rgb=3, alert=1") == {"rgb": 3.0, "alert": 1.0}
+    with pytest.raises(ValueError):
+        parse_mix("rgb=1,strobe=1")
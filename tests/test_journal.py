@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.connection import MqttConnection
+from lightspeed.harness import FakeBroker
+from lightspeed.journal import FlightJournal, JournalError, read_journal
+from lightspeed.mqtt import MqttLightingService
+
+
+def test_ring_keeps_the_newest_records_in_order_and_survives_a_restart(tmp_path):
+    path = tmp_path / "journal.bin"
+    journal = FlightJournal(path, records=8, devices=["keyboard", "mouse"])
+    mouse = journal.device("mouse")
+    for value in range(10):
+        mouse.write((value, 0, 0))
+    journal.close()
+    mouse.write((99, 0, 0))  # après fermeture : ignoré
+
+    devices, entries = read_journal(path)
+    assert devices == ["keyboard", "mouse"]
+    assert [entry.sequence for entry in entries] == list(range(4, 12))
+    assert [entry.fields["rgb"] for entry in entries] == [f"#{value:02X}0000" for value in range(2, 10)]
+    assert {entry.device for entry in entries} == {"mouse"}
+
+    FlightJournal(path, records=8, devices=["keyboard"]).close()
+    _devices, entries = read_journal(path)
+    assert entries[-1].sequence == 12 and entries[-1].kind == "session"
+    assert abs(entries[-1].at.timestamp() - time.time()) < 5
+
+
+def test_reader_rejects_foreign_files(tmp_path):
+    path = tmp_path / "notes.bin"
+    path.write_bytes(b"x" * 1024)
+    with pytest.raises(JournalError):
+        read_journal(path)
+
+
+def test_service_journals_commands_transitions_and_device_writes(profile, tmp_path):
+    broker = FakeBroker()
+    controller = SimulatedLightingController()
+    connection = MqttConnection(profile, client_factory=broker.client)
+    service = MqttLightingService(controller, profile, validated_at=datetime.now(timezone.utc), connection=connection)
+    journal = FlightJournal(tmp_path / "journal.bin", records=64, devices=["foo"])
+    service.journal = journal.device("foo")
+    controller.on_write = service.journal.write
+    service.dispatcher.start()
+    connection.start()
+    sender = broker.client(client_id="sender")
+    sender.loop_start()
+    try:
+        deadline = time.monotonic() + 2
+        while not (service.bootstrapped and sender.connected) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sender.publish(profile.topics.rgb_command_topic, "10,20,30")
+        while controller.colors()[-1:] != [(10, 20, 30)] and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sender.disconnect()
+        sender.loop_stop()
+        connection.close()
+        journal.close()
+
+    _devices, entries = read_journal(tmp_path / "journal.bin")
+    summary = [(entry.kind, entry.fields.get("topic") or entry.fields.get("rgb")) for entry in entries[1:]]
+    assert summary == [
+        ("write", "#336699"),
+        ("command", "rgb"),
+        ("transition", "#0A141E"),
+        ("write", "#0A141E"),
+    ]
+    assert entries[2].fields["payload"] == "10,20,30"
+    assert entries[3].fields["version"] == service.store.version
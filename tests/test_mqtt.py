@@ -0,0 +1,703 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import stat
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCodes
+
+from lightspeed import mqtt as mqtt_module
+from lightspeed.capture import CommandRecorder, read_capture
+from lightspeed.codec import BINARY_CONTENT_TYPE, LightCommand, encode_command, encode_rgb
+from lightspeed.connection import BackoffPolicy
+from lightspeed.dispatch import Lane
+from lightspeed.ha_contracts import cached_discovery_messages
+from lightspeed.ipc import IpcError, LocalCommandServer, send_command
+
+
+class _FakeClient:
+    def __init__(self, *args, **kwargs) -> None:
+        self.published: list[dict[str, object]] = []
+        self.subscribed: list[object] = []
+        self.unsubscribed: list[object] = []
+
+    def username_pw_set(self, *_args) -> None:
+        pass
+
+    def will_set(self, *_args, **_kwargs) -> None:
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120) -> None:
+        self.reconnect_delay = (min_delay, max_delay)
+
+    def subscribe(self, topic, qos=0):
+        self.subscribed.append(topic)
+
+    def unsubscribe(self, topic):
+        self.unsubscribed.append(topic)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append(
+            {"topic": topic, "payload": payload, "qos": qos, "retain": retain, "properties": properties}
+        )
+
+    def published_to(self, topic: str) -> list[dict[str, object]]:
+        return [call for call in self.published if call["topic"] == topic]
+
+
+class _FakeController:
+    def __init__(self) -> None:
+        self.writes: list[tuple[int, int, int]] = []
+        self.patterns: list[list] = []
+        self.start_offsets: list[float] = []
+
+    def start(self) -> None:
+        pass
+
+    def set_static_color(self, rgb) -> None:
+        self.writes.append(tuple(rgb))
+
+    def start_pattern(self, frames, on_first_frame=None, start_offset=0.0) -> None:
+        self.patterns.append(list(frames))
+        self.start_offsets.append(start_offset)
+        if on_first_frame is not None:
+            on_first_frame()
+
+    def stop_pattern(self) -> None:
+        pass
+
+
+def _message(topic: str, payload: bytes | str, properties=None):
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return SimpleNamespace(topic=topic, payload=payload, properties=properties)
+
+
+@pytest.fixture
+def profile(make_profile):
+    return make_profile(
+        home_assistant={"manufacturer": "TestCo", "model": "RevA"},
+        observability={"log_level": "INFO"},
+    )
+
+
+@pytest.fixture
+def service(monkeypatch, profile):
+    monkeypatch.setattr(mqtt_module.mqtt, "Client", _FakeClient)
+    return mqtt_module.MqttLightingService(
+        _FakeController(),
+        profile,
+        validated_at=datetime.now(timezone.utc),
+    )
+
+
+def _complete_sync(service, retained: dict[str, bytes] | None = None) -> str:
+    client = service.client
+    marker = client.published_to(service.profile.topics.sync_topic)[-1]["payload"]
+    for topic, payload in (retained or {}).items():
+        service.connection.on_message(client, None, _message(topic, payload))
+    service.connection.on_message(client, None, _message(service.profile.topics.sync_topic, marker))
+    return marker
+
+
+def test_discovery_published_when_broker_has_no_retained_copy(service):
+    service.connection.on_connect(service.client, None, {}, 0)
+    (discovery,) = cached_discovery_messages(service.profile)
+    assert service.client.published_to(discovery.topic) == []
+
+    _complete_sync(service)
+
+    calls = service.client.published_to(discovery.topic)
+    assert len(calls) == 1
+    assert calls[0]["retain"] is True
+    assert json.loads(calls[0]["payload"])["device"]["name"] == "Foo Device"
+
+
+def test_discovery_skipped_when_retained_copy_matches(service):
+    (discovery,) = cached_discovery_messages(service.profile)
+    service.connection.on_connect(service.client, None, {}, 0)
+
+    _complete_sync(service, {discovery.topic: discovery.payload.encode("utf-8")})
+
+    assert service.client.published_to(discovery.topic) == []
+    assert service.client.unsubscribed
+
+
+def test_discovery_republished_when_retained_copy_differs(service):
+    (discovery,) = cached_discovery_messages(service.profile)
+    service.connection.on_connect(service.client, None, {}, 0)
+
+    _complete_sync(service, {discovery.topic: b'{"stale":true}'})
+
+    assert len(service.client.published_to(discovery.topic)) == 1
+
+
+def test_foreign_sync_marker_is_ignored(service):
+    (discovery,) = cached_discovery_messages(service.profile)
+    service.connection.on_connect(service.client, None, {}, 0)
+
+    service.connection.on_message(service.client, None, _message(service.profile.topics.sync_topic, "other-instance"))
+
+    assert service.client.published_to(discovery.topic) == []
+
+
+def test_discovery_cache_reuses_serialized_payload(profile):
+    assert cached_discovery_messages(profile) is cached_discovery_messages(profile)
+
+
+def test_startup_restores_retained_state_on_main_connection(service):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    assert topics.state_topic in service._probe_topics
+    permanent, probe = service.client.subscribed
+    assert (topics.rgb_command_topic, 1) in permanent and ("homeassistant/status", 1) in permanent
+    # Abonnements exacts : pas de wildcard qui renverrait nos propres publications
+    assert not any("#" in topic or topic == topics.state_topic for topic, _qos in permanent)
+    assert (topics.state_topic, 1) in probe
+    assert service.client.published_to(topics.state_topic) == []
+
+    retained = {"state": "on", "rgb": [255, 0, 0], "brightness": 255, "mode": "pilot"}
+    _complete_sync(service, {topics.state_topic: json.dumps(retained).encode("utf-8")})
+
+    assert service.controller.writes == [(255, 0, 0)]
+    published = json.loads(service.client.published_to(topics.state_topic)[-1]["payload"])
+    assert published["rgb"] == [255, 0, 0]
+
+
+def test_startup_without_retained_state_uses_defaults(service):
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+
+    assert service.controller.writes == [(51, 102, 153)]
+
+
+def test_reconnect_does_not_probe_state_again(service):
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+
+    service.connection.on_connect(service.client, None, {}, 0)
+
+    assert service.profile.topics.state_topic not in service._probe_topics
+    permanent = [(topic, 1) for topic in service.connection.subscriptions()]
+    assert service.client.subscribed.count(permanent) == 2
+    assert (service.profile.topics.state_topic, 1) not in service.client.subscribed[-1]
+
+
+def test_backoff_policy_grows_and_stays_jittered_within_bounds():
+    policy = BackoffPolicy(min_delay=0.5, max_delay=4.0)
+
+    assert policy.delay(0, rng=lambda: 0.0) == 0.5
+    assert policy.delay(2, rng=lambda: 0.0) == 2.0
+    assert policy.delay(10, rng=lambda: 0.0) == 4.0
+    assert policy.delay(10, rng=lambda: 1.0) == 2.0
+
+
+def test_resumed_session_only_publishes_changed_state(service):
+    client = service.client
+    service.connection.on_connect(client, None, {"session present": 0}, 0)
+    _complete_sync(service)
+    subscriptions = list(client.subscribed)
+    published = len(client.published)
+
+    service.connection.on_disconnect(client, None, 1)
+    assert client.reconnect_delay[0] <= service.profile.mqtt.reconnect_min_delay
+    service.connection.on_connect(client, None, {"session present": 1}, 0)
+
+    assert client.subscribed == subscriptions
+    # Seule la disponibilité est republiée : l'état n'a pas changé pendant la coupure
+    assert [call["topic"] for call in client.published[published:]] == [service.profile.topics.lwt]
+    assert service.metrics.counter("mqtt_reconnects").value == 1
+
+
+def test_commands_queued_before_bootstrap_are_replayed_after_restore(service):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {"session present": 1}, 0)
+    service.connection.on_message(service.client, None, _message(topics.brightness_command_topic, "51"))
+    assert service.controller.writes == []
+
+    _complete_sync(service)
+
+    assert service.controller.writes == [(51, 102, 153), (10, 20, 30)]
+    assert service.control.last_brightness == 51
+
+
+def test_lost_sync_marker_bootstraps_after_deadline_and_caps_pending(monkeypatch, service):
+    monkeypatch.setattr(mqtt_module, "SYNC_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(mqtt_module, "MAX_PENDING_COMMANDS", 2)
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    for brightness in ("10", "20", "51"):
+        service.connection.on_message(service.client, None, _message(topics.brightness_command_topic, brightness))
+
+    deadline = time.monotonic() + 2
+    while not service.bootstrapped and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert service.bootstrapped
+    assert service.metrics.counter("sync_timeouts").value == 1
+    assert service.metrics.counter("pending_commands_dropped").value == 1
+    assert service.metrics.counter("commands_replayed").value == 2
+    assert service.control.last_brightness == 51
+    # Un marqueur retardataire ne relance pas le bootstrap
+    _complete_sync(service)
+    assert service.metrics.counter("sync_timeouts").value == 1
+
+
+def test_devices_share_one_connection_and_subscribe_to_their_command_topics(monkeypatch, make_profile):
+    monkeypatch.setattr(mqtt_module.mqtt, "Client", _FakeClient)
+    profile = make_profile(
+        topics={"base": "desk"},
+        home_assistant={"device_id": "desk", "device_name": "Desk"},
+        lighting={"default_color": "#000010"},
+        devices=[
+            {"name": "keyboard", "backend": "simulated"},
+            {"name": "mouse", "backend": "simulated", "lighting": {"default_color": "#100000"}},
+        ],
+    )
+    keyboard, mouse = mqtt_module.build_device_services(profile, validated_at=datetime.now(timezone.utc))
+    connection = keyboard.connection
+    client = connection.client
+    assert mouse.connection is connection
+
+    connection.on_connect(client, None, {}, 0)
+    subscribed = [topic for topic, _qos in client.subscribed[0]]
+    assert {"desk/keyboard/rgb/set", "desk/mouse/rgb/set", "homeassistant/status"} <= set(subscribed)
+    assert not any("#" in topic or topic.endswith("/state") for topic in subscribed)
+    for service in (keyboard, mouse):
+        _complete_sync(service)
+
+    connection.on_message(client, None, _message("desk/mouse/rgb/set", "#00FF00"))
+
+    assert keyboard.controller.colors() == [(0, 0, 16)]
+    assert mouse.controller.colors() == [(16, 0, 0), (0, 255, 0)]
+    assert keyboard.profile.topics.lwt == mouse.profile.topics.lwt == "desk/lwt"
+
+
+def test_mqtt_v5_drops_expired_commands_and_aliases_only_qos0_publishes(monkeypatch, make_profile):
+    monkeypatch.setattr(mqtt_module.mqtt, "Client", _FakeClient)
+    service = mqtt_module.MqttLightingService(
+        _FakeController(),
+        make_profile(mqtt={"protocol": "5"}),
+        validated_at=datetime.now(timezone.utc),
+    )
+    client = service.client
+    topics = service.profile.topics
+    connack = Properties(PacketTypes.CONNACK)
+    connack.TopicAliasMaximum = 4
+    service.connection.on_connect(client, None, {"session present": 1}, ReasonCodes(PacketTypes.CONNACK), connack)
+
+    expired = Properties(PacketTypes.PUBLISH)
+    expired.MessageExpiryInterval = 0
+    fresh = Properties(PacketTypes.PUBLISH)
+    fresh.MessageExpiryInterval = 60
+    service.connection.on_message(client, None, _message(topics.alert_command_topic, "PRESS", expired))
+    service.connection.on_message(client, None, _message(topics.brightness_command_topic, "51", fresh))
+    _complete_sync(service)
+
+    assert service.controller.writes == [(51, 102, 153), (10, 20, 30)]
+    assert service.metrics.counter("commands_expired").value == 1
+    # État QoS 1 retained : renvoyable après reconnexion, jamais aliasé
+    assert not any(getattr(call["properties"], "TopicAlias", None) for call in client.published)
+    service._publish_performance()
+    service._publish_performance()
+    first, second = [call for call in client.published if getattr(call["properties"], "TopicAlias", None) == 1]
+    assert first["topic"] == topics.performance_topic
+    assert second["topic"] == ""
+    marker = client.published_to(topics.sync_topic)[-1]
+    assert marker["properties"].MessageExpiryInterval > 0
+
+
+def test_refused_connection_records_reason_code(service):
+    service.connection.on_connect(service.client, None, {}, 5)
+
+    assert service._connected is False
+    assert service.metrics.snapshot()["counters"] == {"mqtt_connect_refused{reason=Connection Refused: not authorised.}": 1}
+
+
+def test_binary_commands_apply_in_one_write(service):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    published = len(service.client.published_to(topics.state_topic))
+
+    frame = encode_command(LightCommand(on=True, rgb=(200, 100, 0), brightness=51))
+    service.connection.on_message(service.client, None, _message(topics.binary_command_topic, frame))
+    content_type = Properties(PacketTypes.PUBLISH)
+    content_type.ContentType = BINARY_CONTENT_TYPE
+    service.connection.on_message(
+        service.client, None, _message(topics.rgb_command_topic, encode_rgb((0, 0, 255)), content_type)
+    )
+
+    assert service.controller.writes[1:] == [(40, 20, 0), (0, 0, 51)]
+    assert len(service.client.published_to(topics.state_topic)) == published + 2
+
+
+def test_malformed_binary_frames_are_rejected_without_internal_error(service, caplog):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    writes = list(service.controller.writes)
+    content_type = Properties(PacketTypes.PUBLISH)
+    content_type.ContentType = BINARY_CONTENT_TYPE
+
+    truncated = encode_command(LightCommand(rgb=(1, 2, 3)))[:3]
+    for frame in (b"", truncated):
+        service.connection.on_message(service.client, None, _message(topics.binary_command_topic, frame))
+    service.connection.on_message(
+        service.client, None, _message(topics.alert_command_topic, encode_rgb((0, 0, 255)), content_type)
+    )
+
+    assert service.controller.writes == writes
+    assert service.control.override is None
+    assert service.diagnostics()["last_errors"] == []
+    assert [record.getMessage() for record in caplog.records if record.levelname == "WARNING"] == [
+        "Commande binaire invalide",
+        "Commande binaire invalide",
+        "Commande binaire refusée sur un topic d'override",
+    ]
+    assert service.metrics.counter("commands_rejected", topic=topics.alert_command_topic).value == 1
+    assert topics.alert_command_topic not in service._override_buckets
+
+
+def test_local_channel_feeds_handlers_and_mirrors_state_to_mqtt(service, tmp_path):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    published = len(service.client.published_to(topics.state_topic))
+    address = str(tmp_path / "ipc.sock")
+    server = LocalCommandServer([service], address, metrics=service.metrics)
+    server.start()
+    try:
+        send_command(address, "rgb/set", "255,0,0")
+        send_command(address, topics.brightness_command_topic, "51")
+        with pytest.raises(IpcError):
+            send_command(address, "state", "{}")
+    finally:
+        server.close()
+
+    assert service.controller.writes[-2:] == [(255, 0, 0), (51, 0, 0)]
+    assert len(service.client.published_to(topics.state_topic)) == published + 2
+    assert service.metrics.counter("ipc_commands").value == 2
+    assert service.metrics.counter("ipc_rejected").value == 1
+
+
+def test_local_channel_refuses_a_live_socket_and_replaces_a_stale_one(service, tmp_path):
+    address = str(tmp_path / "ipc.sock")
+    server = LocalCommandServer([service], address, metrics=service.metrics)
+    server.start()
+    try:
+        assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+        with pytest.raises(RuntimeError):
+            LocalCommandServer([service], address).start()
+        send_command(address, "rgb/set", "1,2,3")
+    finally:
+        server.close()
+
+    # Socket orphelin (instance tuée) : plus personne n'écoute, il est remplacé
+    orphan = socket.socket(socket.AF_UNIX)
+    orphan.bind(address)
+    orphan.close()
+    restarted = LocalCommandServer([service], address)
+    restarted.start()
+    try:
+        send_command(address, "rgb/set", "4,5,6")
+    finally:
+        restarted.close()
+
+
+def test_received_commands_are_captured_before_bootstrap_and_replay_in_order(service, tmp_path):
+    topics = service.profile.topics
+    service.recorder = CommandRecorder(tmp_path / "capture.bin")
+    service.connection.on_connect(service.client, None, {}, 0)
+    service.connection.on_message(service.client, None, _message(topics.rgb_command_topic, "1,2,3"))
+    _complete_sync(service)
+    service.connection.on_message(service.client, None, _message(topics.state_topic, "{}"))
+    service.connection.on_message(service.client, None, _message(topics.alert_command_topic, ""))
+    service.recorder.close()
+
+    captured = list(read_capture(tmp_path / "capture.bin"))
+
+    assert [(command.topic, command.payload) for command in captured] == [
+        (topics.rgb_command_topic, b"1,2,3"),
+        (topics.alert_command_topic, b""),
+    ]
+    assert captured[0].timestamp_ns <= captured[1].timestamp_ns
+
+
+def test_diagnostics_request_is_answered_from_memory(service):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    service.connection.on_message(service.client, None, _message(topics.alert_command_topic, "{}"))
+    reply_to = f"{topics.diagnostics_response_topic}/abc"
+
+    service.connection.on_message(
+        service.client, None, _message(topics.diagnostics_topic, json.dumps({"id": "abc", "reply_to": reply_to}))
+    )
+    service.connection.on_message(
+        service.client, None, _message(topics.diagnostics_topic, json.dumps({"reply_to": topics.alert_command_topic}))
+    )
+
+    report = json.loads(service.client.published_to(reply_to)[0]["payload"])
+    assert report["id"] == "abc"
+    assert report["connected"] and report["bootstrapped"]
+    assert report["queues"] == {"override": 0, "light": 0, "pending_bootstrap": 0}
+    assert report["effect"]["kind"] == "alert"
+    assert any(thread["name"] == "MainThread" for thread in report["threads"])
+    assert report["uptime_seconds"] >= 0 and report["last_errors"] == []
+    assert service.client.published_to(topics.diagnostics_response_topic)
+    assert not service.client.published_to(topics.alert_command_topic)
+
+
+def test_json_schema_command_applies_state_color_and_brightness_at_once(monkeypatch, make_profile):
+    monkeypatch.setattr(mqtt_module.mqtt, "Client", _FakeClient)
+    service = mqtt_module.MqttLightingService(
+        _FakeController(),
+        make_profile(home_assistant={"light_schema": "json"}),
+        validated_at=datetime.now(timezone.utc),
+    )
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    service.controller.writes.clear()
+    published = len(service.client.published_to(topics.state_topic))
+
+    command = {"state": "ON", "color": {"r": 255, "g": 0, "b": 0}, "brightness": 128, "transition": 2}
+    service.connection.on_message(service.client, None, _message(topics.json_command_topic, json.dumps(command)))
+
+    assert service.controller.writes == [(128, 0, 0)]
+    states = service.client.published_to(topics.state_topic)[published:]
+    assert len(states) == 1
+    state = json.loads(states[0]["payload"])
+    assert state["state"] == "ON"
+    assert state["color"] == {"r": 255, "g": 0, "b": 0}
+    assert state["brightness"] == 128
+    assert state["effect"] is None
+
+
+def test_json_commands_are_routed_on_the_parsed_effect_field(service):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    lanes = []
+    service.dispatcher.submit = lambda message, lane, **_kwargs: lanes.append((lane, message.document))
+
+    for payload in (
+        {"color": {"r": 1, "g": 0, "b": 0}, "note": '"effect"'},
+        {"state": "ON", "effect": None},
+        {"effect": "alert"},
+    ):
+        service.connection.on_message(service.client, None, _message(topics.json_command_topic, json.dumps(payload)))
+    # Clé échappée : même document, reste sur la voie prioritaire
+    service.connection.on_message(service.client, None, _message(topics.json_command_topic, '{"\\u0065ffect": "info"}'))
+
+    assert [lane for lane, _document in lanes] == [Lane.LIGHT, Lane.LIGHT, Lane.OVERRIDE, Lane.OVERRIDE]
+    assert lanes[2][1] == {"effect": "alert"}
+
+
+def test_json_effect_with_color_runs_the_effect_in_auto_mode(service):
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    service.connection.on_message(service.client, None, _message(topics.mode_command_topic, "auto"))
+    color = service.control.last_command_color
+
+    command = {"effect": "alert", "color": {"r": 255, "g": 0, "b": 0}, "brightness": 10}
+    service.connection.on_message(service.client, None, _message(topics.json_command_topic, json.dumps(command)))
+
+    assert service.control.override is not None and service.control.override.kind == "alert"
+    assert service.control.pilot_switch is False
+    assert service.control.last_command_color == color
+    service.store.update(lambda control: control.clear_override())
+
+
+class _ImmediateTimer:
+    def __init__(self, delay, function, args=()):
+        self.delay = delay
+        self.function = function
+        self.args = args
+        self.daemon = False
+
+    def start(self) -> None:
+        self.function(*self.args)
+
+    def cancel(self) -> None:
+        pass
+
+    @classmethod
+    def deferred(cls, delay, function, args=()):
+        timer = cls(delay, function, args)
+        timer.start = lambda: None
+        return timer
+
+
+def test_home_assistant_birth_republishes_discovery_and_state_after_jitter(service):
+    connection = service.connection
+    connection._timer_factory = _ImmediateTimer
+    connection._rng = lambda: 0.5
+    client = service.client
+    connection.on_connect(client, None, {}, 0)
+    (discovery,) = cached_discovery_messages(service.profile)
+    _complete_sync(service, {discovery.topic: discovery.payload.encode("utf-8")})
+    published = len(client.published)
+
+    retained_birth = _message("homeassistant/status", "online")
+    retained_birth.retain = True
+    connection.on_message(client, None, retained_birth)
+    connection.on_message(client, None, _message("homeassistant/status", "offline"))
+    assert len(client.published) == published
+
+    connection.on_message(client, None, _message("homeassistant/status", "online"))
+
+    topics = [call["topic"] for call in client.published[published:]]
+    assert topics == [discovery.topic, service.profile.topics.state_topic]
+    assert service.metrics.counter("home_assistant_births").value == 1
+
+
+def test_alert_records_time_to_first_frame(service):
+    service._timer_factory = _ImmediateTimer.deferred
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+
+    service.connection.on_message(service.client, None, _message(topics.alert_command_topic, "PRESS"))
+
+    assert len(service.controller.patterns) == 1
+    timing = service.metrics.timing("alert_first_frame_seconds", kind="alert")
+    assert timing.count == 1
+    assert timing.last < service.profile.effects.alert_latency_slo_ms / 1000
+
+
+def test_repeated_alerts_extend_running_effect_and_excess_is_rejected(service):
+    timers: list[_ImmediateTimer] = []
+
+    def record_timer(delay, function, args=()):
+        timer = _ImmediateTimer.deferred(delay, function, args)
+        timers.append(timer)
+        return timer
+
+    service._timer_factory = record_timer
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+
+    for _ in range(5):
+        service.connection.on_message(service.client, None, _message(topics.alert_command_topic, "PRESS"))
+
+    assert len(service.controller.patterns) == 1
+    assert len(timers) == 1
+    assert service.metrics.counter("overrides_extended", kind="alert").value == 2
+    assert service.metrics.counter("overrides_rejected", topic=topics.alert_command_topic).value == 2
+
+    # Le timer d'origine expire avant la fin prolongée : un seul timer réarmé, l'effet continue
+    service.store.update(lambda control: control.extend_override(duration_seconds=30))
+    timers[0].function(*timers[0].args)
+    assert service.control.override is not None
+    assert len(timers) == 2
+
+
+def test_severe_effect_preempts_and_the_interrupted_one_resumes(service):
+    timers: list[_ImmediateTimer] = []
+
+    def record_timer(delay, function, args=()):
+        timer = _ImmediateTimer.deferred(delay, function, args)
+        timers.append(timer)
+        return timer
+
+    service._timer_factory = record_timer
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+
+    service.connection.on_message(service.client, None, _message(topics.info_command_topic, "PRESS"))
+    service.connection.on_message(service.client, None, _message(topics.alert_command_topic, "PRESS"))
+    assert service.control.override.kind == "alert"
+    assert [paused.kind for paused in service.control.suspended] == ["info"]
+    assert service.metrics.counter("overrides_preempted", kind="info").value == 1
+
+    # Moins grave que l'alerte en cours : attend son tour sans toucher au pattern
+    service.connection.on_message(service.client, None, _message(topics.warn_command_topic, "PRESS"))
+    assert len(service.controller.patterns) == 2
+    assert [paused.kind for paused in service.control.suspended] == ["warning", "info"]
+    assert service.metrics.counter("overrides_queued", kind="warning").value == 1
+
+    # Fin de l'alerte : le warning reprend pour son temps restant, l'info attend toujours
+    service.store.update(
+        lambda control: control.start_override(
+            kind="alert", duration_seconds=1, timestamp=datetime.now(timezone.utc) - timedelta(seconds=5)
+        )
+    )
+    timers[-1].function(*timers[-1].args)
+    assert service.control.override.kind == "warning"
+    assert [paused.kind for paused in service.control.suspended] == ["info"]
+    assert service.metrics.counter("overrides_resumed", kind="warning").value == 1
+    assert len(service.controller.patterns) == 4
+
+    # Lumière éteinte : effet courant et effets suspendus abandonnés
+    service.connection.on_message(service.client, None, _message(topics.command_topic, "OFF"))
+    assert service.control.override is None and service.control.suspended == ()
+
+
+def test_synchronized_effects_follow_the_shared_timeline(service):
+    timers: list[_ImmediateTimer] = []
+
+    def record_timer(delay, function, args=()):
+        timer = _ImmediateTimer.deferred(delay, function, args)
+        timers.append(timer)
+        return timer
+
+    service._timer_factory = record_timer
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    duration = service.profile.effects.override_duration_seconds
+
+    # Retardataire : l'alerte a commencé il y a 2,5 s ailleurs, le pattern reprend à cette position
+    now = time.time()
+    service.connection.on_message(
+        service.client, None, _message(topics.alert_command_topic, json.dumps({"start_at": now - 2.5}))
+    )
+    assert 2.5 <= service.controller.start_offsets[-1] < 3.0
+    assert duration - 3.0 < timers[-1].delay <= duration - 2.5
+    assert abs(service.control.override.started_at.timestamp() - (now - 2.5)) < 0.01
+
+    # Départ futur : attente avant la première frame, sans mesure de latence
+    # (l'alerte est d'abord arrêtée, sinon l'info moins grave attendrait sa fin)
+    service.store.update(lambda control: control.clear_override())
+    service.connection.on_message(
+        service.client, None, _message(topics.info_command_topic, json.dumps({"start_at": time.time() + 1}))
+    )
+    assert -1.0 <= service.controller.start_offsets[-1] < -0.5
+    assert service.metrics.counter("effects_synchronized", kind="info").value == 1
+
+    # Effet déjà terminé sur la ligne de temps : ignoré, l'effet courant continue
+    service.connection.on_message(
+        service.client, None, _message(topics.warn_command_topic, json.dumps({"start_at": now - duration - 1}))
+    )
+    assert service.control.override.kind == "info"
+    assert service.metrics.counter("effects_sync_expired", kind="warning").value == 1
+
+
+def test_auto_skew_maps_sender_clock_onto_local_clock(service):
+    service.profile = replace(service.profile, effects=replace(service.profile.effects, sync_skew_ms=None))
+    service._timer_factory = _ImmediateTimer.deferred
+    topics = service.profile.topics
+    service.connection.on_connect(service.client, None, {}, 0)
+    _complete_sync(service)
+    assert service.broker_rtt is not None
+
+    # Horloge de l'émetteur en retard de 5 s : « commencer maintenant » selon lui = maintenant ici
+    sender_now = time.time() - 5
+    payload = json.dumps({"start_at": sender_now, "sent_at": sender_now})
+    service.connection.on_message(service.client, None, _message(topics.alert_command_topic, payload))
+
+    assert abs(service.controller.start_offsets[-1]) < 0.5
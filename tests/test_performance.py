@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.config import ConfigError
+from lightspeed.connection import MqttConnection
+from lightspeed.ha_contracts import iter_discovery_messages
+from lightspeed.harness import FakeBroker
+from lightspeed.metrics import TIMING_WINDOW, MetricsRegistry
+from lightspeed.mqtt import MqttLightingService
+from lightspeed.performance import PerformanceSampler
+
+def _components(profile) -> dict:
+    (message,) = iter_discovery_messages(profile)
+    return json.loads(message.payload)["components"]
+
+
+def test_sampler_reports_figures_of_the_elapsed_interval_only():
+    metrics = MetricsRegistry()
+    controller = SimulatedLightingController()
+    sampler = PerformanceSampler(metrics, "foo", controller, lambda: 3)
+    latency = metrics.timing("command_latency_seconds", device="foo")
+    sdk = metrics.timing("sdk_write_seconds", device="foo")
+    for seconds in (0.001, 0.002, 0.004):
+        latency.observe(seconds)
+    sdk.observe(0.2)
+    controller.set_static_color((1, 2, 3))
+
+    first = sampler.sample()
+    latency.observe(0.010)
+    second = sampler.sample()
+    controller.release()
+    third = sampler.sample()
+
+    assert first["commands"] == 3
+    assert first["command_latency_p95_ms"] == 4.0
+    assert first["sdk_status"] == "slow"
+    assert first["queue_depth"] == 3
+    assert first["device_writes_per_second"] > 0
+    assert second["commands"] == 1
+    assert second["command_latency_p95_ms"] == 10.0
+    assert second["sdk_write_p95_ms"] is None
+    assert second["sdk_status"] == "ok"
+    assert second["device_writes_per_second"] == 0
+    assert third["commands"] == 0 and third["command_latency_p95_ms"] is None
+    assert third["sdk_status"] == "released"
+
+
+def test_rates_count_every_observation_beyond_the_recent_window():
+    metrics = MetricsRegistry()
+    sampler = PerformanceSampler(metrics, "foo", SimulatedLightingController(), lambda: 0)
+    frames = metrics.timing("pattern_frame_jitter_seconds", device="foo")
+    latency = metrics.timing("command_latency_seconds", device="foo")
+    for _ in range(1800):
+        frames.observe(0.001)
+    for _ in range(TIMING_WINDOW + 100):
+        latency.observe(0.002)
+    # Intervalle de 60 s : 1800 frames = 30 fps
+    sampler._sampled_at = time.monotonic() - 60.0
+
+    figures = sampler.sample()
+
+    assert figures["effect_fps"] == 30.0
+    assert figures["commands"] == TIMING_WINDOW + 100
+    assert figures["frame_jitter_p95_ms"] == 1.0
+    assert figures["command_latency_p95_ms"] == 2.0
+
+
+def test_discovery_declares_diagnostic_sensors_unless_disabled(profile, make_profile):
+    components = _components(profile)
+
+    sensor = components["command_latency_sensor"]
+    assert sensor["state_topic"] == "foo/bar/performance"
+    assert sensor["entity_category"] == "diagnostic"
+    assert sensor["expire_after"] == 180
+    assert components["sdk_sensor"]["options"] == ["ok", "slow", "released", "stopped"]
+    assert {"device_writes_sensor", "effect_fps_sensor", "queue_depth_sensor"} <= set(components)
+
+    disabled = _components(make_profile(home_assistant={"metrics_interval_seconds": 0}))
+    assert not any(component.get("entity_category") == "diagnostic" for component in disabled.values())
+
+    with pytest.raises(ConfigError):
+        make_profile(home_assistant={"metrics_interval_seconds": 1})
+
+
+def test_service_publishes_one_document_per_interval(profile):
+    broker = FakeBroker()
+    controller = SimulatedLightingController()
+    connection = MqttConnection(profile, client_factory=broker.client)
+    service = MqttLightingService(controller, profile, validated_at=datetime.now(timezone.utc), connection=connection)
+    received: list[dict] = []
+    service.dispatcher.start()
+    connection.start()
+    listener = broker.client(client_id="listener")
+    listener.on_message = lambda _client, _userdata, message: received.append(json.loads(message.payload))
+    listener.loop_start()
+    try:
+        deadline = time.monotonic() + 2
+        while not (service.bootstrapped and listener.connected) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        listener.subscribe(profile.topics.performance_topic)
+        listener.publish(profile.topics.rgb_command_topic, "10,20,30")
+        while controller.colors()[-1:] != [(10, 20, 30)] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        service._publish_performance()
+        while not received and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        listener.disconnect()
+        listener.loop_stop()
+        connection.close()
+
+    assert service._performance_task is not None and not service._performance_task.scheduled
+    (document,) = received
+    assert document["commands"] == 1
+    assert document["command_latency_p95_ms"] is not None
+    assert document["sdk_status"] == "ok"
+    assert document["queue_depth"] == 0
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import pytest
+
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.config import ConfigError
+from lightspeed.connection import MqttConnection
+from lightspeed.harness import FakeBroker
+from lightspeed.metrics import MetricsRegistry
+from lightspeed.mqtt import MqttLightingService
+from lightspeed.prometheus import MetricsServer, render
+
+def test_render_exposes_counters_gauges_and_cumulative_histograms():
+    registry = MetricsRegistry()
+    registry.counter("overrides_rejected", topic='foo/"bar"').inc(2)
+    registry.gauge("mqtt_broker_healthy", broker="broker.local:1883").set(1.0)
+    timing = registry.timing("command_handler_seconds", lane="light")
+    for seconds in (0.0002, 0.003, 0.003, 20.0):
+        timing.observe(seconds)
+
+    lines = render(registry).splitlines()
+
+    assert "# TYPE lightspeed_overrides_rejected_total counter" in lines
+    assert 'lightspeed_overrides_rejected_total{topic="foo/\\"bar\\""} 2' in lines
+    assert 'lightspeed_mqtt_broker_healthy{broker="broker.local:1883"} 1.0' in lines
+    assert "# TYPE lightspeed_command_handler_seconds histogram" in lines
+    assert 'lightspeed_command_handler_seconds_bucket{lane="light",le="0.00025"} 1' in lines
+    assert 'lightspeed_command_handler_seconds_bucket{lane="light",le="0.005"} 3' in lines
+    assert 'lightspeed_command_handler_seconds_bucket{lane="light",le="10.0"} 3' in lines
+    assert 'lightspeed_command_handler_seconds_bucket{lane="light",le="+Inf"} 4' in lines
+    assert 'lightspeed_command_handler_seconds_count{lane="light"} 4' in lines
+    assert any(line.startswith("lightspeed_threads ") for line in lines)
+
+
+def test_endpoint_serves_service_metrics_over_http(profile):
+    broker = FakeBroker()
+    controller = SimulatedLightingController()
+    connection = MqttConnection(profile, client_factory=broker.client)
+    service = MqttLightingService(controller, profile, validated_at=datetime.now(timezone.utc), connection=connection)
+    server = MetricsServer(connection.metrics, "127.0.0.1", 0)
+    service.dispatcher.start()
+    connection.start()
+    server.start()
+    sender = broker.client(client_id="sender")
+    sender.loop_start()
+    try:
+        deadline = time.monotonic() + 2
+        while not (service.bootstrapped and sender.connected) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sender.publish(profile.topics.rgb_command_topic, "10,20,30")
+        while controller.colors()[-1:] != [(10, 20, 30)] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=2) as response:
+            content_type = response.headers["Content-Type"]
+            body = response.read().decode("utf-8")
+    finally:
+        sender.disconnect()
+        sender.loop_stop()
+        connection.close()
+        server.close()
+
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert 'lightspeed_mqtt_messages_received_total{topic="foo/bar/rgb/set"} 1' in body
+    assert 'lightspeed_sdk_write_seconds_count{device="foo"} 2' in body
+    assert 'lightspeed_command_handler_seconds_count{lane="light"} 1' in body
+    assert "lightspeed_mqtt_connects_total 1" in body
+
+
+def test_metrics_port_is_off_by_default_and_validated(profile, make_profile):
+    assert profile.observability.metrics_port is None
+    with pytest.raises(ConfigError):
+        make_profile("bad.yaml", observability={"metrics_port": 70000})
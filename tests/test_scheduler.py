@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from lightspeed.scheduler import Scheduler
+
+
+def _wait_for(predicate, timeout=2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+def test_calls_run_in_deadline_order_on_a_single_thread():
+    scheduler = Scheduler(name="test-scheduler")
+    ran: list[tuple[str, str]] = []
+    try:
+        for label, delay in (("c", 0.06), ("a", 0.02), ("b", 0.04)):
+            scheduler.call_later(delay, lambda label=label: ran.append((label, threading.current_thread().name)))
+        assert _wait_for(lambda: len(ran) == 3)
+    finally:
+        scheduler.close()
+
+    assert [label for label, _thread in ran] == ["a", "b", "c"]
+    assert {thread for _label, thread in ran} == {"test-scheduler"}
+    assert scheduler.pending == 0
+
+
+def test_cancel_and_reschedule_move_deadlines_without_new_threads():
+    scheduler = Scheduler(name="test-scheduler")
+    ran: list[str] = []
+    threads_before = threading.active_count()
+    try:
+        dropped = scheduler.call_later(0.02, ran.append, "dropped")
+        moved = scheduler.call_later(0.01, ran.append, "moved")
+        timers = [scheduler.timer(0.03, ran.append, args=(f"timer{index}",)) for index in range(200)]
+        for timer in timers:
+            timer.start()
+        for timer in timers[1:]:
+            timer.cancel()
+        moved.reschedule(0.08)
+        dropped.cancel()
+        assert scheduler.pending == 2
+        assert threading.active_count() <= threads_before + 1
+        assert _wait_for(lambda: ran == ["timer0", "moved"])
+        time.sleep(0.03)
+    finally:
+        scheduler.close()
+
+    assert ran == ["timer0", "moved"]
+    assert not moved.scheduled and not dropped.scheduled
+
+
+def test_periodic_task_keeps_its_period_and_survives_a_failing_run():
+    scheduler = Scheduler(name="test-scheduler")
+    runs: list[int] = []
+
+    def tick() -> None:
+        runs.append(time.monotonic_ns())
+        if len(runs) == 2:
+            raise RuntimeError("boom")
+
+    try:
+        periodic = scheduler.call_every(0.02, tick)
+        assert _wait_for(lambda: len(runs) >= 5)
+        periodic.cancel()
+        count = len(runs)
+        time.sleep(0.05)
+    finally:
+        scheduler.close()
+
+    assert len(runs) == count
+    # Échéances alignées sur la première : pas de dérive cumulée
+    assert (runs[4] - runs[0]) / 1e9 < 0.08 + 0.05
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from lightspeed import snapshot as snapshot_module
+from lightspeed.backends import SimulatedLightingController
+from lightspeed.connection import MqttConnection
+from lightspeed.control_mode import ControlMode
+from lightspeed.harness import FakeBroker
+from lightspeed.mqtt import MqttLightingService
+from lightspeed.snapshot import SnapshotWriter, read_snapshot
+
+
+class _ManualTimer:
+    def __init__(self, delay, function, args=()):
+        self.delay = delay
+        self.function = function
+        self.daemon = False
+        self.started = False
+
+    def start(self) -> None:
+        self.started = True
+
+    def cancel(self) -> None:
+        pass
+
+
+@pytest.fixture
+def profile(make_profile, tmp_path):
+    return make_profile(lighting={"state_snapshot": str(tmp_path / "state.json")})
+
+
+def test_writer_debounces_changes_into_one_atomic_write(monkeypatch, tmp_path):
+    timers: list[_ManualTimer] = []
+
+    def factory(delay, function, args=()):
+        timers.append(_ManualTimer(delay, function, args))
+        return timers[-1]
+
+    path = tmp_path / "state.json"
+    writer = SnapshotWriter(path, debounce_seconds=0.5, timer_factory=factory)
+    control = ControlMode.bootstrap(default_color=(1, 2, 3))
+    for brightness in (10, 20, 30):
+        control = control.record_color_command(base_color=(4, 5, 6), brightness=brightness)
+        writer.schedule(control)
+
+    assert len(timers) == 1 and timers[0].started and not path.exists()
+    writers: list[str] = []
+    write = snapshot_module.write_snapshot
+
+    def recording_write(*args):
+        writers.append(threading.current_thread().name)
+        write(*args)
+
+    monkeypatch.setattr(snapshot_module, "write_snapshot", recording_write)
+    timers[0].function().result(timeout=2)
+    # Écriture et fsync hors du thread qui exécute le timer (le scheduler en service)
+    assert writers and threading.current_thread().name not in writers
+    saved = read_snapshot(path)
+    assert {key: saved[key] for key in ("state", "rgb", "brightness", "mode")} == {
+        "state": "on",
+        "rgb": [4, 5, 6],
+        "brightness": 30,
+        "mode": "pilot",
+    }
+    assert [entry.name for entry in tmp_path.iterdir()] == ["state.json"]
+
+    # Seul l'effet change : rien à réécrire
+    writer.schedule(control.start_override(kind="alert", duration_seconds=5))
+    timers[-1].function().result(timeout=2)
+    assert writer.writes == 1
+
+
+def test_devices_get_their_own_snapshot_file(tmp_path, make_profile):
+    multi = make_profile(
+        "multi.yaml",
+        lighting={"state_snapshot": str(tmp_path / "state.json")},
+        devices=[{"name": "keyboard"}, {"name": "mouse", "backend": "simulated"}],
+    )
+    keyboard, mouse = multi.devices
+    assert keyboard.lighting.state_snapshot == str(tmp_path / "state-keyboard.json")
+    assert mouse.lighting.state_snapshot == str(tmp_path / "state-mouse.json")
+
+
+def test_warm_start_paints_the_snapshot_before_connecting_then_follows_retained_state(profile, tmp_path):
+    (tmp_path / "state.json").write_text(
+        json.dumps({"state": "on", "rgb": [200, 0, 0], "brightness": 255, "mode": "pilot"}),
+        encoding="utf-8",
+    )
+    broker = FakeBroker()
+    seed = broker.client(client_id="seed")
+    seed.loop_start()
+    seed.publish(
+        profile.topics.state_topic,
+        json.dumps({"state": "on", "rgb": [0, 0, 200], "brightness": 255, "mode": "pilot"}),
+        retain=True,
+    )
+    controller = SimulatedLightingController()
+    connection = MqttConnection(profile, client_factory=broker.client)
+    service = MqttLightingService(controller, profile, validated_at=datetime.now(timezone.utc), connection=connection)
+
+    assert service.warm_start()
+    assert controller.colors() == [(200, 0, 0)] and not connection.connected
+
+    service.dispatcher.start()
+    connection.start()
+    try:
+        deadline = time.monotonic() + 2
+        while not service.bootstrapped and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.bootstrapped
+    finally:
+        seed.disconnect()
+        seed.loop_stop()
+        connection.close()
+
+    assert controller.colors() == [(200, 0, 0), (0, 0, 200)]
+    assert read_snapshot(tmp_path / "state.json")["rgb"] == [0, 0, 200]
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import threading
+
+from lightspeed.control_mode import ControlMode
+from lightspeed.state_store import StateStore
+
+
+def _store() -> StateStore:
+    return StateStore(ControlMode.bootstrap(default_color=(10, 20, 30)))
+
+
+def test_compare_and_set_rejects_a_stale_version_and_keeps_it_for_no_ops():
+    store = _store()
+    version, state = store.read()
+
+    change = store.compare_and_set(version, state.set_light_state(on=False))
+    assert change is not None and change.changed and change.version == version + 1
+    assert store.compare_and_set(version, state.set_light_state(on=False)) is None
+
+    unchanged = store.compare_and_set(store.version, store.state)
+    assert unchanged is not None and not unchanged.changed
+    assert store.version == version + 1
+
+
+def test_concurrent_updates_are_never_lost():
+    store = _store()
+
+    def bump() -> None:
+        for _ in range(200):
+            store.update(lambda control: control.record_color_command(
+                base_color=control.last_command_color,
+                brightness=(control.last_brightness + 1) % 256,
+            ))
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.version == 800
+    assert store.state.last_brightness == (255 + 800) % 256
+
+
+def test_effect_events_follow_identity_and_batches_settle_once():
+    store = _store()
+    events: list[tuple] = []
+    store.on_change(lambda change: events.append(("change", change.version)))
+    store.on_effect_start(lambda change: events.append(("start", change.effect_started.kind)))
+    store.on_effect_end(lambda change: events.append(("end", change.effect_ended.kind)))
+    store.on_settled(lambda change: events.append(("settled", change.version)))
+
+    with store.batch():
+        store.update(lambda control: control.start_override(kind="info", duration_seconds=5))
+        store.update(lambda control: control.extend_override(duration_seconds=60))
+        store.update(lambda control: control.start_override(kind="alert", duration_seconds=5))
+        assert events == []
+
+    assert events == [
+        ("change", 1), ("start", "info"),
+        ("change", 2),
+        ("change", 3), ("end", "info"), ("start", "alert"),
+        ("settled", 3),
+    ]
+
+
+def test_commits_from_observers_are_delivered_after_the_current_one():
+    store = _store()
+    seen: list[int] = []
+
+    def observer(change) -> None:
+        seen.append(change.version)
+        if change.current.light_on:
+            store.update(lambda control: control.set_light_state(on=False))
+
+    store.on_change(observer)
+    store.update(lambda control: control.set_light_state(on=True).record_color_command(base_color=(1, 2, 3), brightness=9))
+
+    assert seen == [1, 2]
+    assert store.state.light_on is False
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+import time
+
+import pytest
+
+from lightspeed.config import BrokerEndpoint, ConfigError, TlsSettings
+from lightspeed.connection import MqttConnection
+from lightspeed.failover import probe_broker
+from lightspeed.metrics import MetricsRegistry
+from lightspeed.tls import build_ssl_context
+
+
+@pytest.fixture(scope="module")
+def certificate(tmp_path_factory):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl introuvable")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = directory / "broker.pem", directory / "broker.key"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", str(key), "-out", str(cert),
+            "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+class _TlsBroker:
+    """TLS stand-in: answers each CONNECT with a CONNACK and drops clients idle for 200 ms."""
+
+    def __init__(self, certificate) -> None:
+        cert, key = certificate
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                raw, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(raw,), daemon=True).start()
+
+    def _handle(self, raw: socket.socket) -> None:
+        try:
+            with self.context.wrap_socket(raw, server_side=True) as conn:
+                conn.recv(1024)
+                conn.sendall(bytes([0x20, 0x02, 0x00, 0x00]))
+                conn.settimeout(0.2)
+                while conn.recv(1024):
+                    pass
+        except OSError:
+            return
+
+    def close(self) -> None:
+        self.server.close()
+
+
+def _tls_settings(certificate, verify: str = "required") -> TlsSettings:
+    return TlsSettings(enabled=True, ca_file=str(certificate[0]), cert_file=None, key_file=None, verify=verify)
+
+
+def test_probe_resumes_tls_session_and_times_handshakes(make_profile, certificate):
+    broker = _TlsBroker(certificate)
+    profile = _profile(make_profile, broker.port, certificate)
+    metrics = MetricsRegistry()
+    context = build_ssl_context(profile.mqtt.tls, metrics=metrics)
+    endpoint = BrokerEndpoint("localhost", broker.port)
+    try:
+        first = probe_broker(endpoint, profile.mqtt, timeout=2, ssl_context=context)
+        second = probe_broker(endpoint, profile.mqtt, timeout=2, ssl_context=context)
+    finally:
+        broker.close()
+
+    assert first.healthy and second.healthy
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["mqtt_tls_handshakes{resumed=false}"] == 1
+    assert snapshot["counters"]["mqtt_tls_handshakes{resumed=true}"] == 1
+    assert snapshot["timings"]["mqtt_tls_handshake_seconds{resumed=true}"]["count"] == 1
+
+
+def test_probe_rejects_untrusted_certificate_unless_verification_disabled(make_profile, certificate):
+    broker = _TlsBroker(certificate)
+    profile = _profile(make_profile, broker.port, certificate)
+    untrusted = TlsSettings(enabled=True, ca_file=None, cert_file=None, key_file=None, verify="required")
+    endpoint = BrokerEndpoint("localhost", broker.port)
+    try:
+        rejected = probe_broker(endpoint, profile.mqtt, timeout=2, ssl_context=build_ssl_context(untrusted))
+        accepted = probe_broker(
+            endpoint,
+            profile.mqtt,
+            timeout=2,
+            ssl_context=build_ssl_context(_tls_settings(certificate, verify="none")),
+        )
+    finally:
+        broker.close()
+
+    assert not rejected.healthy and "CERTIFICATE_VERIFY_FAILED" in rejected.error
+    assert accepted.healthy
+
+
+def test_connection_reconnects_with_resumed_tls_session(make_profile, certificate):
+    broker = _TlsBroker(certificate)
+    profile = _profile(make_profile, broker.port, certificate)
+    connection = MqttConnection(profile)
+    connection.start()
+    try:
+        deadline = time.monotonic() + 5
+        resumed = connection.metrics.counter("mqtt_tls_handshakes", resumed="true")
+        while resumed.value < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        connection.close()
+        broker.close()
+
+    assert connection.metrics.counter("mqtt_tls_handshakes", resumed="false").value == 1
+    assert resumed.value >= 1
+    assert connection.metrics.counter("mqtt_reconnects").value >= 1
+
+
+def test_tls_verify_mode_is_validated(make_profile, certificate):
+    with pytest.raises(ConfigError):
+        _profile(make_profile, 8883, certificate, verify="sometimes")
+
+
+def _profile(make_profile, port: int, certificate, *, verify: str = "required"):
+    return make_profile(
+        mqtt={
+            "host": "localhost",
+            "port": port,
+            "reconnect_min_delay": 0.05,
+            "reconnect_max_delay": 0.1,
+            "tls": {"enabled": True, "ca_file": str(certificate[0]), "verify": verify},
+        }
+    )